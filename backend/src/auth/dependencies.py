@@ -1,7 +1,7 @@
 from fastapi import Depends, HTTPException, Cookie
 from jose import jwt, JWTError
 from sqlalchemy.orm import Session
-from src.database import get_db
+from src.database import SessionLocal, get_db
 from src.config import settings
 from src.schemas.user_schemas import User
 
@@ -42,3 +42,28 @@ def get_current_user_optional(access_token: Optional[str] = Cookie(None), db: Se
 
     user = db.query(User).filter_by(id=user_id).first()
     return user
+
+
+def get_current_user_id_optional(
+    access_token: Optional[str] = Cookie(None),
+) -> Optional[int]:
+    """
+    Id of the signed-in user, or None. Checks the user in a session of its own
+    that is closed before the route runs, so streaming routes do not hold a DB
+    connection for the whole stream.
+    """
+    if not access_token:
+        return None
+    try:
+        payload = jwt.decode(
+            access_token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
+        )
+        user_id = payload.get("user_id")
+        if not user_id:
+            return None
+    except JWTError:
+        return None
+
+    with SessionLocal() as db:
+        found = db.query(User.id).filter_by(id=user_id).first()
+    return user_id if found else None
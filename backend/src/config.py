@@ -1,7 +1,7 @@
 from enum import Enum
 from pathlib import Path
 import textwrap
-from typing import ClassVar
+from typing import ClassVar, Literal
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import EmailStr
@@ -13,6 +13,89 @@ class _Settings(BaseSettings):
     OPENAI_API_KEY: str | None = None
     OPENROUTER_API_URL: str = "https://openrouter.ai/api/v1/chat/completions"
 
+    # HTTP-клиент LLM (пул соединений)
+    LLM_HTTP2: bool = True
+    LLM_MAX_CONNECTIONS: int = 32
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 16
+    LLM_KEEPALIVE_EXPIRY: float = 30.0
+    LLM_CONNECT_TIMEOUT: float = 10.0
+    # Таймаут ответа провайдера (сек) по умолчанию для acall_model/astream_model
+    LLM_READ_TIMEOUT: float = 60.0
+    LLM_STRUCTURED_OUTPUT: bool = True
+    # JSONL-файл, куда пишутся пары запрос/ответ (для src.llm_stub)
+    LLM_RECORD_PATH: Path | None = None
+
+    # Кэш ответов LLM
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_MAX_ENTRIES: int = 2048
+    LLM_CACHE_TTL_SECONDS: int = 24 * 3600
+    LLM_CACHE_DISK_PATH: Path | None = None
+    # По умолчанию только детерминированные стадии; правки и перегенерация
+    # должны давать новый ответ, кэш для них — явно, через cache=True
+    LLM_CACHE_STAGES: list[str] = ["classifier", "planner"]
+    # Токен для служебных операций (X-Admin-Token); без него они запрещены
+    LLM_ADMIN_TOKEN: str | None = None
+
+    # Планировщик запросов к LLM (на модель; 0 — без ограничения)
+    LLM_MAX_CONCURRENCY: int = 8
+    LLM_REQUESTS_PER_MINUTE: int = 120
+    LLM_TOKENS_PER_MINUTE: int = 400_000
+    LLM_MODEL_LIMITS: dict[str, dict[str, int]] = {}
+    LLM_MAX_RETRIES: int = 2
+    LLM_BACKOFF_BASE: float = 1.0
+    LLM_BACKOFF_MAX: float = 30.0
+
+    # Circuit breaker на модель и общий бюджет повторов (доля от запросов за окно)
+    LLM_BREAKER_FAILURE_THRESHOLD: int = 5
+    LLM_BREAKER_OPEN_SECONDS: float = 30.0
+    LLM_RETRY_BUDGET_RATIO: float = 0.2
+    LLM_RETRY_BUDGET_MIN: int = 10
+    LLM_RETRY_BUDGET_WINDOW: float = 60.0
+
+    # Маршрутизация между моделями
+    LLM_ROUTING_ENABLED: bool = True
+    LLM_ROUTER_EWMA_ALPHA: float = 0.3
+    LLM_ROUTER_MAX_ERROR_RATE: float = 0.5
+    LLM_ROUTER_COOLDOWN_SECONDS: float = 30.0
+
+    # Хеджирование: дубль запроса, если ответа нет дольше перцентиля задержек
+    LLM_HEDGING_ENABLED: bool = False
+    LLM_HEDGE_STAGES: list[str] = ["slide"]
+    LLM_HEDGE_PERCENTILE: float = 0.95
+    LLM_HEDGE_MIN_DELAY: float = 2.0
+    LLM_HEDGE_MIN_SAMPLES: int = 20
+    LLM_HEDGE_BUDGET: float = 0.1
+    LLM_HEDGE_CROSS_MODEL: bool = True
+
+    # Учёт использования LLM: цены в USD за 1M токенов,
+    # {"model": {"prompt": 0.5, "completion": 1.5}}; без цены стоимость не считается
+    LLM_MODEL_PRICING: dict[str, dict[str, float]] = {}
+    LLM_USAGE_MAX_REQUESTS: int = 1000
+
+    # Мемоизация стадий пайплайна по хешу входов: записей на один пайплайн
+    PIPELINE_STAGE_CACHE_MAX_ENTRIES: int = 256
+
+    # Прогретые пайплайны (индекс документа) по хешу документа: правки и
+    # повторные генерации не строят коллекцию и не считают эмбеддинги заново
+    PIPELINE_REGISTRY_MAX_ENTRIES: int = 16
+    PIPELINE_REGISTRY_TTL_SECONDS: int = 1800
+    PIPELINE_REGISTRY_MAX_MEMORY_MB: int = 1024
+
+    # Чекпоинты генераций (план и готовые слайды) для возобновления оборванного стрима
+    GENERATION_CHECKPOINT_MAX_ENTRIES: int = 500
+    GENERATION_CHECKPOINT_TTL_SECONDS: int = 24 * 3600
+    GENERATION_CHECKPOINT_PATH: Path | None = None
+
+    # Очередь задач генерации: local — воркеры внутри процесса API (dev, тесты),
+    # postgres — общая таблица, воркеры отдельными процессами: python -m src.worker
+    JOB_BACKEND: Literal["local", "postgres"] = "local"
+    JOB_WORKER_CONCURRENCY: int = 2
+    JOB_POLL_INTERVAL: float = 0.5
+    # Аренда задачи воркером: продлевается каждую треть срока; истёкшая (воркер
+    # умер) возвращает задачу в очередь, но не больше JOB_MAX_ATTEMPTS запусков
+    JOB_LEASE_SECONDS: float = 60.0
+    JOB_MAX_ATTEMPTS: int = 3
+
     # Основные модели
     DEFAULT_MODEL: str = "moonshotai/kimi-k2-0905"
     DEFAULT_EMBEDDING_MODEL: str = "openai/gpt-oss-120b"
@@ -32,6 +115,15 @@ class _Settings(BaseSettings):
     TEMPFILE_DIR: Path = Path("./tmp")
     TEMPFILE_CLEANUP_INTERVAL_SECONDS: int = 3600
 
+    # Разбор загруженных файлов: процессов в пуле и файлов на одну генерацию
+    DOCUMENT_PARSE_WORKERS: int = 4
+    MAX_UPLOAD_FILES: int = 10
+    # Дольше разбор одного файла не ждём: зависший процесс пула останавливается
+    DOCUMENT_PARSE_TIMEOUT_SECONDS: float = 120.0
+
+    # Слайдов в одном запросе пакетной правки (/presentation/edit/batch)
+    MAX_BATCH_EDIT_SLIDES: int = 50
+
     # Домены и фронт
     DOMAIN: str = "http://localhost:3000"
     FRONT_URL: str = "http://localhost:3000"
@@ -76,8 +168,31 @@ class _ModelSettings(BaseSettings):
 
     TOP_K_RETRIEVAL: int = 5
 
+    # Бюджеты промптов в токенах: сколько контекста документа отдаём каждой стадии
+    TOKENIZER_ENCODING: str = "o200k_base"
+    PROMPT_CONTEXT_TOKENS: dict[str, int] = {
+        "planner": 1200,
+        "slide": 1000,
+        "chart": 1200,
+    }
+    CHUNK_MAX_TOKENS: int = 200
+
+    # Сколько слайдов (или пакетов) генерируется одновременно; выдача — по порядку
+    SLIDE_CONCURRENCY: int = 4
+
+    # Пакетная генерация: до SLIDE_BATCH_SIZE слайдов в одном запросе (1 — выключено),
+    # пока контекст пакета укладывается в SLIDE_BATCH_CONTEXT_TOKENS
+    SLIDE_BATCH_SIZE: int = 1
+    SLIDE_BATCH_CONTEXT_TOKENS: int = 6000
+    SLIDE_BATCH_MAX_TOKENS_PER_SLIDE: int = 700
+
     GEN_TEMPERATURE: float = 0.2
 
+    # Допустимые модели по стадиям (classifier | planner | slide | chart | edit).
+    # Для стадии из списка выбирается самая быстрая здоровая модель;
+    # без политики используется запрошенная модель с запасными из DEFAULT_MODEL_VALUES.
+    STAGE_MODEL_POLICIES: dict[str, list[str]] = {}
+
     JSON_ONLY_PROMPT: str = (
         "Previous reply was not valid JSON. Please REPLY with valid JSON only (no explanations, no code fences)."
     )
@@ -220,11 +335,55 @@ class _ModelSettings(BaseSettings):
             """
     )
 
+    BATCH_SLIDE_PROMPT_TEMPLATE: str = textwrap.dedent(
+        """
+            Ты — ассистент, который создаёт контент для НЕСКОЛЬКИХ слайдов,
+            используя ТОЛЬКО данные ниже.
+
+            ТЕМА: {topic}
+
+            {slides_text}
+
+            ТРЕБОВАНИЯ:
+            1) Для каждого слайда используй ТОЛЬКО факты из его CHUNKS;
+               не выдумывай числа и источники.
+            2) Верни РОВНО один валидный JSON-объект {{"slides": [...]}}
+               без пояснений, без кода и без ```
+               — по одному элементу на каждый слайд выше, в том же порядке.
+            3) Если для слайда нет релевантных данных — "used_facts": []
+               и "content": "Данные для этого раздела отсутствуют"
+            4) Структура элемента:
+            - "slide_id": число (как у слайда выше)
+            - "title": строка
+            - "used_facts": массив коротких дословных цитат из CHUNKS этого слайда
+              (каждая ≤ 80 символов)
+            - "content": строка без markdown-заголовков:
+                1–2 предложения, пустая строка, затем 3–4 буллета
+                (каждый начинается с "* ", ≤ 70 символов)
+            """
+    )
+    BATCH_SLIDE_ITEM_TEMPLATE: str = textwrap.dedent(
+        """
+            СЛАЙД №{slide_id}: "{slide_title}"
+            ЗАДАЧА: {slide_task}
+            ИСТОЧНИКОВЫЕ CHUNKS:
+            {chunks_text}
+            """
+    )
+
 
 class ModelAction(str, Enum):
     REPLACE_CHART = "replace_chart"
     CUSTOM = "custom"
 
 
+class ModelStage(str, Enum):
+    CLASSIFIER = "classifier"
+    PLANNER = "planner"
+    SLIDE = "slide"
+    CHART = "chart"
+    EDIT = "edit"
+
+
 settings = _Settings()
 model_settings = _ModelSettings()
@@ -0,0 +1,250 @@
+"""
+OpenAI-compatible stand-in for the LLM provider, for offline load tests and
+profiling.
+
+Replays request/response pairs recorded with LLM_RECORD_PATH and synthesizes
+schema-valid answers from `response_format` for everything else.
+
+    LLM_STUB_RECORDINGS=./tmp/llm.jsonl uvicorn src.llm_stub:app --port 8001
+    OPENROUTER_API_URL=http://localhost:8001/v1/chat/completions uvicorn ...
+
+Deliberately does not import src.config, so it runs without the backend env.
+"""
+import asyncio
+from collections import defaultdict
+import hashlib
+import json
+import logging
+from pathlib import Path
+import random
+import time
+from typing import Any, AsyncIterator, Literal
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class _StubSettings(BaseSettings):
+    RECORDINGS: Path | None = None
+    # Задержка ответа (для стрима — до первого чанка), секунды
+    LATENCY_DISTRIBUTION: Literal["fixed", "uniform", "lognormal"] = "lognormal"
+    LATENCY_MEAN: float = 1.0
+    LATENCY_SPREAD: float = 0.5
+    REPLAY_LATENCY: bool = False
+    # Доли ответов 500 и 429 (с Retry-After)
+    ERROR_RATE: float = 0.0
+    RATE_LIMIT_RATE: float = 0.0
+    RETRY_AFTER: float = 1.0
+    # Скорость стрима
+    CHUNK_CHARS: int = 16
+    CHARS_PER_SECOND: float = 400.0
+    SEED: int | None = None
+
+    model_config = SettingsConfigDict(
+        env_prefix="LLM_STUB_", env_file=".env", extra="ignore"
+    )
+
+
+stub_settings = _StubSettings()
+
+_rng = random.Random(stub_settings.SEED)
+
+# Значения для полей, которые валидируются сильнее, чем описывает JSON Schema
+_FIELD_VALUES: dict[str, Any] = {
+    "label": "Experts",
+    "confidence": 0.9,
+    "content": "Краткий тезис слайда.\n\n* Первый пункт\n* Второй пункт",
+    "requires_external_data": False,
+}
+
+
+def _request_key(messages: list[dict]) -> str:
+    raw = json.dumps(messages, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Recordings:
+    """Recorded responses by prompt; repeated prompts cycle through their answers."""
+
+    def __init__(self, path: Path | None) -> None:
+        self._entries: dict[str, list[dict]] = defaultdict(list)
+        self._cursor: dict[str, int] = defaultdict(int)
+        if path is None or not path.exists():
+            return
+        with path.open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    item = json.loads(line)
+                    key = _request_key(item["request"]["messages"])
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    continue
+                self._entries[key].append(item)
+        logging.info(f"LLM stub: loaded {len(self)} recordings from {path}")
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._entries.values())
+
+    def find(self, messages: list[dict]) -> dict | None:
+        key = _request_key(messages)
+        entries = self._entries.get(key)
+        if not entries:
+            return None
+        item = entries[self._cursor[key] % len(entries)]
+        self._cursor[key] += 1
+        return item
+
+
+recordings = _Recordings(stub_settings.RECORDINGS)
+
+
+def _latency() -> float:
+    mean, spread = stub_settings.LATENCY_MEAN, stub_settings.LATENCY_SPREAD
+    if stub_settings.LATENCY_DISTRIBUTION == "fixed":
+        return mean
+    if stub_settings.LATENCY_DISTRIBUTION == "uniform":
+        return max(0.0, _rng.uniform(mean - spread, mean + spread))
+    # Lognormal с заданной медианой: длинный хвост, как у настоящих API
+    return _rng.lognormvariate(0.0, spread) * mean
+
+
+def _resolve(schema: dict, root: dict) -> dict:
+    ref = schema.get("$ref")
+    if ref is None:
+        return schema
+    node: Any = root
+    for part in ref.lstrip("#/").split("/"):
+        node = node[part]
+    return _resolve(node, root)
+
+
+def synthesize(
+    schema: dict, root: dict | None = None, name: str = "", index: int = 0
+) -> Any:
+    """Builds a minimal value that satisfies a (pydantic-generated) JSON Schema."""
+    root = root or schema
+    schema = _resolve(schema, root)
+    if "anyOf" in schema:
+        return synthesize(schema["anyOf"][0], root, name, index)
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "const" in schema:
+        return schema["const"]
+    if name in _FIELD_VALUES:
+        return _FIELD_VALUES[name]
+    if name == "slide_id":
+        return index + 1
+
+    kind = schema.get("type")
+    if kind == "object":
+        return {
+            prop: synthesize(sub, root, prop, index)
+            for prop, sub in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        # Графики необязательны: без minItems отдаём пустой список
+        count = schema.get("minItems", 0 if name == "charts" else 1)
+        item = schema.get("items", {})
+        return [synthesize(item, root, "", i) for i in range(count)]
+    if kind == "integer":
+        return max(schema.get("minimum", 1), 1)
+    if kind == "number":
+        return float(schema.get("minimum", 1.0))
+    if kind == "boolean":
+        return False
+    if kind == "string":
+        return f"{name or 'text'} {index + 1}".strip()
+    return None
+
+
+def _synthesize_content(body: dict) -> str:
+    fmt = body.get("response_format") or {}
+    schema = (fmt.get("json_schema") or {}).get("schema")
+    if schema:
+        return json.dumps(synthesize(schema), ensure_ascii=False)
+    if fmt.get("type") == "json_object":
+        return "{}"
+    return "Ответ заглушки LLM."
+
+
+def _completion(model: str, content: str, prompt_chars: int) -> dict:
+    return {
+        "id": f"stub-{time.time_ns()}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_chars // 3,
+            "completion_tokens": len(content) // 3,
+            "total_tokens": (prompt_chars + len(content)) // 3,
+        },
+    }
+
+
+async def _sse(model: str, content: str, delay: float) -> AsyncIterator[str]:
+    await asyncio.sleep(delay)
+    step = max(1, stub_settings.CHUNK_CHARS)
+    rate = stub_settings.CHARS_PER_SECOND
+    pause = step / rate if rate > 0 else 0.0
+    for i in range(0, len(content), step):
+        chunk = {
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": content[i : i + step]}}],
+        }
+        yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        await asyncio.sleep(pause)
+    yield "data: [DONE]\n\n"
+
+
+app = FastAPI(title="LLM stub")
+
+
+@app.post("/v1/chat/completions")
+@app.post("/api/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "stub")
+    messages = body.get("messages") or []
+
+    roll = _rng.random()
+    if roll < stub_settings.RATE_LIMIT_RATE:
+        return JSONResponse(
+            {"error": {"message": "stub rate limit", "code": 429}},
+            status_code=429,
+            headers={"Retry-After": str(stub_settings.RETRY_AFTER)},
+        )
+    if roll < stub_settings.RATE_LIMIT_RATE + stub_settings.ERROR_RATE:
+        await asyncio.sleep(_latency())
+        return JSONResponse(
+            {"error": {"message": "stub upstream error", "code": 500}}, status_code=500
+        )
+
+    recorded = recordings.find(messages)
+    if recorded is not None:
+        content = recorded["response"]["choices"][0]["message"]["content"] or ""
+        delay = recorded.get("latency") if stub_settings.REPLAY_LATENCY else None
+    else:
+        content = _synthesize_content(body)
+        delay = None
+    if delay is None:
+        delay = _latency()
+
+    if body.get("stream"):
+        return StreamingResponse(
+            _sse(model, content, delay), media_type="text/event-stream"
+        )
+    await asyncio.sleep(delay)
+    prompt_chars = sum(len(str(m.get("content", ""))) for m in messages)
+    return _completion(model, content, prompt_chars)
+
+
+@app.get("/stats")
+async def stats():
+    return {"recordings": len(recordings), "settings": stub_settings.model_dump()}
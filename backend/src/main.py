@@ -2,8 +2,20 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 
-from src.routes import file_routes, presentation_routes, test_routes, auth_routes, oauth_routes, user_routes
+from src.routes import (
+    auth_routes,
+    file_routes,
+    job_routes,
+    llm_routes,
+    oauth_routes,
+    presentation_routes,
+    test_routes,
+    user_routes,
+)
 from src.preload import preload_models
+from src.services.convert_file_service import shutdown_parser_pool, warm_parser_pool
+from src.services.job_queue_service import job_queue
+from src.utils import model_api_utils
 
 app = FastAPI(
     title="API Documentation",
@@ -45,6 +57,16 @@ async def startup_event():
     except Exception as e:
         logging.error(f"Failed to preload models: {e}")
         raise
+    # С локальной очередью задачи генерации выполняются внутри процесса API
+    job_queue.start_local_workers()
+    warm_parser_pool()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await job_queue.stop_local_workers()
+    shutdown_parser_pool()
+    model_api_utils.model_client.close()
 
 
 app.include_router(presentation_routes.router)
@@ -52,4 +74,6 @@ app.include_router(file_routes.router)
 app.include_router(test_routes.router)
 app.include_router(auth_routes.router)
 app.include_router(user_routes.router)
-app.include_router(oauth_routes.router)
\ No newline at end of file
+app.include_router(oauth_routes.router)
+app.include_router(llm_routes.router)
+app.include_router(job_routes.router)
\ No newline at end of file
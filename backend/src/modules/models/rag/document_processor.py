@@ -49,17 +49,9 @@ class DocumentProcessor:
     def process_document(
         self, document: str, metadata: dict | None = None
     ) -> list[dict]:
-        path = metadata.get("source") if metadata else None
-        ext = path.lower().split(".")[-1] if path else None
-
-        if ext == "pdf":
-            content = self.extract_text_from_pdf(path)
-        elif ext in ("ppt", "pptx"):
-            content = self.extract_text_from_pptx(path)
-        else:
-            content = document
-
-        chunks = self.chunk_text(content)
+        # source — имя загруженного файла, только для атрибуции: текст уже
+        # разобран, с диска сервера по нему ничего не читаем
+        chunks = self.chunk_text(document)
         return [
             {"chunk_id": i, "text": ch, "metadata": metadata or {}}
             for i, ch in enumerate(chunks)
@@ -1,6 +1,8 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING
 
+from qdrant_client.http import models
+
 from src.config import settings
 from src.modules.models.model_manager import model_manager
 
@@ -19,29 +21,37 @@ class FZ44RAGSearcher:
         self.cross_encoder = model_manager.get_cross_encoder_model(cross_encoder_model)
 
     def search_raw_candidates(self, query: str, top_k: int = 30) -> list:
-        query_vector = self.vector_db.encoder.encode([query])[0].tolist()
+        return self.search_raw_many([query], top_k=top_k)[0]
 
-        response = self.vector_db.client.search(
+    def search_raw_many(self, queries: list[str], top_k: int = 30) -> list[list]:
+        """Candidates for several queries: one encode batch, one Qdrant batch query."""
+        if not queries:
+            return []
+        vectors = self.vector_db.encoder.encode(queries, batch_size=32)
+        responses = self.vector_db.client.query_batch_points(
             collection_name=self.vector_db.collection_name,
-            query_vector=query_vector,
-            limit=top_k,
-            with_payload=True,
+            requests=[
+                models.QueryRequest(
+                    query=vector.tolist(), limit=top_k, with_payload=True
+                )
+                for vector in vectors
+            ],
         )
+        return [
+            [self._candidate(hit) for hit in response.points] for response in responses
+        ]
 
-        candidates = []
-        for hit in response:
-            payload = hit.payload
-            candidates.append(
-                {
-                    "text": payload.get("context"),
-                    "score": hit.score,
-                    "metadata": {
-                        "source": payload.get("file_name"),
-                        "chunk_id": payload.get("chunk_index"),
-                    },
-                }
-            )
-        return candidates
+    @staticmethod
+    def _candidate(hit) -> dict:
+        payload = hit.payload
+        return {
+            "text": payload.get("context"),
+            "score": hit.score,
+            "metadata": {
+                "source": payload.get("file_name"),
+                "chunk_id": payload.get("chunk_index"),
+            },
+        }
 
     def rerank_results(self, query: str, candidates: list, limit: int = 10) -> list:
         pairs = [(query, c.get("text") or "") for c in candidates]
@@ -59,3 +69,39 @@ class FZ44RAGSearcher:
         candidates = self.search_raw_candidates(query, top_k=top_k)
         reranked = self.rerank_results(query, candidates, limit=rerank_limit)
         return reranked
+
+    def rerank_many(
+        self, queries: list[str], candidates: list[list], limit: int = 10
+    ) -> list[list]:
+        """
+        rerank_results for several queries in one cross-encoder call; a (query,
+        chunk) pair shared by several queries is scored once.
+        """
+        index: dict[tuple[str, str], int] = {}
+        for query, found in zip(queries, candidates):
+            for c in found:
+                index.setdefault((query, c.get("text") or ""), len(index))
+        scores = (
+            self.cross_encoder.predict(list(index), batch_size=32) if index else []
+        )
+
+        results = []
+        for query, found in zip(queries, candidates):
+            for c in found:
+                c["rerank_score"] = float(scores[index[(query, c.get("text") or "")]])
+            results.append(
+                sorted(found, key=lambda x: x["rerank_score"], reverse=True)[:limit]
+            )
+        return results
+
+    def search_many(
+        self, queries: list[str], top_k: int = 30, rerank_limit: int = 5
+    ) -> list[list]:
+        """search() for all queries at once; repeated queries are searched once."""
+        unique = list(dict.fromkeys(queries))
+        candidates = self.search_raw_many(unique, top_k=top_k)
+        reranked = dict(
+            zip(unique, self.rerank_many(unique, candidates, limit=rerank_limit))
+        )
+        # Копии: одинаковые запросы не должны делить изменяемые dict'ы
+        return [[dict(c) for c in reranked[q]] for q in queries]
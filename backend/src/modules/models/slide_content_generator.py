@@ -1,16 +1,34 @@
 from __future__ import annotations
+import asyncio
+from contextlib import aclosing
+import functools
 import json
-import time
-from typing import TYPE_CHECKING
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+)
 import logging
 import re
 
-from src.config import settings, model_settings
-from src.utils import json_utils, model_api_utils, text_utils
+from pydantic import ValidationError
+
+from src.config import settings, model_settings, ModelStage
+from src.schemas.model_schemas import ChartsOut, SlideContentOut, SlidesBatchOut
+from src.services.llm_metrics_service import llm_metrics_service
+from src.utils import async_utils, json_utils, model_api_utils, text_utils, token_utils
 
 if TYPE_CHECKING:
     from src.modules.models.rag_searcher import FZ44RAGSearcher
 
+# (slide_id, title, task, retrieved chunks)
+SlideJob = tuple[int, str, str, list[dict]]
+# (slide ids covered, job streaming their events)
+SlideTask = tuple[tuple[int, ...], Callable[[], AsyncIterator[dict]]]
+
 
 class SlideContentGenerator:
     def __init__(
@@ -18,18 +36,23 @@ class SlideContentGenerator:
         api_key: str,
         searcher: FZ44RAGSearcher,
         model: str = settings.DEFAULT_MODEL,
+        priority: list[int] | None = None,
     ):
         self.api_key = api_key
         self.searcher = searcher
         self.model = model
         self.used_facts: list[str] = []
+        # Слайды вне очереди; список может меняться снаружи во время генерации
+        self._priority = priority if priority is not None else []
+        # Запросы слайдов, пришедшие одновременно, ищутся одним search_many
+        self._retriever = async_utils.Coalescer(self._search_many)
         self.generation_metadata: Dict[str, Any] = {}
 
     def _chunks_to_text(self, retrieved: list[dict]) -> str:
         lines = []
-        for i, r in enumerate(retrieved):
-            raw = str(r.get("text", ""))
-            txt = raw[:600].replace("\n", " ").replace("\r", " ")
+        budget = model_settings.PROMPT_CONTEXT_TOKENS["slide"]
+        for i, (r, raw) in enumerate(token_utils.fit_chunks(retrieved, budget)):
+            txt = raw.replace("\n", " ").replace("\r", " ")
             lines.append(f"{i+1}. {txt}")
         return "\n".join(lines)
 
@@ -51,23 +74,23 @@ class SlideContentGenerator:
             chunks_text=chunks_text,
         )
 
-    def call_api(self, prompt: str, max_tokens: int = 900, retry: int = 2) -> str:
-        for attempt in range(retry):
-            try:
-                resp = model_api_utils.call_model(
-                    [{"role": "user", "content": prompt}],
-                    api_key=self.api_key,
-                    model=self.model,
-                    max_tokens=max_tokens,
-                    temperature=0.2,
-                    timeout=60,
-                )
-                return model_api_utils.get_content(resp)
-            except Exception:
-                if attempt < retry - 1:
-                    time.sleep(1 + attempt * 2)
-                    continue
-                raise
+    async def acall_api(
+        self,
+        prompt: str,
+        max_tokens: int = 900,
+        stage: ModelStage = ModelStage.SLIDE,
+        response_format: dict | None = None,
+    ) -> str:
+        resp = await model_api_utils.acall_model(
+            [{"role": "user", "content": prompt}],
+            api_key=self.api_key,
+            model=self.model,
+            max_tokens=max_tokens,
+            temperature=0.2,
+            stage=stage,
+            response_format=response_format,
+        )
+        return model_api_utils.get_content(resp)
 
     def _fallback(self, slide_id: int, slide_title: str) -> dict:
         return {
@@ -77,33 +100,216 @@ class SlideContentGenerator:
             "content": "Данные для этого раздела отсутствуют",
         }
 
-    def generate_slide_content(
-        self, slide_id: int, slide_title: str, slide_task: str, topic: str
-    ) -> dict:
-        query = f"{slide_title} {slide_task} {topic}".strip()
-        retrieved = self.searcher.search(query, top_k=model_settings.TOP_K_RETRIEVAL)
+    def _query(self, slide_title: str, slide_task: str, topic: str) -> str:
+        return f"{slide_title} {slide_task} {topic}".strip()
+
+    def _search_many(self, queries: list[str]) -> list[list[dict]]:
+        return self.searcher.search_many(queries, top_k=model_settings.TOP_K_RETRIEVAL)
+
+    async def _aretrieve(
+        self, slide_title: str, slide_task: str, topic: str
+    ) -> list[dict]:
+        """Slide retrieval, batched with the other slides retrieving meanwhile."""
+        return await self._retriever(self._query(slide_title, slide_task, topic))
+
+    async def agenerate_slide_json(
+        self,
+        slide_id: int,
+        slide_title: str,
+        slide_task: str,
+        topic: str,
+        retrieved: list[dict],
+    ) -> dict | None:
+        """Slide content without charts as parsed JSON, or None if unparseable."""
+        prompt = self.generate_slide_prompt(
+            slide_id, slide_title, slide_task, topic, retrieved
+        )
+        try:
+            parsed, _ = await model_api_utils.acall_json(
+                prompt,
+                self.api_key,
+                model=self.model,
+                max_tokens=900,
+                temperature=0.2,
+                stage=ModelStage.SLIDE,
+                schema=SlideContentOut,
+            )
+        except Exception as e:
+            logging.warning(f"[Slide {slide_id}] content failed: {e}")
+            return None
+        return parsed if isinstance(parsed, dict) else None
+
+    async def astream_slide_content(
+        self,
+        slide_id: int,
+        slide_title: str,
+        slide_task: str,
+        topic: str,
+        retrieved: list[dict] | Awaitable[list[dict]] | None = None,
+    ) -> AsyncIterator[dict]:
+        """
+        Generates a slide: yields slide_token events with decoded "content"
+        text as the LLM produces it, then slide_done with the validated slide
+        dict. retrieved may be a prefetch in flight. A stream cut off after
+        some tokens ends with slide_failed instead of slide_done.
+        """
+        yield {"type": "slide_started", "slide_id": slide_id, "title": slide_title}
+        if retrieved is None:
+            retrieved = self._aretrieve(slide_title, slide_task, topic)
+        if not isinstance(retrieved, list):
+            retrieved = await retrieved
         logging.info(f"[Slide {slide_id}] retrieved={len(retrieved)}")
         prompt = self.generate_slide_prompt(
             slide_id, slide_title, slide_task, topic, retrieved
         )
+
+        streamer = json_utils.JsonFieldStreamer("content")
+        raw_parts: list[str] = []
+        streamed: list[str] = []
+        parsed = None
         try:
-            raw = self.call_api(prompt, max_tokens=900)
-            parsed = json_utils.extract_json_balanced(raw)
-            if not isinstance(parsed, dict):
-                raise ValueError("Not a dict")
-        except Exception:
+            async for delta in model_api_utils.astream_model(
+                [{"role": "user", "content": prompt}],
+                api_key=self.api_key,
+                model=self.model,
+                max_tokens=900,
+                temperature=0.2,
+                stage=ModelStage.SLIDE,
+                response_format=model_api_utils.json_schema_format(SlideContentOut),
+            ):
+                raw_parts.append(delta)
+                text = streamer.feed(delta)
+                if text:
+                    streamed.append(text)
+                    yield {"type": "slide_token", "slide_id": slide_id, "text": text}
+            parsed = json_utils.extract_json_balanced("".join(raw_parts))
+            if isinstance(parsed, dict):
+                llm_metrics_service.incr("json.first_try.slide")
+        except Exception as e:
+            logging.warning(f"[Slide {slide_id}] stream failed: {e}")
+
+        streamed_text = "".join(streamed)
+        if streamed_text and not streamer.done:
+            # Поле content оборвано: отправленный текст не перезаписать, а
+            # готовым слайдом он не считается — в чекпоинт не попадёт и
+            # возобновление сгенерирует слайд заново
+            llm_metrics_service.incr("slides.failed")
+            yield {
+                "type": "slide_failed",
+                "slide_id": slide_id,
+                "error": "Slide stream was interrupted",
+            }
+            return
+        if not isinstance(parsed, dict):
+            if streamed_text:
+                # content пришёл целиком, битым оказался только хвост JSON
+                parsed = {"slide_id": slide_id, "title": slide_title, "used_facts": []}
+            else:
+                llm_metrics_service.incr("json.retry.slide")
+                try:
+                    raw2 = await self.acall_api(
+                        model_settings.JSON_ONLY_PROMPT + "\n\n" + prompt,
+                        max_tokens=900,
+                    )
+                    parsed = json_utils.extract_json_balanced(raw2)
+                    if not isinstance(parsed, dict):
+                        raise ValueError("Not a dict")
+                except Exception as e:
+                    logging.warning(
+                        f"[Slide {slide_id}] JSON parse failed: {e} -> fallback"
+                    )
+                    parsed = self._fallback(slide_id, slide_title)
+                    yield {"type": "slide_done", "slide_id": slide_id, "slide": parsed}
+                    return
+        if streamed_text:
+            # Уже отправленный клиенту текст должен остаться префиксом итогового
+            parsed["content"] = streamed_text
+
+        chart_blocks = await self.agenerate_charts_with_llm(
+            slide_id, slide_title, slide_task, topic, retrieved, max_tokens=600
+        )
+        yield {"type": "chart_done", "slide_id": slide_id, "charts": chart_blocks}
+        slide = self._finalize_slide(
+            parsed,
+            slide_id,
+            slide_title,
+            slide_task,
+            chart_blocks,
+            allow_chart_only=not streamed_text,
+        )
+        yield {"type": "slide_done", "slide_id": slide_id, "slide": slide}
+
+    def _batch_cost(self, job: SlideJob) -> int:
+        return token_utils.count_tokens(self._chunks_to_text(job[3]))
+
+    def _batch_full(self, size: int, used: int, cost: int) -> bool:
+        return size > 0 and (
+            size >= model_settings.SLIDE_BATCH_SIZE
+            or used + cost > model_settings.SLIDE_BATCH_CONTEXT_TOKENS
+        )
+
+    def _batch_prompt(self, batch: list[SlideJob], topic: str) -> str:
+        slides_text = "\n".join(
+            text_utils.safe_format(
+                model_settings.BATCH_SLIDE_ITEM_TEMPLATE,
+                slide_id=str(int(sid)),
+                slide_title=title,
+                slide_task=task,
+                chunks_text=self._chunks_to_text(retrieved),
+            )
+            for sid, title, task, retrieved in batch
+        )
+        return text_utils.safe_format(
+            model_settings.BATCH_SLIDE_PROMPT_TEMPLATE,
+            topic=topic,
+            slides_text=slides_text,
+        )
+
+    def _parse_batch(self, parsed: Any, batch: list[SlideJob]) -> dict[int, dict]:
+        """Validates each slide of a batch reply; returns the valid ones by slide_id."""
+        items = parsed.get("slides") if isinstance(parsed, dict) else parsed
+        if not isinstance(items, list):
+            items = []
+        expected = {sid for sid, _, _, _ in batch}
+        out: dict[int, dict] = {}
+        for item in items:
             try:
-                raw2 = self.call_api(
-                    model_settings.JSON_ONLY_PROMPT + "\n\n" + prompt, max_tokens=900
-                )
-                parsed = json_utils.extract_json_balanced(raw2)
-                if not isinstance(parsed, dict):
-                    raise ValueError("Not a dict")
-            except Exception as e:
-                logging.warning(
-                    f"[Slide {slide_id}] JSON parse failed: {e} -> fallback"
-                )
-                return self._fallback(slide_id, slide_title)
+                slide = SlideContentOut.model_validate(item)
+            except ValidationError:
+                continue
+            if slide.slide_id in expected and slide.slide_id not in out:
+                out[slide.slide_id] = slide.model_dump()
+        llm_metrics_service.incr("slides.batched", len(out))
+        llm_metrics_service.incr("slides.batch_fallback", len(batch) - len(out))
+        return out
+
+    async def agenerate_batch_content(
+        self, batch: list[SlideJob], topic: str
+    ) -> dict[int, dict]:
+        try:
+            parsed, _ = await model_api_utils.acall_json(
+                self._batch_prompt(batch, topic),
+                self.api_key,
+                model=self.model,
+                max_tokens=model_settings.SLIDE_BATCH_MAX_TOKENS_PER_SLIDE * len(batch),
+                temperature=0.2,
+                stage=ModelStage.SLIDE,
+                schema=SlidesBatchOut,
+            )
+        except Exception as e:
+            logging.warning(f"[Batch {[j[0] for j in batch]}] failed: {e}")
+            parsed = None
+        return self._parse_batch(parsed, batch)
+
+    def _finalize_slide(
+        self,
+        parsed: dict,
+        slide_id: int,
+        slide_title: str,
+        slide_task: str,
+        chart_blocks: list[str],
+        allow_chart_only: bool = True,
+    ) -> dict:
         if "slide_id" not in parsed or parsed["slide_id"] != slide_id:
             parsed["slide_id"] = slide_id
         parsed.setdefault("title", slide_title)
@@ -114,12 +320,8 @@ class SlideContentGenerator:
             or f"### {slide_title}\n\n* Данные для этого раздела отсутствуют"
         )
 
-        chart_blocks = self.generate_charts_with_llm(
-            slide_id, slide_title, slide_task, topic, retrieved, max_tokens=600
-        )
-
         if chart_blocks:
-            if self._should_chart_only(slide_title, slide_task):
+            if allow_chart_only and self._should_chart_only(slide_title, slide_task):
                 content = f"### {slide_title}\n\n" + "\n\n".join(chart_blocks)
             else:
                 content = (
@@ -191,24 +393,23 @@ class SlideContentGenerator:
 
     def _chunks_for_prompt(self, retrieved: list[dict]) -> str:
         lines = []
-        for i, r in enumerate(retrieved):
-            txt = (r.get("text") or "")[:700]
+        budget = model_settings.PROMPT_CONTEXT_TOKENS["chart"]
+        for i, (r, txt) in enumerate(token_utils.fit_chunks(retrieved, budget)):
             cid = r.get("chunk_id", i)
             src = (r.get("metadata", {}) or {}).get("source", "unknown")
             lines.append(f"{i + 1}. [chunk_id={cid} source={src}]\n{txt}")
         return "\n\n".join(lines)
 
-    def generate_charts_with_llm(
+    def _chart_prompt(
         self,
         slide_id: int,
         slide_title: str,
         slide_task: str,
         topic: str,
         retrieved: list[dict],
-        max_tokens: int = 600,
-    ) -> list[str]:
+    ) -> str:
         chunks_text = self._chunks_for_prompt(retrieved) if retrieved else "(no data)"
-        prompt = text_utils.safe_format(
+        return text_utils.safe_format(
             model_settings.CHART_GENERATOR_PROMPT,
             topic=self._safe_text(topic),
             slide_id=int(slide_id),
@@ -216,11 +417,29 @@ class SlideContentGenerator:
             slide_task=self._safe_text(slide_task),
             chunks_text=chunks_text,
         )
-        raw = self.call_api(prompt, max_tokens=max_tokens)
+
+    def _chart_fences_from_raw(self, raw: str) -> list[str]:
         obj = self.extract_json_from_text(raw)
         specs = self._validate_llm_charts(obj)
-        fences = [self._chart_fence(sp) for sp in specs]
-        return fences
+        return [self._chart_fence(sp) for sp in specs]
+
+    async def agenerate_charts_with_llm(
+        self,
+        slide_id: int,
+        slide_title: str,
+        slide_task: str,
+        topic: str,
+        retrieved: list[dict],
+        max_tokens: int = 600,
+    ) -> list[str]:
+        prompt = self._chart_prompt(slide_id, slide_title, slide_task, topic, retrieved)
+        raw = await self.acall_api(
+            prompt,
+            max_tokens=max_tokens,
+            stage=ModelStage.CHART,
+            response_format=model_api_utils.json_schema_format(ChartsOut),
+        )
+        return self._chart_fences_from_raw(raw)
 
     def _should_chart_only(self, slide_title: str, slide_task: str) -> bool:
         txt = f"{slide_title} {slide_task}".lower()
@@ -267,21 +486,185 @@ class SlideContentGenerator:
                 return {}
         return {}
 
-    def generate_presentation_content(self, presentation_data: dict):
-        self.generation_metadata = {"total_facts_used": 0, "slides_generated": 0, "slides_with_fallback": 0}
-        slides_content_for_logging = []
-        for slide in presentation_data["slide_structure"]:
-            sid = slide.get("slide_id") or slide.get("id")
-            title = slide.get("title", f"Слайд {sid}")
-            task = slide.get("task", "")
-            sc = self.generate_slide_content(sid, title, task, presentation_data.get("presentation_topic", ""))
-            yield sc
-            slides_content_for_logging.append(sc)
-            self.generation_metadata["slides_generated"] += 1
-            if not sc.get("used_facts"):
-                self.generation_metadata["slides_with_fallback"] += 1
-            time.sleep(0.2)
+    def _next_job(self, waiting: list[tuple]) -> tuple:
+        for slide_id in self._priority:
+            for item in waiting:
+                if slide_id in item[0]:
+                    return item
+        return waiting[0]
+
+    async def _astream_ordered(
+        self, jobs: AsyncIterable[SlideTask], ordered: bool = True
+    ) -> AsyncIterator[dict]:
+        """
+        Runs up to SLIDE_CONCURRENCY jobs at once, prioritized slides first and
+        then in slide order. Jobs may keep arriving while earlier ones run
+        (streamed planner output). ordered=True yields events in job order: the
+        head job streams live, later jobs buffer until it finishes; otherwise
+        events are yielded as they arrive (clients that track slide_id).
+        """
+        limit = max(1, model_settings.SLIDE_CONCURRENCY)
+        # Очереди событий заданий в порядке слайдов; None — заданий больше не будет.
+        # Без порядка все задания пишут в одну общую очередь
+        queues: asyncio.Queue = asyncio.Queue()
+        shared: asyncio.Queue = asyncio.Queue()
+        waiting: list[tuple[tuple[int, ...], Callable, asyncio.Queue]] = []
+        tasks: list[asyncio.Task] = []
+        running = open_jobs = 0
+        closing = False
+        fed = object()
+
+        async def run(job: Callable[[], AsyncIterator[dict]], queue: asyncio.Queue):
+            nonlocal running
+            try:
+                async for event in job():
+                    queue.put_nowait(event)
+            except Exception as e:
+                queue.put_nowait(e)
+            finally:
+                queue.put_nowait(None)
+                running -= 1
+                start_ready()
+
+        def start_ready() -> None:
+            nonlocal running
+            while waiting and running < limit and not closing:
+                item = self._next_job(waiting)
+                waiting.remove(item)
+                running += 1
+                tasks.append(asyncio.create_task(run(item[1], item[2])))
+
+        async def feed() -> None:
+            nonlocal open_jobs
+            try:
+                async for slide_ids, job in jobs:
+                    queue: asyncio.Queue = asyncio.Queue() if ordered else shared
+                    open_jobs += 1
+                    waiting.append((slide_ids, job, queue))
+                    queues.put_nowait(queue)
+                    start_ready()
+            except Exception as e:
+                failed: asyncio.Queue = asyncio.Queue()
+                failed.put_nowait(e)
+                queues.put_nowait(failed)
+                shared.put_nowait(e)
+            finally:
+                queues.put_nowait(None)
+                shared.put_nowait(fed)
+
+        async def drain(queue: asyncio.Queue) -> AsyncIterator[dict]:
+            while (event := await queue.get()) is not None:
+                if isinstance(event, Exception):
+                    raise event
+                yield event
+
+        feeder = asyncio.create_task(feed())
+        try:
+            if ordered:
+                while (queue := await queues.get()) is not None:
+                    async for event in drain(queue):
+                        yield event
+            else:
+                # Каждое задание закрывает общую очередь своим None, подача — fed
+                feeding = True
+                while feeding or open_jobs:
+                    event = await shared.get()
+                    if event is fed:
+                        feeding = False
+                    elif event is None:
+                        open_jobs -= 1
+                    elif isinstance(event, Exception):
+                        raise event
+                    else:
+                        yield event
+        finally:
+            closing = True
+            feeder.cancel()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(feeder, *tasks, return_exceptions=True)
+
+    async def _astream_batch(
+        self, batch: list[SlideJob], topic: str
+    ) -> AsyncIterator[dict]:
+        results = await self.agenerate_batch_content(batch, topic)
+        for sid, title, task, retrieved in batch:
+            parsed = results.get(sid)
+            if parsed is None:
+                async for event in self.astream_slide_content(
+                    sid, title, task, topic, retrieved=retrieved
+                ):
+                    yield event
+                continue
+            yield {"type": "slide_started", "slide_id": sid, "title": title}
+            chart_blocks = await self.agenerate_charts_with_llm(
+                sid, title, task, topic, retrieved, max_tokens=600
+            )
+            yield {"type": "chart_done", "slide_id": sid, "charts": chart_blocks}
+            slide = self._finalize_slide(parsed, sid, title, task, chart_blocks)
+            yield {"type": "slide_done", "slide_id": sid, "slide": slide}
+
+    async def _aprefetch(
+        self, specs: AsyncIterable[tuple[int, str, str]], topic: str
+    ) -> AsyncIterator[tuple[int, str, str, asyncio.Future]]:
+        async for sid, title, task in specs:
+            yield sid, title, task, asyncio.ensure_future(
+                self._aretrieve(title, task, topic)
+            )
+
+    async def _aslide_jobs(
+        self, specs: AsyncIterable[tuple[int, str, str]], topic: str
+    ) -> AsyncIterator[SlideTask]:
+        # merge читает план в фоне: поиск стартует, как только слайд запланирован,
+        # и слайды, пришедшие вместе, попадают в один search_many
+        async with aclosing(async_utils.merge(self._aprefetch(specs, topic))) as found:
+            if model_settings.SLIDE_BATCH_SIZE <= 1:
+                async for sid, title, task, retrieved in found:
+                    yield (sid,), functools.partial(
+                        self.astream_slide_content, sid, title, task, topic, retrieved
+                    )
+                return
+            batch: list[SlideJob] = []
+            used = 0
+            async for sid, title, task, retrieved in found:
+                job = (sid, title, task, await retrieved)
+                cost = self._batch_cost(job)
+                if self._batch_full(len(batch), used, cost):
+                    yield self._batch_task(batch, topic)
+                    batch, used = [], 0
+                batch.append(job)
+                used += cost
+            if batch:
+                yield self._batch_task(batch, topic)
+
+    def _batch_task(self, batch: list[SlideJob], topic: str) -> SlideTask:
+        slide_ids = tuple(job[0] for job in batch)
+        return slide_ids, functools.partial(self._astream_batch, batch, topic)
+
+    async def astream_slides(
+        self,
+        specs: AsyncIterable[tuple[int, str, str]],
+        topic: str,
+        ordered: bool = True,
+    ) -> AsyncIterator[dict]:
+        """
+        Streams slide events for (slide_id, title, task) specs that may still be
+        arriving; a slide starts as soon as its spec is available.
+        """
+        self.generation_metadata = {
+            "total_facts_used": 0,
+            "slides_generated": 0,
+            "slides_with_fallback": 0,
+            "slides_failed": 0,
+        }
+        jobs = self._aslide_jobs(specs, topic)
+        async for event in self._astream_ordered(jobs, ordered):
+            if event["type"] == "slide_done":
+                sc = event["slide"]
+                self.generation_metadata["slides_generated"] += 1
+                if not sc.get("used_facts"):
+                    self.generation_metadata["slides_with_fallback"] += 1
+            elif event["type"] == "slide_failed":
+                self.generation_metadata["slides_failed"] += 1
+            yield event
         self.generation_metadata["total_facts_used"] = len(set(self.used_facts))
-        logging.info("=== SLIDE SUMMARY ===")
-        for s in slides_content_for_logging:
-            logging.info(f"- id={s.get('slide_id')} title='{s.get('title','')[:40]}' facts={len(s.get('used_facts', []))}")
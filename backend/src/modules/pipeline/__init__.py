@@ -0,0 +1,11 @@
+from .dag import Stage, StageCache, StageGraph, StageRun, fingerprint
+from .presentation_stages import build_presentation_graph
+
+__all__ = [
+    "Stage",
+    "StageCache",
+    "StageGraph",
+    "StageRun",
+    "fingerprint",
+    "build_presentation_graph",
+]
@@ -0,0 +1,236 @@
+from __future__ import annotations
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import hashlib
+import inspect
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Iterable
+
+from src.services.llm_metrics_service import llm_metrics_service
+
+
+def fingerprint(value: Any) -> str:
+    """Stable hash of a JSON-like value; used as part of the stage cache key."""
+    raw = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    A node of the pipeline DAG. fn receives the declared inputs as keyword
+    arguments and returns the single output, or a dict when it declares
+    several. Stages must not mutate their inputs: values are memoized.
+    """
+
+    name: str
+    fn: Callable[..., Any]
+    inputs: tuple[str, ...]
+    outputs: tuple[str, ...] = ()
+    # Меняется вместе с логикой стадии, чтобы не отдавать старые результаты
+    version: str = "1"
+    cache: bool = True
+
+    def __post_init__(self) -> None:
+        if not self.outputs:
+            object.__setattr__(self, "outputs", (self.name,))
+
+    def key(self, args: dict[str, Any]) -> str:
+        return fingerprint(
+            [self.name, self.version, {k: fingerprint(v) for k, v in args.items()}]
+        )
+
+    async def call(self, args: dict[str, Any]) -> dict[str, Any]:
+        if inspect.iscoroutinefunction(self.fn):
+            result = await self.fn(**args)
+        else:
+            # Синхронные (CPU-bound) стадии — в пуле потоков, с contextvars
+            result = await asyncio.to_thread(self.fn, **args)
+        if len(self.outputs) == 1:
+            return {self.outputs[0]: result}
+        missing = [o for o in self.outputs if o not in result]
+        if missing:
+            raise ValueError(f"Stage {self.name} did not produce {missing}")
+        return {o: result[o] for o in self.outputs}
+
+
+class StageCache:
+    """In-memory LRU of stage outputs keyed by Stage.key()."""
+
+    _entries: OrderedDict[str, dict[str, Any]]
+
+    def __init__(self, max_entries: int) -> None:
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+@dataclass
+class StageRun:
+    """Values of a run (inputs and stage outputs) and per-stage timings."""
+
+    values: dict[str, Any]
+    timings: dict[str, dict] = field(default_factory=dict)
+
+    def __getitem__(self, name: str) -> Any:
+        return self.values[name]
+
+
+class StageGraph:
+    """
+    Runs a DAG of stages: each stage starts as soon as its inputs are ready,
+    so independent stages run concurrently. Outputs are memoized by the hash
+    of the stage inputs, so a re-run only recomputes stages whose inputs
+    changed (or that are forced), and unchanged upstream results are reused.
+    """
+
+    _stages: dict[str, Stage]
+    _producers: dict[str, str]
+
+    def __init__(self, stages: Iterable[Stage], cache: StageCache) -> None:
+        self._stages = {}
+        self._producers = {}
+        for stage in stages:
+            if stage.name in self._stages:
+                raise ValueError(f"Duplicate stage {stage.name}")
+            self._stages[stage.name] = stage
+            for output in stage.outputs:
+                if output in self._producers:
+                    raise ValueError(f"Output {output} is produced twice")
+                self._producers[output] = stage.name
+        self._order = self._toposort()
+        self.cache = cache
+
+    @property
+    def stages(self) -> list[str]:
+        return list(self._order)
+
+    def _deps(self, stage: Stage) -> set[str]:
+        return {self._producers[i] for i in stage.inputs if i in self._producers}
+
+    def _toposort(self) -> list[str]:
+        order: list[str] = []
+        state: dict[str, int] = {}
+
+        def visit(name: str) -> None:
+            if state.get(name) == 2:
+                return
+            if state.get(name) == 1:
+                raise ValueError(f"Stage graph has a cycle through {name}")
+            state[name] = 1
+            for dep in sorted(self._deps(self._stages[name])):
+                visit(dep)
+            state[name] = 2
+            order.append(name)
+
+        for name in self._stages:
+            visit(name)
+        return order
+
+    def _needed(self, targets: Iterable[str] | None) -> list[str]:
+        if targets is None:
+            return list(self._order)
+        needed: set[str] = set()
+        pending = [self._producers.get(t, t) for t in targets]
+        while pending:
+            name = pending.pop()
+            if name not in self._stages:
+                raise ValueError(f"Unknown stage or output {name}")
+            if name not in needed:
+                needed.add(name)
+                pending.extend(self._deps(self._stages[name]))
+        return [name for name in self._order if name in needed]
+
+    def prime(self, name: str, args: dict[str, Any], outputs: dict[str, Any]) -> None:
+        """
+        Stores known outputs of a stage for these inputs (e.g. restored from a
+        checkpoint), so a run with the same inputs reuses them.
+        """
+        stage = self._stages[name]
+        self.cache.set(stage.key(args), {o: outputs[o] for o in stage.outputs})
+
+    async def run(
+        self,
+        inputs: dict[str, Any],
+        targets: Iterable[str] | None = None,
+        force: Iterable[str] = (),
+    ) -> StageRun:
+        """
+        Runs the stages needed for targets (stage or output names; all by
+        default). Stages listed in force skip the cache lookup; downstream
+        stages recompute only if the forced result differs.
+        """
+        names = self._needed(targets)
+        force = set(force)
+        missing = {
+            i
+            for name in names
+            for i in self._stages[name].inputs
+            if i not in self._producers and i not in inputs
+        }
+        if missing:
+            raise ValueError(f"Missing pipeline inputs: {sorted(missing)}")
+
+        run = StageRun(values=dict(inputs))
+        tasks: dict[str, asyncio.Task] = {}
+
+        async def execute(stage: Stage) -> None:
+            deps = [tasks[d] for d in self._deps(stage)]
+            if deps:
+                await asyncio.gather(*deps)
+            args = {i: run.values[i] for i in stage.inputs}
+            key = stage.key(args)
+            started = time.perf_counter()
+            outputs = None
+            if stage.cache and stage.name not in force:
+                outputs = self.cache.get(key)
+            cached = outputs is not None
+            if outputs is None:
+                outputs = await stage.call(args)
+                if stage.cache:
+                    self.cache.set(key, outputs)
+            elapsed = time.perf_counter() - started
+            run.values.update(outputs)
+            run.timings[stage.name] = {
+                "seconds": round(elapsed, 3),
+                "cached": cached,
+            }
+            outcome = "hit" if cached else "miss"
+            llm_metrics_service.incr(f"stage.{outcome}.{stage.name}")
+            logging.info(f"[Stage {stage.name}] {outcome} in {elapsed:.2f}s")
+
+        # Порядок создания задач топологический: зависимости уже в tasks
+        for name in names:
+            tasks[name] = asyncio.create_task(execute(self._stages[name]))
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+        return run
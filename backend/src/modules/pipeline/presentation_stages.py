@@ -0,0 +1,111 @@
+from __future__ import annotations
+import asyncio
+import copy
+from typing import TYPE_CHECKING, Awaitable
+
+from src.config import settings, model_settings
+from src.modules.models import SlideContentGenerator
+from src.modules.pipeline.dag import Stage, StageCache, StageGraph, fingerprint
+
+if TYPE_CHECKING:
+    from src.services.model_service import IntegratedPipeline
+
+
+def _queries(outline: list[dict], topic: str) -> list[str]:
+    # Те же запросы, что и SlideContentGenerator._query
+    return [f"{s['title']} {s['task']} {topic}".strip() for s in outline]
+
+
+def build_presentation_graph(pipe: IntegratedPipeline) -> StageGraph:
+    """
+    classify -> plan -> retrieve -> rerank -> (content | charts) -> slides,
+    with index (waiting for document ingestion) alongside classify and plan.
+
+    Inputs: user_request, project_context, topic, index_ready.
+    """
+
+    def generator() -> SlideContentGenerator:
+        return SlideContentGenerator(pipe.api_key, pipe.searcher, pipe.llm_model)
+
+    async def classify(user_request: str) -> dict:
+        clf, _ = await pipe.arun_classifier(user_request)
+        return clf.model_dump()
+
+    async def plan(classification: dict, project_context: str) -> list[dict]:
+        struct, _ = await pipe.arun_planner(classification["label"], project_context)
+        return [s.model_dump() for s in struct.slides]
+
+    async def index(project_context: str, index_ready: Awaitable | None) -> str:
+        # Индекс строит реестр пайплайнов; стадия только дожидается его
+        if index_ready is not None:
+            await index_ready
+        return fingerprint(project_context)
+
+    def retrieve(outline: list[dict], topic: str, index: str) -> list[list[dict]]:
+        # index — только зависимость: поиск после загрузки документов
+        return pipe.searcher.search_raw_many(
+            _queries(outline, topic), top_k=model_settings.TOP_K_RETRIEVAL
+        )
+
+    def rerank(
+        outline: list[dict], topic: str, candidates: list[list[dict]]
+    ) -> list[list[dict]]:
+        # rerank_many дописывает rerank_score в кандидатов — работаем с копиями
+        return pipe.searcher.rerank_many(
+            _queries(outline, topic),
+            [[dict(c) for c in found] for found in candidates],
+            limit=5,
+        )
+
+    async def content(
+        outline: list[dict], topic: str, retrieved: list[list[dict]]
+    ) -> list[dict | None]:
+        gen = generator()
+        return await asyncio.gather(
+            *(
+                gen.agenerate_slide_json(
+                    s["slide_id"], s["title"], s["task"], topic, found
+                )
+                for s, found in zip(outline, retrieved)
+            )
+        )
+
+    async def charts(
+        outline: list[dict], topic: str, retrieved: list[list[dict]]
+    ) -> list[list[str]]:
+        gen = generator()
+        return await asyncio.gather(
+            *(
+                gen.agenerate_charts_with_llm(
+                    s["slide_id"], s["title"], s["task"], topic, found, max_tokens=600
+                )
+                for s, found in zip(outline, retrieved)
+            )
+        )
+
+    def slides(
+        outline: list[dict], content: list[dict | None], charts: list[list[str]]
+    ) -> list[dict]:
+        gen = generator()
+        return [
+            gen._finalize_slide(
+                copy.deepcopy(parsed), s["slide_id"], s["title"], s["task"], blocks
+            )
+            if parsed is not None
+            else gen._fallback(s["slide_id"], s["title"])
+            for s, parsed, blocks in zip(outline, content, charts)
+        ]
+
+    return StageGraph(
+        [
+            Stage("classify", classify, ("user_request",), ("classification",)),
+            Stage("plan", plan, ("classification", "project_context"), ("outline",)),
+            Stage("index", index, ("project_context", "index_ready"), cache=False),
+            Stage("retrieve", retrieve, ("outline", "topic", "index"), ("candidates",)),
+            Stage("rerank", rerank, ("outline", "topic", "candidates"), ("retrieved",)),
+            Stage("content", content, ("outline", "topic", "retrieved")),
+            Stage("charts", charts, ("outline", "topic", "retrieved")),
+            Stage("slides", slides, ("outline", "content", "charts")),
+        ],
+        StageCache(settings.PIPELINE_STAGE_CACHE_MAX_ENTRIES),
+    )
@@ -3,6 +3,7 @@ import os
 
 from src.config import settings
 from src.modules.models.model_manager import model_manager
+from src.utils import token_utils
 
 
 def _setup_logging():
@@ -20,6 +21,9 @@ def preload_models():
     except Exception as e:
         logging.error(f"Model preload failed: {e}")
         raise
+    # Токенизатор бюджетов контекста: без него — оценка по символам
+    if token_utils.load_encoding() is not None:
+        logging.info("✓ Tokenizer loaded")
 
 
 if __name__ == "__main__":
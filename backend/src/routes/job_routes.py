@@ -0,0 +1,78 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+
+from src.auth.dependencies import get_current_user_id_optional
+from src.schemas.presentation_schemas import GeneratePresInSchema
+from src.services.convert_file_service import convert_files
+from src.services.job_queue_service import job_queue
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+
+def _own_job(job_id: str, user_id: int | None) -> dict:
+    job = job_queue.get(job_id)
+    owner = job["user_id"] if job else None
+    if job is None or (owner is not None and user_id != owner):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.post("/generate", status_code=202)
+async def submit_generation(
+    text: Annotated[str, Form(min_length=1)],
+    file: Annotated[list[UploadFile], File()],
+    model: Annotated[str, Form()] = "",
+    user_id: int | None = Depends(get_current_user_id_optional),
+) -> dict:
+    body = GeneratePresInSchema(text=text, model=model)
+
+    context = await convert_files(file)
+
+    job_id = job_queue.submit_generation(body.text, context, body.model, user_id)
+    return {"job_id": job_id, "status": "queued"}
+
+
+@router.get("/{job_id}")
+def job_status(
+    job_id: str,
+    user_id: int | None = Depends(get_current_user_id_optional),
+) -> dict:
+    return _own_job(job_id, user_id)
+
+
+@router.post("/{job_id}/cancel")
+async def cancel_job(
+    job_id: str,
+    user_id: int | None = Depends(get_current_user_id_optional),
+) -> dict:
+    _own_job(job_id, user_id)
+    if not await job_queue.cancel(job_id):
+        raise HTTPException(status_code=409, detail="Job already finished")
+    return {"job_id": job_id, "status": "cancelled"}
+
+
+@router.get("/{job_id}/events")
+def job_events(
+    job_id: str,
+    after: int = 0,
+    user_id: int | None = Depends(get_current_user_id_optional),
+) -> list[dict]:
+    _own_job(job_id, user_id)
+    return job_queue.events(job_id, after)
+
+
+@router.get("/{job_id}/stream")
+async def stream_job(
+    job_id: str,
+    user_id: int | None = Depends(get_current_user_id_optional),
+) -> StreamingResponse:
+    _own_job(job_id, user_id)
+
+    async def markdown():
+        async for event in job_queue.astream_events(job_id):
+            if event["type"] == "slide":
+                yield event["markdown"]
+
+    return StreamingResponse(markdown(), media_type="text/markdown")
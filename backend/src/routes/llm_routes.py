@@ -0,0 +1,78 @@
+import secrets
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+
+from src.auth.dependencies import get_current_user
+from src.config import settings
+from src.schemas.user_schemas import User
+from src.services.circuit_breaker_service import circuit_breakers
+from src.services.llm_cache_service import llm_cache_service
+from src.services.llm_metrics_service import llm_metrics_service
+from src.services.llm_scheduler_service import llm_scheduler
+from src.services.llm_usage_service import llm_usage_service
+from src.services.model_router_service import model_router
+from src.services.pipeline_registry_service import pipeline_registry
+
+router = APIRouter(prefix="/llm", tags=["LLM"])
+
+
+def require_admin_token(x_admin_token: str | None = Header(None)) -> None:
+    expected = settings.LLM_ADMIN_TOKEN
+    if not expected or not secrets.compare_digest(x_admin_token or "", expected):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+@router.get("/cache")
+def cache_stats() -> dict:
+    return llm_cache_service.stats()
+
+
+@router.delete("/cache", dependencies=[Depends(require_admin_token)])
+def clear_cache() -> dict:
+    llm_cache_service.clear()
+    return {"detail": "LLM cache cleared"}
+
+
+@router.get("/scheduler")
+def scheduler_stats() -> dict:
+    return llm_scheduler.stats()
+
+
+@router.get("/models")
+def model_stats() -> dict:
+    return model_router.stats()
+
+
+@router.get("/breakers")
+def breaker_stats() -> dict:
+    return circuit_breakers.stats()
+
+
+@router.get("/pipelines")
+def pipeline_stats() -> dict:
+    return pipeline_registry.stats()
+
+
+@router.get("/metrics")
+def metrics() -> dict:
+    return llm_metrics_service.snapshot()
+
+
+@router.get("/usage")
+def usage_stats() -> dict:
+    return llm_usage_service.stats()
+
+
+@router.get("/usage/me")
+def my_usage(current_user: User = Depends(get_current_user)) -> dict:
+    return llm_usage_service.get_user(current_user.id)
+
+
+@router.get("/usage/requests/{request_id}")
+def request_usage(
+    request_id: str, current_user: User = Depends(get_current_user)
+) -> dict:
+    usage = llm_usage_service.get_request(request_id)
+    if usage is None or usage["user_id"] not in (None, current_user.id):
+        raise HTTPException(status_code=404, detail="Request not found")
+    return usage
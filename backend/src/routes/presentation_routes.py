@@ -3,6 +3,7 @@ from fastapi import (
     APIRouter,
     HTTPException,
     Form,
+    Request,
     Response,
     UploadFile,
     File,
@@ -12,7 +13,7 @@ from sqlalchemy.orm import Session
 from fastapi import APIRouter, Depends
 from src.database import get_db
 from src.schemas.user_schemas import Presentation, User
-from src.auth.dependencies import get_current_user
+from src.auth.dependencies import get_current_user, get_current_user_id_optional
 from typing import Annotated
 import json
 from typing import Annotated
@@ -22,18 +23,36 @@ from fastapi.responses import StreamingResponse
 # Mock data
 
 import asyncio
-from typing import AsyncGenerator
+from typing import AsyncGenerator, AsyncIterator
 import random
 
 # -----
 
-from src.schemas.presentation_schemas import EditSlideInSchema, GeneratePresInSchema
-from src.services.convert_file_service import convert_file
-from src.services.model_service import generate_presentation, edit_one_slide
+from src.schemas.presentation_schemas import (
+    EditSlideInSchema,
+    EditSlidesInSchema,
+    GeneratePresInSchema,
+)
+from src.services.convert_file_service import convert_files, convert_many
+from src.services.generation_checkpoint_service import generation_checkpoints
+from src.services.llm_metrics_service import llm_metrics_service
+from src.services.pipeline_registry_service import pipeline_registry
+from src.services.model_service import (
+    astream_edit_slides,
+    astream_presentation,
+    generate_presentation,
+    edit_one_slide,
+    regenerate_slides,
+    resume_presentation,
+)
 
 
 from src.schemas.presentation_schema import SavePresentationSchema
 from uuid import uuid4
+from contextlib import aclosing
+from fastapi import WebSocketDisconnect
+from pydantic import ValidationError
+from src.utils import async_utils
 
 
 router = APIRouter(prefix="/presentation")
@@ -113,27 +132,252 @@ def save_presentation(
     return {"id": pres.id, "message": "Presentation saved"}
 
 
+async def _client_disconnected(request: Request) -> None:
+    # Тело уже прочитано: следующее сообщение ASGI — обрыв соединения
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+    llm_metrics_service.incr("requests.disconnected")
+
+
+def _until_disconnected(request: Request, chunks: AsyncIterator) -> AsyncIterator:
+    """
+    Stops the stream as soon as the client goes away. Otherwise the pipeline
+    would keep generating (and paying for) slides nobody reads, until the
+    next write failed or the abandoned generator was collected.
+    """
+    return async_utils.until(chunks, _client_disconnected(request))
+
+
 @router.post("/generate", status_code=201)
 async def generate(
+    request: Request,
     text: Annotated[str, Form(min_length=1)],
-    file: Annotated[UploadFile, File()],
+    # Несколько полей file: документы разбираются параллельно в один контекст
+    file: Annotated[list[UploadFile], File()],
     model: Annotated[str, Form()] = "",
+    user_id: int | None = Depends(get_current_user_id_optional),
 ) -> Response:
     body = GeneratePresInSchema(text=text, model=model)
 
-    context = await convert_file(file)
+    context = await convert_files(file)
+
+    request_id = uuid4().hex
+    return StreamingResponse(
+        _until_disconnected(
+            request,
+            generate_presentation(body.text, context, body.model, request_id, user_id),
+        ),
+        media_type="text/markdown",
+        headers={
+            "X-Request-ID": request_id,
+            "X-Generation-ID": request_id,
+            # Передаётся в /edit, чтобы правки шли по уже проиндексированному документу
+            "X-Document-ID": pipeline_registry.document_id(context),
+        },
+    )
+
 
+def _own_checkpoint(generation_id: str, user_id: int | None) -> dict:
+    checkpoint = generation_checkpoints.summary(generation_id)
+    owner = checkpoint["user_id"] if checkpoint else None
+    if checkpoint is None or (owner is not None and user_id != owner):
+        raise HTTPException(status_code=404, detail="Generation not found")
+    return checkpoint
+
+
+@router.get("/generate/{generation_id}")
+def generation_status(
+    generation_id: str,
+    user_id: int | None = Depends(get_current_user_id_optional),
+):
+    return _own_checkpoint(generation_id, user_id)
+
+
+@router.post("/generate/{generation_id}/resume", status_code=201)
+async def resume_generation(
+    request: Request,
+    generation_id: str,
+    user_id: int | None = Depends(get_current_user_id_optional),
+) -> Response:
+    await asyncio.to_thread(_own_checkpoint, generation_id, user_id)
+
+    request_id = uuid4().hex
     return StreamingResponse(
-        generate_presentation(body.text, context, body.model),
+        _until_disconnected(
+            request, resume_presentation(generation_id, request_id, user_id)
+        ),
         media_type="text/markdown",
+        headers={"X-Request-ID": request_id, "X-Generation-ID": generation_id},
+    )
+
+
+@router.post("/generate/{generation_id}/regenerate")
+async def regenerate_generation_slides(
+    generation_id: str,
+    user_id: int | None = Depends(get_current_user_id_optional),
+) -> dict:
+    """
+    Regenerates all slides of a generation, reusing its outline and the
+    indexed document. Returns {"generation_id", "markdown", "timings"}.
+    """
+    await asyncio.to_thread(_own_checkpoint, generation_id, user_id)
+
+    return await regenerate_slides(generation_id, uuid4().hex, user_id)
+
+
+@router.websocket("/ws/generate")
+async def generate_ws(
+    websocket: WebSocket,
+    user_id: int | None = Depends(get_current_user_id_optional),
+):
+    """
+    Typed generation events (audience, outline, slide_started, slide_token,
+    chart_done, slide_done, slide_failed, timing) as JSON messages. The client
+    starts with {"type": "start", "text", "model", "filenames"} followed by
+    each file as a binary message (or "context" as plain text), then may send
+    {"type": "cancel"} or {"type": "prioritize", "slide_id": N} at any time.
+    Slides are interleaved unless the start message sets "ordered": true.
+    """
+    await websocket.accept()
+    try:
+        start = await websocket.receive_json()
+        body = GeneratePresInSchema(
+            text=start.get("text", ""), model=start.get("model", "")
+        )
+        filenames = start.get("filenames") or (
+            [start["filename"]] if start.get("filename") else []
+        )
+        if filenames:
+            contents = [await websocket.receive_bytes() for _ in filenames]
+            context = await convert_many(list(zip(filenames, contents)))
+        else:
+            context = str(start.get("context", ""))
+    except WebSocketDisconnect:
+        return
+    except (ValidationError, HTTPException, ValueError) as e:
+        await websocket.send_json(
+            {"type": "error", "detail": str(getattr(e, "detail", e))}
+        )
+        await websocket.close(code=1003)
+        return
+
+    request_id = uuid4().hex
+    # Слайды вне очереди: генератор читает список, клиент его пополняет
+    priority: list[int] = []
+    events = astream_presentation(
+        body.text,
+        context,
+        body.model,
+        request_id,
+        user_id,
+        ordered=bool(start.get("ordered", False)),
+        priority=priority,
     )
 
+    async def pump() -> None:
+        async with aclosing(events):
+            async for event in events:
+                await websocket.send_json(event)
+
+    async def listen() -> None:
+        while True:
+            message = await websocket.receive_json()
+            if message.get("type") == "cancel":
+                return
+            if message.get("type") == "prioritize":
+                slide_id = int(message.get("slide_id", 0))
+                if slide_id in priority:
+                    priority.remove(slide_id)
+                priority.insert(0, slide_id)
+
+    await websocket.send_json(
+        {
+            "type": "accepted",
+            "request_id": request_id,
+            "generation_id": request_id,
+            "document_id": pipeline_registry.document_id(context),
+        }
+    )
+    generation = asyncio.create_task(pump())
+    commands = asyncio.create_task(listen())
+    await asyncio.wait({generation, commands}, return_when=asyncio.FIRST_COMPLETED)
+    for task in (generation, commands):
+        task.cancel()
+    await asyncio.gather(generation, commands, return_exceptions=True)
+
+    # Обрыв соединения отменяет генерацию; её можно возобновить по generation_id
+    errors = [t.exception() for t in (generation, commands) if not t.cancelled()]
+    if any(isinstance(e, WebSocketDisconnect) for e in errors):
+        return
+    error = next((e for e in errors if e is not None), None)
+    if error is not None:
+        message = {"type": "error", "detail": str(error)}
+    elif generation.cancelled():
+        message = {"type": "cancelled"}
+    else:
+        message = {"type": "done"}
+    try:
+        await websocket.send_json(message)
+        await websocket.close()
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+
 
 @router.post("/edit", status_code=200)
-async def edit(body: EditSlideInSchema) -> Response:
-    model_res = edit_one_slide(body.text, body.slide, body.action, body.model)
+async def edit(
+    body: EditSlideInSchema,
+    user_id: int | None = Depends(get_current_user_id_optional),
+) -> Response:
+    request_id = uuid4().hex
+    model_res = await edit_one_slide(
+        body.text,
+        body.slide.model_dump(),
+        body.action,
+        body.model,
+        request_id,
+        user_id,
+        document_id=body.document_id,
+    )
+
+    return Response(
+        content=model_res,
+        media_type="text/markdown",
+        headers={"X-Request-ID": request_id},
+    )
+
 
-    return Response(content=model_res, media_type="text/markdown")
+@router.post("/edit/batch", status_code=200)
+async def edit_batch(
+    request: Request,
+    body: EditSlidesInSchema,
+    user_id: int | None = Depends(get_current_user_id_optional),
+) -> Response:
+    """
+    Applies one action to many slides concurrently. Streams NDJSON, one line
+    per slide in completion order: {"slide_id", "content"} or {"slide_id",
+    "error"}.
+    """
+    request_id = uuid4().hex
+    results = astream_edit_slides(
+        body.text,
+        [slide.model_dump() for slide in body.slides],
+        body.action,
+        body.model,
+        request_id,
+        user_id,
+        document_id=body.document_id,
+    )
+
+    async def lines():
+        async with aclosing(results):
+            async for result in results:
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(
+        _until_disconnected(request, lines()),
+        media_type="application/x-ndjson",
+        headers={"X-Request-ID": request_id},
+    )
 
 
 # Mock Processing
@@ -0,0 +1,51 @@
+from sqlalchemy import Column, Float, ForeignKey, Integer, JSON, String, Text
+
+from src.database import Base
+
+
+class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+
+    id = Column(String, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=True, index=True)
+    status = Column(String, nullable=False, default="queued", index=True)
+    payload = Column(JSON, nullable=False)
+    error = Column(Text, nullable=True)
+    worker = Column(String, nullable=True)
+    locked_until = Column(Float, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    created_at = Column(Float, nullable=False)
+    started_at = Column(Float, nullable=True)
+    finished_at = Column(Float, nullable=True)
+
+
+class GenerationJobEvent(Base):
+    __tablename__ = "generation_job_events"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_id = Column(
+        String, ForeignKey("generation_jobs.id", ondelete="CASCADE"), index=True
+    )
+    event = Column(JSON, nullable=False)
+
+
+class GenerationCheckpoint(Base):
+    __tablename__ = "generation_checkpoints"
+
+    id = Column(String, primary_key=True, index=True)
+    # Запрос, классификация, план и статус; контекст пишется один раз отдельно
+    value = Column(JSON, nullable=False)
+    context = Column(Text, nullable=False)
+    expires_at = Column(Float, nullable=False, index=True)
+
+
+class GenerationCheckpointSlide(Base):
+    __tablename__ = "generation_checkpoint_slides"
+
+    generation_id = Column(
+        String,
+        ForeignKey("generation_checkpoints.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    slide_id = Column(Integer, primary_key=True)
+    value = Column(JSON, nullable=False)
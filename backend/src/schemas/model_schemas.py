@@ -1,4 +1,4 @@
-from typing import Annotated, Any
+from typing import Annotated, Any, Literal
 
 from pydantic import BaseModel, Field, field_validator, model_validator
 
@@ -42,6 +42,40 @@ class SlideItem(BaseModel):
     content: Annotated[str, Field(min_length=1)]
 
 
+class SlideContentOut(SlideItem):
+    """Schema for a generated slide (SLIDE_PROMPT_TEMPLATE output)"""
+    used_facts: list[str] = []
+
+
+class SlidesBatchOut(BaseModel):
+    """Schema for BATCH_SLIDE_PROMPT_TEMPLATE output"""
+    slides: list[SlideContentOut]
+
+
+class SlideEditOut(SlideItem):
+    """Schema for SINGLE_SLIDE_EDIT_PROMPT output"""
+    edits_applied: list[str] = []
+    assets: list[dict] = []
+    requires_external_data: bool = False
+    explanation: str = ""
+
+
+class ChartSpec(BaseModel):
+    type: Literal["bar", "line", "pie"]
+    title: str
+    labels: list[str]
+    values: list[float]
+    reason: str = ""
+    used_facts: list[dict] = []
+
+
+class ChartsOut(BaseModel):
+    """Schema for CHART_GENERATOR_PROMPT output"""
+    charts: Annotated[list[ChartSpec], Field(max_length=2)] = []
+    explanation: str = ""
+    errors: list[str] = []
+
+
 class StructureOut(BaseModel):
     """Output from planner - just structure"""
     slides: Annotated[
@@ -24,17 +24,30 @@ class GeneratePresInSchema(_BaseModelReqSchema):
     text: Annotated[str, Field(min_length=1)]
 
 
-class EditSlideInSchema(_BaseModelReqSchema):
+class _BaseEditReqSchema(_BaseModelReqSchema):
     text: str = ""
     action: ModelAction
-    slide: SlideItem
+    # X-Document-ID из /generate: правка использует индекс этого документа
+    # (только своего — чужой id даёт пустой индекс)
+    document_id: str | None = None
 
     @model_validator(mode="after")
-    def check_action(self) -> EditSlideInSchema:
+    def check_action(self) -> _BaseEditReqSchema:
         if (self.action == ModelAction.CUSTOM) and not self.text.strip():
             raise ValueError("При кастомном запросе промпт не может быть пустым!")
 
         return self
 
 
+class EditSlideInSchema(_BaseEditReqSchema):
+    slide: SlideItem
+
+
+class EditSlidesInSchema(_BaseEditReqSchema):
+    slides: Annotated[
+        list[SlideItem], Field(min_length=1, max_length=settings.MAX_BATCH_EDIT_SLIDES)
+    ]
+
+
 EditSlideInSchema.model_rebuild()
+EditSlidesInSchema.model_rebuild()
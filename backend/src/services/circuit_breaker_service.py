@@ -0,0 +1,143 @@
+from collections import deque
+import logging
+import time
+
+from src.config import settings
+from src.services.llm_metrics_service import llm_metrics_service
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class _Breaker:
+    def __init__(self) -> None:
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.rejected = 0
+        self.times_opened = 0
+
+
+class _CircuitBreakerService:
+    """
+    Per-model circuit breakers (closed -> open -> half-open) and a global
+    retry budget for upstream LLM calls. An open breaker rejects calls
+    immediately so the caller fails over instead of waiting on timeouts;
+    after LLM_BREAKER_OPEN_SECONDS a single probe decides whether to close.
+    """
+
+    _breakers: dict[str, _Breaker]
+    _requests: deque[float]
+    _retries: deque[float]
+
+    def __init__(self) -> None:
+        self._breakers = {}
+        self._requests = deque()
+        self._retries = deque()
+        self.retries_denied = 0
+
+    def _get(self, model: str) -> _Breaker:
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            breaker = self._breakers[model] = _Breaker()
+        return breaker
+
+    def _cooled(self, breaker: _Breaker) -> bool:
+        elapsed = time.monotonic() - breaker.opened_at
+        return elapsed >= settings.LLM_BREAKER_OPEN_SECONDS
+
+    def available(self, model: str) -> bool:
+        """Side-effect free check used by the router to order candidates."""
+        breaker = self._get(model)
+        if breaker.state == OPEN:
+            return self._cooled(breaker)
+        return breaker.state == CLOSED or not breaker.probing
+
+    def allow(self, model: str) -> bool:
+        breaker = self._get(model)
+        if breaker.state == OPEN and self._cooled(breaker):
+            breaker.state = HALF_OPEN
+            breaker.probing = False
+        if breaker.state == CLOSED:
+            return True
+        if breaker.state == HALF_OPEN and not breaker.probing:
+            breaker.probing = True
+            return True
+        breaker.rejected += 1
+        llm_metrics_service.incr("breaker.rejected")
+        return False
+
+    def record_success(self, model: str) -> None:
+        breaker = self._get(model)
+        if breaker.state != CLOSED:
+            logging.info(f"Circuit breaker: {model} closed")
+        breaker.state = CLOSED
+        breaker.failures = 0
+        breaker.probing = False
+
+    def record_failure(self, model: str) -> None:
+        breaker = self._get(model)
+        breaker.failures += 1
+        breaker.probing = False
+        if breaker.state == HALF_OPEN or (
+            breaker.state == CLOSED
+            and breaker.failures >= settings.LLM_BREAKER_FAILURE_THRESHOLD
+        ):
+            breaker.state = OPEN
+            breaker.opened_at = time.monotonic()
+            breaker.times_opened += 1
+            llm_metrics_service.incr("breaker.opened")
+            logging.warning(f"Circuit breaker: {model} opened")
+
+    def release(self, model: str) -> None:
+        # Пробный вызов отменён (например, проигравший хедж) — без вердикта
+        self._get(model).probing = False
+
+    def _trim(self, now: float) -> None:
+        horizon = now - settings.LLM_RETRY_BUDGET_WINDOW
+        for window in (self._requests, self._retries):
+            while window and window[0] < horizon:
+                window.popleft()
+
+    def record_request(self) -> None:
+        now = time.monotonic()
+        self._trim(now)
+        self._requests.append(now)
+
+    def try_retry(self) -> bool:
+        # Повторов в окне не больше доли от запросов (но не меньше минимума)
+        now = time.monotonic()
+        self._trim(now)
+        budget = max(
+            settings.LLM_RETRY_BUDGET_MIN,
+            settings.LLM_RETRY_BUDGET_RATIO * len(self._requests),
+        )
+        if len(self._retries) + 1 > budget:
+            self.retries_denied += 1
+            llm_metrics_service.incr("retry.budget_exhausted")
+            return False
+        self._retries.append(now)
+        return True
+
+    def stats(self) -> dict:
+        self._trim(time.monotonic())
+        return {
+            "retry_budget": {
+                "requests": len(self._requests),
+                "retries": len(self._retries),
+                "denied": self.retries_denied,
+                "ratio": settings.LLM_RETRY_BUDGET_RATIO,
+            },
+            "models": {
+                model: {
+                    "state": breaker.state,
+                    "failures": breaker.failures,
+                    "rejected": breaker.rejected,
+                    "times_opened": breaker.times_opened,
+                }
+                for model, breaker in self._breakers.items()
+            },
+        }
+
+
+circuit_breakers = _CircuitBreakerService()
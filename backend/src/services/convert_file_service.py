@@ -1,27 +1,139 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import logging
+import multiprocessing
 import os
 import tempfile
 
 from fastapi import UploadFile, HTTPException
 
-from src.utils import file_utils
+from src.config import settings
+from src.utils import file_utils, text_utils
 from src.modules.parsers.documents_parser import markdown_parser
 
+_pool: ProcessPoolExecutor | None = None
 
-async def convert_file(file: UploadFile) -> str:
-    file_ext = file_utils.get_file_ext(file.filename)
 
+def _parse(path: str) -> str:
+    return markdown_parser.parse(path)
+
+
+def _parser_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # Разбор PDF/XLSX упирается в GIL — отдельные процессы; spawn, т.к. fork
+        # процесса с потоками и event loop небезопасен
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.DOCUMENT_PARSE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def _ready() -> None:
+    pass
+
+
+def warm_parser_pool() -> None:
+    """Starts the parser processes in the background (imports take seconds)."""
+    pool = _parser_pool()
+    for _ in range(settings.DOCUMENT_PARSE_WORKERS):
+        pool.submit(_ready)
+
+
+def _discard_pool(pool: ProcessPoolExecutor, kill: bool = False) -> None:
+    global _pool
+    # Пул мог уже смениться: сломанный старый сбрасывает только первый заметивший
+    if _pool is pool:
+        _pool = None
+    if kill:
+        # Зависший разбор не отменить: останавливаем процессы пула
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_parser_pool() -> None:
+    if _pool is not None:
+        _discard_pool(_pool)
+
+
+async def _parse_in_pool(filename: str, path: str) -> str:
+    """
+    Parses in the process pool. A crashed worker (OOM, segfault on a broken
+    file) breaks the whole pool: it is recreated and the file retried once.
+    """
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        pool = _parser_pool()
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(pool, _parse, path),
+                settings.DOCUMENT_PARSE_TIMEOUT_SECONDS,
+            )
+        except asyncio.TimeoutError:
+            logging.warning(f"Parsing {filename} timed out, restarting parser pool")
+            _discard_pool(pool, kill=True)
+            raise HTTPException(
+                status_code=422,
+                detail=f"Файл {filename} не удалось разобрать за отведённое время",
+            )
+        except BrokenProcessPool:
+            logging.warning(f"Parser pool broke on {filename} (attempt {attempt + 1})")
+            _discard_pool(pool)
+    raise HTTPException(status_code=422, detail=f"Не удалось разобрать файл {filename}")
+
+
+def _check_format(filename: str) -> str:
+    file_ext = file_utils.get_file_ext(filename)
     if file_ext not in markdown_parser.allowed_formats:
         raise HTTPException(status_code=400, detail="Неподдерживаемый формат")
+    return file_ext
+
+
+async def convert_file(file: UploadFile) -> str:
+    return await convert_bytes(file.filename, await file.read())
+
+
+async def convert_bytes(filename: str, content: bytes) -> str:
+    file_ext = _check_format(filename)
 
     with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_ext}") as tmp_file:
-        content = await file.read()
         tmp_file.write(content)
         tmp_file.flush()
         tmp_file_path = tmp_file.name
 
     try:
-        md_text = markdown_parser.parse(tmp_file_path)
+        md_text = await _parse_in_pool(filename, tmp_file_path)
     finally:
         os.unlink(tmp_file_path)
 
     return md_text
+
+
+async def convert_files(files: list[UploadFile]) -> str:
+    return await convert_many([(file.filename, await file.read()) for file in files])
+
+
+async def convert_many(files: list[tuple[str, bytes]]) -> str:
+    """
+    Parses several files concurrently into one generation context; each file
+    keeps its name as the source of its chunks (see text_utils.join_sources).
+    """
+    if not files:
+        raise HTTPException(status_code=400, detail="Файлы не переданы")
+    if len(files) > settings.MAX_UPLOAD_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Не больше {settings.MAX_UPLOAD_FILES} файлов за раз",
+        )
+    # Формат проверяем до разбора, чтобы не парсить зря остальные файлы
+    for filename, _ in files:
+        _check_format(filename)
+    texts = await asyncio.gather(
+        *(convert_bytes(filename, content) for filename, content in files)
+    )
+    return text_utils.join_sources(
+        [(filename, text) for (filename, _), text in zip(files, texts)]
+    )
@@ -0,0 +1,388 @@
+from collections import OrderedDict
+import copy
+import json
+import logging
+from pathlib import Path
+import sqlite3
+import threading
+import time
+
+from src.config import settings
+from src.database import Base, SessionLocal, engine
+from src.schemas.job_schemas import GenerationCheckpoint, GenerationCheckpointSlide
+
+
+def _header(checkpoint: dict) -> dict:
+    return {k: v for k, v in checkpoint.items() if k not in ("context", "slides")}
+
+
+class _SqliteCheckpointStore:
+    """Checkpoints of this process in a SQLite file, to survive restarts."""
+
+    # Пишет только этот процесс: копия в памяти остаётся актуальной
+    shared = False
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        # Старый формат (весь чекпоинт одним JSON) не переносим: он временный
+        columns = [
+            row[1]
+            for row in self._db.execute("PRAGMA table_info(generation_checkpoints)")
+        ]
+        if columns and "context" not in columns:
+            self._db.execute("DROP TABLE generation_checkpoints")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS generation_checkpoints (id TEXT PRIMARY KEY, "
+            "value TEXT NOT NULL, context TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS generation_checkpoint_slides "
+            "(generation_id TEXT NOT NULL, slide_id INTEGER NOT NULL, "
+            "value TEXT NOT NULL, PRIMARY KEY (generation_id, slide_id))"
+        )
+        self._db.commit()
+
+    def load(self, generation_id: str) -> tuple[dict, float] | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, context, expires_at FROM generation_checkpoints "
+                "WHERE id = ?",
+                (generation_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            slides = self._db.execute(
+                "SELECT value FROM generation_checkpoint_slides "
+                "WHERE generation_id = ? ORDER BY slide_id",
+                (generation_id,),
+            ).fetchall()
+        try:
+            checkpoint = json.loads(row[0])
+            checkpoint["slides"] = [json.loads(slide) for (slide,) in slides]
+        except json.JSONDecodeError:
+            return None
+        checkpoint["context"] = row[1]
+        return checkpoint, row[2]
+
+    def create(self, checkpoint: dict, expires_at: float) -> None:
+        generation_id = checkpoint["generation_id"]
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM generation_checkpoint_slides WHERE generation_id = ?",
+                (generation_id,),
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO generation_checkpoints VALUES (?, ?, ?, ?)",
+                (
+                    generation_id,
+                    json.dumps(_header(checkpoint), ensure_ascii=False),
+                    checkpoint["context"],
+                    expires_at,
+                ),
+            )
+            self._db.commit()
+
+    def update(self, generation_id: str, fields: dict, expires_at: float) -> bool:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM generation_checkpoints WHERE id = ?",
+                (generation_id,),
+            ).fetchone()
+            if row is None:
+                return False
+            header = {**json.loads(row[0]), **fields}
+            self._db.execute(
+                "UPDATE generation_checkpoints SET value = ?, expires_at = ? "
+                "WHERE id = ?",
+                (json.dumps(header, ensure_ascii=False), expires_at, generation_id),
+            )
+            self._db.commit()
+            return True
+
+    def add_slide(self, generation_id: str, slide: dict, expires_at: float) -> bool:
+        with self._lock:
+            updated = self._db.execute(
+                "UPDATE generation_checkpoints SET expires_at = ? WHERE id = ?",
+                (expires_at, generation_id),
+            ).rowcount
+            if updated:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO generation_checkpoint_slides "
+                    "VALUES (?, ?, ?)",
+                    (
+                        generation_id,
+                        slide["slide_id"],
+                        json.dumps(slide, ensure_ascii=False),
+                    ),
+                )
+            self._db.commit()
+            return bool(updated)
+
+    def purge(self, now: float) -> int:
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM generation_checkpoint_slides WHERE generation_id IN "
+                "(SELECT id FROM generation_checkpoints WHERE expires_at < ?)",
+                (now,),
+            )
+            deleted = self._db.execute(
+                "DELETE FROM generation_checkpoints WHERE expires_at < ?", (now,)
+            ).rowcount
+            self._db.commit()
+            return deleted
+
+
+class _DatabaseCheckpointStore:
+    """
+    Checkpoints in the application database, shared by the API and all job
+    workers: a job picked up by another worker continues from its slides.
+    """
+
+    # Пишут разные процессы: читаем всегда из базы
+    shared = True
+
+    def __init__(self) -> None:
+        Base.metadata.create_all(
+            engine,
+            tables=[
+                GenerationCheckpoint.__table__,
+                GenerationCheckpointSlide.__table__,
+            ],
+        )
+
+    def load(self, generation_id: str) -> tuple[dict, float] | None:
+        with SessionLocal() as db:
+            row = db.query(GenerationCheckpoint).filter_by(id=generation_id).first()
+            if row is None:
+                return None
+            slides = (
+                db.query(GenerationCheckpointSlide.value)
+                .filter_by(generation_id=generation_id)
+                .order_by(GenerationCheckpointSlide.slide_id)
+                .all()
+            )
+            checkpoint = {
+                **row.value,
+                "context": row.context,
+                "slides": [slide for (slide,) in slides],
+            }
+            return checkpoint, row.expires_at
+
+    def create(self, checkpoint: dict, expires_at: float) -> None:
+        generation_id = checkpoint["generation_id"]
+        with SessionLocal() as db:
+            db.query(GenerationCheckpointSlide).filter_by(
+                generation_id=generation_id
+            ).delete()
+            db.merge(
+                GenerationCheckpoint(
+                    id=generation_id,
+                    value=_header(checkpoint),
+                    context=checkpoint["context"],
+                    expires_at=expires_at,
+                )
+            )
+            db.commit()
+
+    def update(self, generation_id: str, fields: dict, expires_at: float) -> bool:
+        with SessionLocal() as db:
+            row = (
+                db.query(GenerationCheckpoint)
+                .filter_by(id=generation_id)
+                .with_for_update()
+                .first()
+            )
+            if row is None:
+                return False
+            row.value = {**row.value, **fields}
+            row.expires_at = expires_at
+            db.commit()
+            return True
+
+    def add_slide(self, generation_id: str, slide: dict, expires_at: float) -> bool:
+        # Слайд — отдельная строка: чекпоинт целиком (с контекстом) не переписываем
+        with SessionLocal() as db:
+            updated = (
+                db.query(GenerationCheckpoint)
+                .filter_by(id=generation_id)
+                .update({"expires_at": expires_at})
+            )
+            if updated:
+                db.merge(
+                    GenerationCheckpointSlide(
+                        generation_id=generation_id,
+                        slide_id=slide["slide_id"],
+                        value=slide,
+                    )
+                )
+            db.commit()
+            return bool(updated)
+
+    def purge(self, now: float) -> int:
+        with SessionLocal() as db:
+            expired = db.query(GenerationCheckpoint.id).filter(
+                GenerationCheckpoint.expires_at < now
+            )
+            db.query(GenerationCheckpointSlide).filter(
+                GenerationCheckpointSlide.generation_id.in_(expired.scalar_subquery())
+            ).delete(synchronize_session=False)
+            deleted = db.query(GenerationCheckpoint).filter(
+                GenerationCheckpoint.expires_at < now
+            ).delete(synchronize_session=False)
+            db.commit()
+            return deleted
+
+
+class _GenerationCheckpointService:
+    """
+    Server-side checkpoints of streamed generations: the request, classifier
+    and planner output and every completed slide, keyed by generation id, so
+    a dropped stream can be resumed without paying for finished slides again.
+    In-memory with TTL, optionally backed by a SQLite file (survives restarts)
+    or by the shared database (resumable from any process). Stores write the
+    context once and each slide as its own row. Calls block on the store:
+    async code runs them in a thread.
+    """
+
+    _memory: OrderedDict[str, tuple[float, dict]]
+    _backend: _SqliteCheckpointStore | _DatabaseCheckpointStore | None
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: int,
+        store: _SqliteCheckpointStore | _DatabaseCheckpointStore | None = None,
+    ) -> None:
+        self._max_entries = max_entries
+        self._ttl = ttl_seconds
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._backend = store
+
+        if store is not None:
+            deleted = store.purge(time.time())
+            if deleted:
+                logging.info(f"Checkpoints: purged {deleted} expired generations")
+
+    def start(
+        self,
+        generation_id: str,
+        user_id: int | None,
+        prompt: str,
+        model: str,
+        context: str,
+    ) -> None:
+        checkpoint = {
+            "generation_id": generation_id,
+            "user_id": user_id,
+            "prompt": prompt,
+            "model": model,
+            "context": context,
+            "status": "running",
+            "classification": None,
+            "outline": None,
+            "slides": [],
+            "created_at": time.time(),
+        }
+        expires_at = time.time() + self._ttl
+        with self._lock:
+            if not self._shared:
+                self._remember(checkpoint, expires_at)
+            if self._backend is not None:
+                self._backend.create(checkpoint, expires_at)
+
+    def save_classification(self, generation_id: str, classification: dict) -> None:
+        self._update(generation_id, classification=classification)
+
+    def save_outline(self, generation_id: str, outline: list[dict]) -> None:
+        self._update(generation_id, outline=outline)
+
+    def save_slide(self, generation_id: str, slide: dict) -> None:
+        expires_at = time.time() + self._ttl
+        with self._lock:
+            if not self._shared:
+                checkpoint = self._load(generation_id)
+                if checkpoint is None:
+                    return
+                slides = {s["slide_id"]: s for s in checkpoint["slides"]}
+                slides[slide["slide_id"]] = slide
+                checkpoint["slides"] = [slides[k] for k in sorted(slides)]
+                self._remember(checkpoint, expires_at)
+            if self._backend is not None:
+                self._backend.add_slide(generation_id, slide, expires_at)
+
+    def finish(self, generation_id: str, status: str = "done") -> None:
+        self._update(generation_id, status=status)
+
+    def get(self, generation_id: str) -> dict | None:
+        with self._lock:
+            return copy.deepcopy(self._load(generation_id))
+
+    def summary(self, generation_id: str) -> dict | None:
+        """Checkpoint without the document context, for status endpoints."""
+        checkpoint = self.get(generation_id)
+        if checkpoint is None:
+            return None
+        checkpoint.pop("context", None)
+        checkpoint["slides_done"] = len(checkpoint.pop("slides"))
+        return checkpoint
+
+    def _update(self, generation_id: str, **fields) -> None:
+        expires_at = time.time() + self._ttl
+        with self._lock:
+            if not self._shared:
+                checkpoint = self._load(generation_id)
+                if checkpoint is None:
+                    return
+                checkpoint.update(fields)
+                self._remember(checkpoint, expires_at)
+            if self._backend is not None:
+                self._backend.update(generation_id, fields, expires_at)
+
+    @property
+    def _shared(self) -> bool:
+        return self._backend is not None and self._backend.shared
+
+    def _load(self, generation_id: str) -> dict | None:
+        now = time.time()
+        shared = self._shared
+        item = None if shared else self._memory.get(generation_id)
+        if item is not None:
+            expires_at, checkpoint = item
+            if expires_at >= now:
+                self._memory.move_to_end(generation_id)
+                return checkpoint
+            del self._memory[generation_id]
+        if self._backend is None:
+            return None
+        row = self._backend.load(generation_id)
+        if row is None or row[1] < now:
+            return None
+        checkpoint, expires_at = row
+        if not shared:
+            self._remember(checkpoint, expires_at)
+        return checkpoint
+
+    def _remember(self, checkpoint: dict, expires_at: float) -> None:
+        self._memory[checkpoint["generation_id"]] = (expires_at, checkpoint)
+        self._memory.move_to_end(checkpoint["generation_id"])
+        while len(self._memory) > self._max_entries:
+            self._memory.popitem(last=False)
+
+
+def _checkpoint_store() -> _SqliteCheckpointStore | _DatabaseCheckpointStore | None:
+    # Общую очередь задач разбирают разные процессы: чекпоинты — в общей базе
+    if settings.JOB_BACKEND == "postgres":
+        return _DatabaseCheckpointStore()
+    if settings.GENERATION_CHECKPOINT_PATH is not None:
+        return _SqliteCheckpointStore(settings.GENERATION_CHECKPOINT_PATH)
+    return None
+
+
+generation_checkpoints = _GenerationCheckpointService(
+    settings.GENERATION_CHECKPOINT_MAX_ENTRIES,
+    settings.GENERATION_CHECKPOINT_TTL_SECONDS,
+    _checkpoint_store(),
+)
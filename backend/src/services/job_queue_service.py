@@ -0,0 +1,502 @@
+import asyncio
+from collections import deque
+from contextlib import aclosing
+import copy
+import logging
+import os
+import socket
+import threading
+import time
+from typing import AsyncIterator
+from uuid import uuid4
+
+from sqlalchemy import and_, func, or_
+
+from src.config import settings
+from src.database import Base, SessionLocal, engine
+from src.schemas.job_schemas import GenerationJob, GenerationJobEvent
+from src.services import model_service
+from src.services.generation_checkpoint_service import generation_checkpoints
+from src.services.llm_metrics_service import llm_metrics_service
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+CANCELLED = "cancelled"
+TERMINAL = (DONE, FAILED, CANCELLED)
+_LEASE_LOST = "Worker lost the job too many times"
+
+
+def _owns(job: dict | None, worker: str) -> bool:
+    return job is not None and job["status"] == RUNNING and job["worker"] == worker
+
+
+class _LocalJobBackend:
+    """In-process queue: jobs are only visible to this process (dev, tests)."""
+
+    _jobs: dict[str, dict]
+    _events: dict[str, list[dict]]
+    _queue: deque[str]
+
+    def __init__(self) -> None:
+        self._jobs = {}
+        self._events = {}
+        self._queue = deque()
+        self._lock = threading.Lock()
+
+    def submit(self, job_id: str, user_id: int | None, payload: dict) -> None:
+        with self._lock:
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "user_id": user_id,
+                "status": QUEUED,
+                "payload": payload,
+                "error": None,
+                "worker": None,
+                "locked_until": None,
+                "attempts": 0,
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+            }
+            self._events[job_id] = []
+            self._queue.append(job_id)
+
+    def claim(self, worker: str) -> dict | None:
+        now = time.time()
+        with self._lock:
+            self._requeue_expired(now)
+            # Отменённые в очереди задачи пропускаем
+            while self._queue and self._jobs[self._queue[0]]["status"] != QUEUED:
+                self._queue.popleft()
+            if not self._queue:
+                return None
+            job = self._jobs[self._queue.popleft()]
+            job.update(
+                status=RUNNING,
+                worker=worker,
+                started_at=now,
+                locked_until=now + settings.JOB_LEASE_SECONDS,
+                attempts=job["attempts"] + 1,
+            )
+            return copy.deepcopy(job)
+
+    def _requeue_expired(self, now: float) -> None:
+        for job in self._jobs.values():
+            if job["status"] != RUNNING or job["locked_until"] >= now:
+                continue
+            if job["attempts"] >= settings.JOB_MAX_ATTEMPTS:
+                job.update(status=FAILED, error=_LEASE_LOST, finished_at=now)
+            else:
+                job.update(status=QUEUED, worker=None, locked_until=None)
+                self._queue.appendleft(job["job_id"])
+
+    def heartbeat(self, job_id: str, worker: str) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not _owns(job, worker):
+                return False
+            job["locked_until"] = time.time() + settings.JOB_LEASE_SECONDS
+            return True
+
+    def release(self, job_id: str, worker: str) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if _owns(job, worker):
+                job.update(
+                    status=QUEUED,
+                    worker=None,
+                    locked_until=None,
+                    attempts=max(0, job["attempts"] - 1),
+                )
+                self._queue.appendleft(job_id)
+
+    def append_event(self, job_id: str, event: dict) -> None:
+        with self._lock:
+            events = self._events[job_id]
+            events.append({**event, "seq": len(events) + 1})
+
+    def finish(
+        self, job_id: str, worker: str, status: str, error: str | None = None
+    ) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not _owns(job, worker):
+                return False
+            job.update(status=status, error=error, finished_at=time.time())
+            return True
+
+    def cancel(self, job_id: str) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] in TERMINAL:
+                return False
+            job.update(status=CANCELLED, locked_until=None, finished_at=time.time())
+            return True
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return copy.deepcopy(job) if job else None
+
+    def events(self, job_id: str, after: int = 0) -> list[dict]:
+        with self._lock:
+            return copy.deepcopy(self._events.get(job_id, [])[after:])
+
+
+class _PostgresJobBackend:
+    """
+    Shared queue in the application database: any number of worker processes
+    on any node claim jobs with SELECT ... FOR UPDATE SKIP LOCKED.
+    """
+
+    def __init__(self) -> None:
+        Base.metadata.create_all(
+            engine, tables=[GenerationJob.__table__, GenerationJobEvent.__table__]
+        )
+
+    def _to_dict(self, job) -> dict:
+        return {
+            "job_id": job.id,
+            "user_id": job.user_id,
+            "status": job.status,
+            "payload": job.payload,
+            "error": job.error,
+            "worker": job.worker,
+            "locked_until": job.locked_until,
+            "attempts": job.attempts,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+        }
+
+    def submit(self, job_id: str, user_id: int | None, payload: dict) -> None:
+        with SessionLocal() as db:
+            db.add(
+                GenerationJob(
+                    id=job_id,
+                    user_id=user_id,
+                    status=QUEUED,
+                    payload=payload,
+                    attempts=0,
+                    created_at=time.time(),
+                )
+            )
+            db.commit()
+
+    def claim(self, worker: str) -> dict | None:
+        with SessionLocal() as db:
+            while True:
+                now = time.time()
+                # Задача умершего воркера (аренда истекла) забирается как новая
+                job = (
+                    db.query(GenerationJob)
+                    .filter(
+                        or_(
+                            GenerationJob.status == QUEUED,
+                            and_(
+                                GenerationJob.status == RUNNING,
+                                GenerationJob.locked_until < now,
+                            ),
+                        )
+                    )
+                    .order_by(GenerationJob.created_at)
+                    .with_for_update(skip_locked=True)
+                    .first()
+                )
+                if job is None:
+                    return None
+                if job.status == RUNNING and job.attempts >= settings.JOB_MAX_ATTEMPTS:
+                    job.status = FAILED
+                    job.error = _LEASE_LOST
+                    job.finished_at = now
+                    db.commit()
+                    continue
+                job.status = RUNNING
+                job.worker = worker
+                job.started_at = now
+                job.locked_until = now + settings.JOB_LEASE_SECONDS
+                job.attempts += 1
+                db.commit()
+                return self._to_dict(job)
+
+    def _owned(self, db, job_id: str, worker: str):
+        return db.query(GenerationJob).filter_by(
+            id=job_id, worker=worker, status=RUNNING
+        )
+
+    def heartbeat(self, job_id: str, worker: str) -> bool:
+        with SessionLocal() as db:
+            updated = self._owned(db, job_id, worker).update(
+                {"locked_until": time.time() + settings.JOB_LEASE_SECONDS}
+            )
+            db.commit()
+            return updated == 1
+
+    def release(self, job_id: str, worker: str) -> None:
+        with SessionLocal() as db:
+            self._owned(db, job_id, worker).update(
+                {
+                    "status": QUEUED,
+                    "worker": None,
+                    "locked_until": None,
+                    "attempts": func.greatest(GenerationJob.attempts - 1, 0),
+                }
+            )
+            db.commit()
+
+    def append_event(self, job_id: str, event: dict) -> None:
+        with SessionLocal() as db:
+            db.add(GenerationJobEvent(job_id=job_id, event=event))
+            db.commit()
+
+    def finish(
+        self, job_id: str, worker: str, status: str, error: str | None = None
+    ) -> bool:
+        with SessionLocal() as db:
+            updated = self._owned(db, job_id, worker).update(
+                {"status": status, "error": error, "finished_at": time.time()}
+            )
+            db.commit()
+            return updated == 1
+
+    def cancel(self, job_id: str) -> bool:
+        # Воркер узнаёт об отмене при следующем продлении аренды
+        with SessionLocal() as db:
+            updated = (
+                db.query(GenerationJob)
+                .filter(
+                    GenerationJob.id == job_id,
+                    GenerationJob.status.in_((QUEUED, RUNNING)),
+                )
+                .update(
+                    {
+                        "status": CANCELLED,
+                        "locked_until": None,
+                        "finished_at": time.time(),
+                    },
+                    synchronize_session=False,
+                )
+            )
+            db.commit()
+            return updated == 1
+
+    def get(self, job_id: str) -> dict | None:
+        with SessionLocal() as db:
+            job = db.query(GenerationJob).filter_by(id=job_id).first()
+            return self._to_dict(job) if job else None
+
+    def events(self, job_id: str, after: int = 0) -> list[dict]:
+        # seq — id строки: монотонен в пределах задачи, хоть и не с единицы
+        with SessionLocal() as db:
+            rows = (
+                db.query(GenerationJobEvent)
+                .filter(
+                    GenerationJobEvent.job_id == job_id, GenerationJobEvent.id > after
+                )
+                .order_by(GenerationJobEvent.id)
+                .all()
+            )
+            return [{**row.event, "seq": row.id} for row in rows]
+
+
+class _JobQueueService:
+    """
+    Background generation jobs. The API only submits a job; workers (in-process
+    tasks for the local backend, `python -m src.worker` processes for postgres)
+    run the pipeline and append progress events, which clients poll or stream
+    by job id. API throughput no longer depends on LLM latency.
+    """
+
+    def __init__(self, backend: _LocalJobBackend | _PostgresJobBackend) -> None:
+        self.backend = backend
+        self._local_workers: list[asyncio.Task] = []
+        # Генерации, идущие в этом процессе: отмена останавливает их сразу
+        self._running: dict[str, asyncio.Task] = {}
+
+    def submit_generation(
+        self, prompt: str, context: str, model: str, user_id: int | None
+    ) -> str:
+        job_id = uuid4().hex
+        payload = {"prompt": prompt, "context": context, "model": model}
+        self.backend.submit(job_id, user_id, payload)
+        llm_metrics_service.incr("jobs.submitted")
+        return job_id
+
+    def get(self, job_id: str) -> dict | None:
+        """Job status and slide progress, without the document context."""
+        job = self.backend.get(job_id)
+        if job is None:
+            return None
+        job.pop("payload", None)
+        events = self.backend.events(job_id)
+        outline = next((e for e in events if e["type"] == "outline"), None)
+        job["slides_total"] = len(outline["slides"]) if outline else None
+        job["slides_done"] = sum(e["type"] == "slide" for e in events)
+        return job
+
+    def events(self, job_id: str, after: int = 0) -> list[dict]:
+        return self.backend.events(job_id, after)
+
+    async def cancel(self, job_id: str) -> bool:
+        """
+        Cancels a queued or running job. A generation running in this process
+        stops at once, in another worker process at its next lease renewal.
+        """
+        if not await asyncio.to_thread(self.backend.cancel, job_id):
+            return False
+        llm_metrics_service.incr("jobs.cancelled")
+        generation = self._running.get(job_id)
+        if generation is not None:
+            generation.cancel()
+        return True
+
+    async def astream_events(self, job_id: str, after: int = 0) -> AsyncIterator[dict]:
+        """Polls job events until the job finishes; ends with a status event."""
+        while True:
+            job = await asyncio.to_thread(self.backend.get, job_id)
+            events = await asyncio.to_thread(self.backend.events, job_id, after)
+            for event in events:
+                after = event["seq"]
+                yield event
+            if job is None or job["status"] in TERMINAL:
+                yield {
+                    "type": "status",
+                    "status": job["status"] if job else FAILED,
+                    "error": job["error"] if job else "Job not found",
+                }
+                return
+            await asyncio.sleep(settings.JOB_POLL_INTERVAL)
+
+    async def _generate(self, job: dict) -> None:
+        job_id, payload = job["job_id"], job["payload"]
+        # Чекпоинт под id задачи: её можно возобновить через /generate/{id}/resume,
+        # а после потери аренды другой воркер продолжает с готовых слайдов
+        if await asyncio.to_thread(generation_checkpoints.get, job_id) is None:
+            await asyncio.to_thread(
+                generation_checkpoints.start,
+                job_id,
+                job["user_id"],
+                payload["prompt"],
+                payload["model"],
+                payload["context"],
+            )
+        # Повторный запуск переигрывает чекпоинт: уже записанное не дублируем
+        recorded = await asyncio.to_thread(self.backend.events, job_id)
+        has_outline = any(e["type"] == "outline" for e in recorded)
+        slides_seen = {e["slide_id"] for e in recorded if e["type"] == "slide"}
+        events = model_service.astream_presentation(
+            payload["prompt"],
+            payload["context"],
+            payload["model"],
+            uuid4().hex,
+            job["user_id"],
+            generation_id=job_id,
+        )
+        failed: list[int] = []
+        async with aclosing(events):
+            async for event in events:
+                if event["type"] == "slide_failed":
+                    failed.append(event["slide_id"])
+                    continue
+                if event["type"] == "outline" and not has_outline:
+                    progress = {"type": "outline", "slides": event["slides"]}
+                elif (
+                    event["type"] == "slide_done"
+                    and event["slide_id"] not in slides_seen
+                ):
+                    progress = {
+                        "type": "slide",
+                        "slide_id": event["slide_id"],
+                        "markdown": model_service.slide_markdown(event["slide"]),
+                    }
+                else:
+                    continue
+                await asyncio.to_thread(self.backend.append_event, job_id, progress)
+        if failed:
+            # Задача не «готова» без этих слайдов: /resume догенерирует их
+            raise RuntimeError(f"Slides failed: {failed}")
+
+    async def _heartbeat(self, job_id: str, worker: str, run: asyncio.Task) -> None:
+        while not run.done():
+            await asyncio.sleep(settings.JOB_LEASE_SECONDS / 3)
+            if not await asyncio.to_thread(self.backend.heartbeat, job_id, worker):
+                # Задачу отменили или её аренду забрал другой воркер (мы «зависли»)
+                job = await asyncio.to_thread(self.backend.get, job_id)
+                if job is None or job["status"] != CANCELLED:
+                    logging.warning(f"Job {job_id}: lease lost by {worker}")
+                    llm_metrics_service.incr("jobs.lost")
+                run.cancel()
+                return
+
+    async def _run(self, job: dict, worker: str) -> None:
+        job_id = job["job_id"]
+        generation = asyncio.create_task(self._generate(job))
+        self._running[job_id] = generation
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, worker, generation))
+        try:
+            await asyncio.wait({generation})
+        except asyncio.CancelledError:
+            # Воркер останавливается: задачу сразу отдаём другим, не ждём аренду
+            generation.cancel()
+            await asyncio.gather(generation, return_exceptions=True)
+            await asyncio.to_thread(self.backend.release, job_id, worker)
+            raise
+        finally:
+            heartbeat.cancel()
+            self._running.pop(job_id, None)
+        if generation.cancelled():
+            logging.info(f"Job {job_id} stopped on {worker}")
+            return
+        error = generation.exception()
+        if error is not None:
+            logging.error(f"Job {job_id} failed", exc_info=error)
+            llm_metrics_service.incr("jobs.failed")
+            await asyncio.to_thread(
+                self.backend.finish, job_id, worker, FAILED, str(error)
+            )
+            return
+        llm_metrics_service.incr("jobs.done")
+        await asyncio.to_thread(self.backend.finish, job_id, worker, DONE)
+
+    async def run_worker(
+        self, worker: str | None = None, concurrency: int | None = None
+    ) -> None:
+        """Claims and runs jobs forever, up to concurrency at a time."""
+        worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+        slots = asyncio.Semaphore(concurrency or settings.JOB_WORKER_CONCURRENCY)
+        running: set[asyncio.Task] = set()
+        logging.info(f"Job worker {worker} started")
+        try:
+            while True:
+                await slots.acquire()
+                job = await asyncio.to_thread(self.backend.claim, worker)
+                if job is None:
+                    slots.release()
+                    await asyncio.sleep(settings.JOB_POLL_INTERVAL)
+                    continue
+                logging.info(
+                    f"Job {job['job_id']} claimed by {worker} "
+                    f"(attempt {job['attempts']})"
+                )
+                task = asyncio.create_task(self._run(job, worker))
+                running.add(task)
+                task.add_done_callback(running.discard)
+                task.add_done_callback(lambda _: slots.release())
+        finally:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+
+    def start_local_workers(self) -> None:
+        if isinstance(self.backend, _LocalJobBackend) and not self._local_workers:
+            self._local_workers.append(asyncio.create_task(self.run_worker("local")))
+
+    async def stop_local_workers(self) -> None:
+        for task in self._local_workers:
+            task.cancel()
+        await asyncio.gather(*self._local_workers, return_exceptions=True)
+        self._local_workers.clear()
+
+
+job_queue = _JobQueueService(
+    _PostgresJobBackend() if settings.JOB_BACKEND == "postgres" else _LocalJobBackend()
+)
@@ -0,0 +1,159 @@
+from collections import OrderedDict, defaultdict
+import hashlib
+import json
+import logging
+from pathlib import Path
+import sqlite3
+import threading
+import time
+
+from src.config import settings
+
+
+class _LLMCacheService:
+    """
+    Content-addressed cache of LLM responses: in-memory LRU with TTL and an
+    optional SQLite tier that survives restarts.
+    """
+
+    _max_entries: int
+    _ttl: int
+    _memory: OrderedDict[str, tuple[float, dict]]
+    _db: sqlite3.Connection | None
+
+    _PURGE_EVERY = 500
+
+    def __init__(
+        self, max_entries: int, ttl_seconds: int, disk_path: Path | None = None
+    ) -> None:
+        self._max_entries = max_entries
+        self._ttl = ttl_seconds
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict[str, int]] = defaultdict(
+            lambda: {"hits": 0, "misses": 0}
+        )
+        self._writes = 0
+        self._db = None
+
+        if disk_path is not None:
+            disk_path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._purge_disk()
+
+    @staticmethod
+    def make_key(
+        model: str,
+        messages: list[dict],
+        temperature: float,
+        max_tokens: int,
+        response_format: dict | None = None,
+    ) -> str:
+        raw = json.dumps(
+            [model, messages, temperature, max_tokens, response_format],
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def enabled_for(self, stage: str | None, cache: bool | None = None) -> bool:
+        """cache=True/False overrides LLM_CACHE_STAGES for a single call."""
+        if not settings.LLM_CACHE_ENABLED:
+            return False
+        if cache is not None:
+            return cache
+        return stage is not None and stage in settings.LLM_CACHE_STAGES
+
+    def get(self, key: str, stage: str) -> dict | None:
+        now = time.time()
+        with self._lock:
+            value = self._get_memory(key, now)
+            if value is None and self._db is not None:
+                value = self._get_disk(key, now)
+                if value is not None:
+                    self._set_memory(key, value, now)
+            self._stats[stage]["hits" if value is not None else "misses"] += 1
+        return value
+
+    def set(self, key: str, value: dict) -> None:
+        now = time.time()
+        with self._lock:
+            self._set_memory(key, value, now)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), now + self._ttl),
+                )
+                self._db.commit()
+                self._writes += 1
+                if self._writes % self._PURGE_EVERY == 0:
+                    self._purge_disk()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM llm_cache")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stages = {stage: dict(counts) for stage, counts in self._stats.items()}
+            return {
+                "entries": len(self._memory),
+                "disk": self._db is not None,
+                "hits": sum(c["hits"] for c in stages.values()),
+                "misses": sum(c["misses"] for c in stages.values()),
+                "stages": stages,
+            }
+
+    def _get_memory(self, key: str, now: float) -> dict | None:
+        item = self._memory.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < now:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _set_memory(self, key: str, value: dict, now: float) -> None:
+        self._memory[key] = (now + self._ttl, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._max_entries:
+            self._memory.popitem(last=False)
+
+    def _get_disk(self, key: str, now: float) -> dict | None:
+        row = self._db.execute(
+            "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] < now:
+            self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._db.commit()
+            return None
+        try:
+            return json.loads(row[0])
+        except json.JSONDecodeError:
+            return None
+
+    def _purge_disk(self) -> None:
+        deleted = self._db.execute(
+            "DELETE FROM llm_cache WHERE expires_at < ?", (time.time(),)
+        ).rowcount
+        self._db.commit()
+        if deleted:
+            logging.info(f"LLM cache: purged {deleted} expired disk entries")
+
+
+llm_cache_service = _LLMCacheService(
+    settings.LLM_CACHE_MAX_ENTRIES,
+    settings.LLM_CACHE_TTL_SECONDS,
+    settings.LLM_CACHE_DISK_PATH,
+)
@@ -0,0 +1,23 @@
+from collections import defaultdict
+import threading
+
+
+class _LLMMetricsService:
+    """Plain process-local counters for the LLM pipeline."""
+
+    _counters: dict[str, int]
+
+    def __init__(self) -> None:
+        self._counters = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return dict(sorted(self._counters.items()))
+
+
+llm_metrics_service = _LLMMetricsService()
@@ -0,0 +1,143 @@
+from __future__ import annotations
+import asyncio
+from contextlib import asynccontextmanager
+import logging
+import random
+import time
+from typing import AsyncIterator
+
+from src.config import settings
+
+
+class _TokenBucket:
+    """Per-minute budget refilled continuously; per_minute <= 0 means unlimited."""
+
+    def __init__(self, per_minute: int) -> None:
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay_for(self, amount: float) -> float:
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        if not self.unlimited:
+            self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float) -> None:
+        if not self.unlimited:
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class _ModelLimiter:
+    def __init__(self, concurrency: int, rpm: int, tpm: int) -> None:
+        # asyncio.Lock будит ожидающих в порядке FIFO — это и есть честная очередь
+        self.gate = asyncio.Lock()
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.concurrency = concurrency
+        self.requests = _TokenBucket(rpm)
+        self.tokens = _TokenBucket(tpm)
+        self.blocked_until = 0.0
+        self.in_flight = 0
+        self.queued = 0
+        self.throttled = 0
+
+
+class _LLMScheduler:
+    """
+    Process-wide admission control for upstream LLM calls: per-model
+    concurrency, requests/tokens-per-minute budgets and Retry-After pauses.
+    Callers are admitted strictly in arrival order.
+    """
+
+    _limiters: dict[str, _ModelLimiter]
+
+    def __init__(self) -> None:
+        self._limiters = {}
+
+    def _limiter(self, model: str) -> _ModelLimiter:
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            limits = settings.LLM_MODEL_LIMITS.get(model, {})
+            limiter = _ModelLimiter(
+                limits.get("concurrency", settings.LLM_MAX_CONCURRENCY),
+                limits.get("rpm", settings.LLM_REQUESTS_PER_MINUTE),
+                limits.get("tpm", settings.LLM_TOKENS_PER_MINUTE),
+            )
+            self._limiters[model] = limiter
+        return limiter
+
+    @asynccontextmanager
+    async def slot(self, model: str, est_tokens: int) -> AsyncIterator[None]:
+        limiter = self._limiter(model)
+        limiter.queued += 1
+        try:
+            async with limiter.gate:
+                while True:
+                    delay = max(
+                        limiter.blocked_until - time.monotonic(),
+                        limiter.requests.delay_for(1),
+                        limiter.tokens.delay_for(est_tokens),
+                    )
+                    if delay <= 0:
+                        break
+                    limiter.throttled += 1
+                    await asyncio.sleep(delay)
+                limiter.requests.take(1)
+                limiter.tokens.take(est_tokens)
+                await limiter.semaphore.acquire()
+        finally:
+            limiter.queued -= 1
+        limiter.in_flight += 1
+        try:
+            yield
+        finally:
+            limiter.in_flight -= 1
+            limiter.semaphore.release()
+
+    def block(self, model: str, seconds: float) -> None:
+        limiter = self._limiter(model)
+        until = time.monotonic() + seconds
+        if until > limiter.blocked_until:
+            limiter.blocked_until = until
+            logging.warning(f"LLM scheduler: {model} paused for {seconds:.1f}s")
+
+    def report_usage(self, model: str, est_tokens: int, actual_tokens: int) -> None:
+        self._limiter(model).tokens.adjust(actual_tokens - est_tokens)
+
+    def backoff(self, attempt: int) -> float:
+        # Full jitter: равномерно в [0, min(max, base * 2^attempt)]
+        cap = min(settings.LLM_BACKOFF_MAX, settings.LLM_BACKOFF_BASE * 2**attempt)
+        return random.uniform(0, cap)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            model: {
+                "concurrency": limiter.concurrency,
+                "in_flight": limiter.in_flight,
+                "queued": limiter.queued,
+                "throttled": limiter.throttled,
+                "paused_for": max(0.0, round(limiter.blocked_until - now, 1)),
+            }
+            for model, limiter in self._limiters.items()
+        }
+
+
+llm_scheduler = _LLMScheduler()
@@ -0,0 +1,178 @@
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+import copy
+import threading
+import time
+from typing import Iterator
+import uuid
+
+from src.config import settings
+
+# (request_id, user_id) текущего запроса. Вызовы model_api_utils выполняются на
+# цикле LLM-клиента, но run_coroutine_threadsafe переносит туда контекст вызывающего
+_scope: ContextVar[tuple[str, int | None] | None] = ContextVar(
+    "llm_usage_scope", default=None
+)
+
+
+def _totals() -> dict:
+    return {
+        "calls": 0,
+        "cached": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "latency": 0.0,
+        "retries": 0,
+        "cost": 0.0,
+    }
+
+
+def _add(totals: dict, call: dict) -> None:
+    totals["calls"] += 1
+    totals["cached"] += int(call["cached"])
+    totals["prompt_tokens"] += call["prompt_tokens"]
+    totals["completion_tokens"] += call["completion_tokens"]
+    totals["latency"] = round(totals["latency"] + call["latency"], 3)
+    totals["retries"] += call["retries"]
+    totals["cost"] = round(totals["cost"] + (call["cost"] or 0.0), 6)
+
+
+class _LLMUsageService:
+    """
+    Per-call LLM usage accounting: tokens, latency, retries and estimated cost,
+    aggregated per stage, per request (last LLM_USAGE_MAX_REQUESTS) and per user.
+    A request also keeps the metadata of the run it belongs to.
+    """
+
+    _requests: OrderedDict[str, dict]
+    _users: dict[int, dict]
+    _stages: dict[str, dict]
+
+    def __init__(self, max_requests: int) -> None:
+        self._max_requests = max_requests
+        self._requests = OrderedDict()
+        self._users = defaultdict(lambda: {"totals": _totals(), "stages": {}})
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def scope(
+        self, request_id: str | None = None, user_id: int | None = None
+    ) -> Iterator[str]:
+        """Attributes LLM calls made inside the block to a request and user."""
+        request_id = request_id or uuid.uuid4().hex
+        previous = _scope.get()
+        # set() вместо reset(): генераторы могут закрываться в другом контексте
+        _scope.set((request_id, user_id))
+        try:
+            yield request_id
+        finally:
+            _scope.set(previous)
+
+    def current_request_id(self) -> str | None:
+        scope = _scope.get()
+        return scope[0] if scope else None
+
+    @staticmethod
+    def estimate_cost(
+        model: str, prompt_tokens: int, completion_tokens: int
+    ) -> float | None:
+        price = settings.LLM_MODEL_PRICING.get(model)
+        if price is None:
+            return None
+        return (
+            prompt_tokens * price.get("prompt", 0.0)
+            + completion_tokens * price.get("completion", 0.0)
+        ) / 1_000_000
+
+    def record(
+        self,
+        stage: str | None,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        latency: float,
+        retries: int = 0,
+        cost: float | None = None,
+        cached: bool = False,
+    ) -> None:
+        scope = _scope.get()
+        request_id, user_id = scope if scope else (None, None)
+        stage = stage or "other"
+        if cost is None and not cached:
+            cost = self.estimate_cost(model, prompt_tokens, completion_tokens)
+        call = {
+            "stage": stage,
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "latency": round(latency, 3),
+            "retries": retries,
+            "cost": cost,
+            "cached": cached,
+        }
+        with self._lock:
+            _add(self._stages.setdefault(stage, _totals()), call)
+            if user_id is not None:
+                user = self._users[user_id]
+                _add(user["totals"], call)
+                _add(user["stages"].setdefault(stage, _totals()), call)
+            if request_id is not None:
+                request = self._request(request_id, user_id)
+                _add(request["totals"], call)
+                _add(request["stages"].setdefault(stage, _totals()), call)
+                request["calls"].append(call)
+
+    def record_metadata(self, metadata: dict) -> None:
+        """Attaches run metadata (e.g. pipeline outputs) to the current request."""
+        scope = _scope.get()
+        if scope is None:
+            return
+        with self._lock:
+            self._request(*scope)["metadata"] = copy.deepcopy(metadata)
+
+    def _request(self, request_id: str, user_id: int | None) -> dict:
+        request = self._requests.get(request_id)
+        if request is None:
+            request = self._requests[request_id] = {
+                "request_id": request_id,
+                "user_id": user_id,
+                "started_at": time.time(),
+                "totals": _totals(),
+                "stages": {},
+                "calls": [],
+                "metadata": None,
+            }
+            while len(self._requests) > self._max_requests:
+                self._requests.popitem(last=False)
+        return request
+
+    def get_request(self, request_id: str) -> dict | None:
+        with self._lock:
+            request = self._requests.get(request_id)
+            return copy.deepcopy(request)
+
+    def get_user(self, user_id: int) -> dict:
+        with self._lock:
+            user = self._users.get(user_id) or {"totals": _totals(), "stages": {}}
+            requests = [
+                {k: v for k, v in r.items() if k not in ("calls", "metadata")}
+                for r in self._requests.values()
+                if r["user_id"] == user_id
+            ]
+            return {**copy.deepcopy(user), "requests": copy.deepcopy(requests)}
+
+    def stats(self) -> dict:
+        with self._lock:
+            stages = copy.deepcopy(self._stages)
+            total = _totals()
+            for totals in stages.values():
+                for k in total:
+                    total[k] += totals[k]
+            total["cost"] = round(total["cost"], 6)
+            total["latency"] = round(total["latency"], 3)
+            return {"totals": total, "stages": stages, "requests": len(self._requests)}
+
+
+llm_usage_service = _LLMUsageService(settings.LLM_USAGE_MAX_REQUESTS)
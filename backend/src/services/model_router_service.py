@@ -0,0 +1,152 @@
+from collections import deque
+import logging
+import time
+
+from src.config import settings, model_settings
+from src.services.circuit_breaker_service import circuit_breakers
+
+
+class _ModelStats:
+    def __init__(self) -> None:
+        self.latency: float | None = None
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.calls = 0
+        self.failures = 0
+        self.recent: deque[float] = deque(maxlen=200)
+        self.recent_ttft: deque[float] = deque(maxlen=200)
+
+
+class _ModelRouter:
+    """
+    Keeps EWMA latency/error stats per model and orders candidate models
+    for each call: stage policies from model_settings.STAGE_MODEL_POLICIES
+    are routed by observed latency, otherwise the requested model stays
+    first and the other DEFAULT_MODEL_VALUES serve as fallbacks.
+    """
+
+    _stats: dict[str, _ModelStats]
+    _hedge_window: deque[bool]
+
+    def __init__(self) -> None:
+        self._stats = {}
+        self._hedge_window = deque(maxlen=1000)
+        self.hedges_won = 0
+
+    def _get(self, model: str) -> _ModelStats:
+        stats = self._stats.get(model)
+        if stats is None:
+            stats = self._stats[model] = _ModelStats()
+        return stats
+
+    def healthy(self, model: str) -> bool:
+        stats = self._get(model)
+        return (
+            time.monotonic() >= stats.cooldown_until
+            and stats.error_rate < settings.LLM_ROUTER_MAX_ERROR_RATE
+            and circuit_breakers.available(model)
+        )
+
+    def _score(self, model: str) -> float:
+        stats = self._get(model)
+        if stats.latency is None:
+            # Неизмеренную модель пробуем первой, чтобы собрать статистику
+            return 0.0
+        return stats.latency * (1.0 + 4.0 * stats.error_rate)
+
+    def route(self, stage: str | None, preferred: str) -> list[str]:
+        if not settings.LLM_ROUTING_ENABLED:
+            return [preferred]
+        policy = model_settings.STAGE_MODEL_POLICIES.get(stage or "")
+        if policy:
+            candidates = sorted(policy, key=self._score)
+        else:
+            fallbacks = [m for m in settings.DEFAULT_MODEL_VALUES if m != preferred]
+            candidates = [preferred] + sorted(fallbacks, key=self._score)
+        healthy = [m for m in candidates if self.healthy(m)]
+        return healthy + [m for m in candidates if m not in healthy]
+
+    def record_success(self, model: str, latency: float) -> None:
+        stats = self._get(model)
+        alpha = settings.LLM_ROUTER_EWMA_ALPHA
+        stats.calls += 1
+        stats.recent.append(latency)
+        stats.latency = (
+            latency
+            if stats.latency is None
+            else alpha * latency + (1 - alpha) * stats.latency
+        )
+        stats.error_rate = (1 - alpha) * stats.error_rate
+        stats.consecutive_failures = 0
+
+    def record_failure(self, model: str) -> None:
+        stats = self._get(model)
+        alpha = settings.LLM_ROUTER_EWMA_ALPHA
+        stats.calls += 1
+        stats.failures += 1
+        stats.error_rate = alpha + (1 - alpha) * stats.error_rate
+        stats.consecutive_failures += 1
+        if stats.consecutive_failures >= 3:
+            stats.cooldown_until = (
+                time.monotonic() + settings.LLM_ROUTER_COOLDOWN_SECONDS
+            )
+            logging.warning(f"Model router: {model} cooled down after failures")
+
+    def record_ttft(self, model: str, ttft: float) -> None:
+        self._get(model).recent_ttft.append(ttft)
+
+    def hedge_delay(
+        self, model: str, stage: str | None, streaming: bool = False
+    ) -> float | None:
+        """Delay after which a duplicate request may be fired, None = no hedging."""
+        if not settings.LLM_HEDGING_ENABLED or stage not in settings.LLM_HEDGE_STAGES:
+            return None
+        stats = self._get(model)
+        samples = sorted(stats.recent_ttft if streaming else stats.recent)
+        if len(samples) < settings.LLM_HEDGE_MIN_SAMPLES:
+            return None
+        idx = min(len(samples) - 1, int(len(samples) * settings.LLM_HEDGE_PERCENTILE))
+        return max(settings.LLM_HEDGE_MIN_DELAY, samples[idx])
+
+    def hedge_target(self, candidates: list[str]) -> str:
+        if settings.LLM_HEDGE_CROSS_MODEL and len(candidates) > 1:
+            return candidates[1]
+        return candidates[0]
+
+    def record_call(self) -> None:
+        self._hedge_window.append(False)
+
+    def try_hedge(self) -> bool:
+        # Бюджет: доля продублированных вызовов в окне не выше LLM_HEDGE_BUDGET
+        hedged = sum(self._hedge_window)
+        if (hedged + 1) > settings.LLM_HEDGE_BUDGET * max(len(self._hedge_window), 1):
+            return False
+        self._hedge_window.append(True)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "hedges": {
+                "window": len(self._hedge_window),
+                "hedged": sum(self._hedge_window),
+                "won": self.hedges_won,
+                "budget": settings.LLM_HEDGE_BUDGET,
+            },
+            "models": self._model_stats(),
+        }
+
+    def _model_stats(self) -> dict:
+        return {
+            model: {
+                "latency": round(stats.latency, 3) if stats.latency else None,
+                "error_rate": round(stats.error_rate, 3),
+                "healthy": self.healthy(model),
+                "calls": stats.calls,
+                "failures": stats.failures,
+            }
+            for model, stats in self._stats.items()
+        }
+
+
+model_router = _ModelRouter()
@@ -10,20 +10,47 @@ model_services.py (stable baseline final)
 """
 
 from __future__ import annotations
-import os
-from typing import AsyncGenerator, Generator
+import copy
+from contextlib import aclosing
+from typing import (
+    AsyncGenerator,
+    AsyncIterator,
+    Awaitable,
+    Iterable,
+    Iterator,
+)
 import json
 import logging
 import asyncio
+import time
 
 from fastapi import HTTPException
 
-from src.config import settings, model_settings, ModelAction
+from src.config import settings, model_settings, ModelAction, ModelStage
 from src.modules.models import FZ44RAGSearcher, SlideContentGenerator
 from src.modules.models.rag import DocumentProcessor, QdrantVectorDatabase
-from src.schemas.model_schemas import ClassifierOut, StructureOut
+from src.modules.pipeline import StageGraph, StageRun, build_presentation_graph
+from src.schemas.model_schemas import ClassifierOut, SlideEditOut, StructureOut
 from src.schemas.presentation_schemas import EditSlideInSchema
-from src.utils import json_utils, model_api_utils, text_utils
+from src.services.generation_checkpoint_service import generation_checkpoints
+from src.services.llm_metrics_service import llm_metrics_service
+from src.services.llm_usage_service import llm_usage_service
+from src.services.pipeline_registry_service import pipeline_registry
+from src.utils import (
+    async_utils,
+    json_utils,
+    model_api_utils,
+    text_utils,
+    token_utils,
+)
+
+
+def _parse_planner_output(raw: str) -> list | None:
+    # В JSON-режиме провайдер возвращает объект StructureOut: {"slides": [...]}
+    obj = json_utils.extract_json_balanced(raw)
+    if isinstance(obj, dict) and isinstance(obj.get("slides"), list):
+        return obj["slides"]
+    return json_utils.extract_json_array(raw)
 
 
 def setup_logging(level: int = logging.INFO):
@@ -44,6 +71,7 @@ class IntegratedPipeline:
         self.doc_processor = DocumentProcessor()
         self.vector_db = QdrantVectorDatabase(collection_name, embedding_model)
         self.searcher = FZ44RAGSearcher(self.vector_db)
+        self._stages: StageGraph | None = None
         logging.info("✓ Pipeline initialized")
 
     def load_documents(self, documents: list[str], metadata: list[dict] | None = None):
@@ -51,62 +79,312 @@ class IntegratedPipeline:
         all_chunks, metadata = [], (metadata or [])
         for i, doc in enumerate(documents):
             meta = metadata[i] if i < len(metadata) else {"doc_id": i}
-            path = meta.get("source")
-            if path and os.path.exists(path):
-                all_chunks.extend(self.doc_processor.process_document(doc, meta))
-            else:
-                all_chunks.extend(self.doc_processor.process_document(doc, meta))
+            all_chunks.extend(self.doc_processor.process_document(doc, meta))
 
         self.vector_db.add_documents(all_chunks)
         logging.info(f"✓ Loaded {len(all_chunks)} chunks")
 
-    def run(self, user_request: str, project_context: str = "") -> Generator:
+    async def aload_documents(
+        self, documents: list[str], metadata: list[dict] | None = None
+    ) -> None:
+        # Парсинг и эмбеддинги — CPU-bound, уводим с event loop
+        await asyncio.to_thread(self.load_documents, documents, metadata)
+
+    async def aload_context(self, project_context: str) -> None:
+        """Indexes a generation context, one document per source file in it."""
+        sources = text_utils.split_sources(project_context)
+        await self.aload_documents(
+            [text for _, text in sources],
+            [{"doc_id": i, "source": name} for i, (name, _) in enumerate(sources)],
+        )
+
+    def with_model(self, llm_model: str) -> IntegratedPipeline:
+        """Pipeline over the same index (collection, searcher) with another LLM."""
+        if llm_model == self.llm_model:
+            return self
+        view = copy.copy(self)
+        view.llm_model = llm_model
+        # Стадии замкнуты на модель: у представления свой граф и своя мемоизация
+        view._stages = None
+        return view
+
+    @property
+    def stages(self) -> StageGraph:
+        if getattr(self, "_stages", None) is None:
+            self._stages = build_presentation_graph(self)
+        return self._stages
+
+    async def arun_stages(
+        self,
+        user_request: str,
+        project_context: str = "",
+        index_ready: Awaitable | None = None,
+        targets: Iterable[str] | None = None,
+        force: Iterable[str] = (),
+        checkpoint: dict | None = None,
+    ) -> StageRun:
+        """
+        Runs generation as a stage DAG (see build_presentation_graph). Stage
+        results are memoized on this pipeline, so force=("content", "charts")
+        regenerates slides only and force=("plan",) re-plans, reusing the rest.
+        A generation checkpoint seeds the classifier and planner results.
+        """
+        if checkpoint and checkpoint.get("classification"):
+            classification = checkpoint["classification"]
+            self.stages.prime(
+                "classify",
+                {"user_request": user_request},
+                {"classification": classification},
+            )
+            if checkpoint.get("outline"):
+                self.stages.prime(
+                    "plan",
+                    {
+                        "classification": classification,
+                        "project_context": project_context,
+                    },
+                    {"outline": checkpoint["outline"]},
+                )
+        return await self.stages.run(
+            {
+                "user_request": user_request,
+                "project_context": project_context,
+                "topic": user_request[:200],
+                "index_ready": index_ready,
+            },
+            targets=targets,
+            force=force,
+        )
+
+    @staticmethod
+    def _store_run_metadata(
+        clf: ClassifierOut, slides: list[dict], gen: SlideContentGenerator
+    ) -> None:
+        # Пайплайн общий для генераций по документу: метаданные живут в
+        # учёте запроса (GET /llm/usage/requests/{id}), а не на self
+        llm_usage_service.record_metadata(
+            {
+                "pipeline_metadata": {
+                    "classifier_output": clf.model_dump(),
+                    "structure_output": slides,
+                },
+                "generation_metadata": gen.generation_metadata,
+            }
+        )
+
+    async def astream(
+        self,
+        user_request: str,
+        project_context: str = "",
+        index_ready: Awaitable | None = None,
+        generation_id: str | None = None,
+        ordered: bool = True,
+        priority: list[int] | None = None,
+    ) -> AsyncGenerator[dict, None]:
+        """
+        Runs the pipeline and streams slide events token by token.
+        The planner is streamed too: each outline entry is emitted as an
+        "outline_slide" event and its slide starts as soon as it is parsed;
+        an "outline" event with all slides follows once planning is done.
+        index_ready (e.g. an aload_documents task) lets classification and
+        planning overlap document ingestion; only retrieval waits for it.
+        With generation_id, classifier/planner output and finished slides are
+        checkpointed; a checkpointed generation replays them and only
+        generates the missing slides.
+        A slide whose stream broke off ends with "slide_failed": it is not
+        checkpointed and the checkpoint finishes as "failed", so a resume
+        generates it again.
+        Also emits "audience", "chart_done" and "timing" events; ordered=False
+        interleaves slides and priority (slide ids, may change while running)
+        reorders which slides start next (see SlideContentGenerator).
+        """
+        started = time.perf_counter()
+
+        def timing(stage: str, since: float, **extra) -> dict:
+            seconds = round(time.perf_counter() - since, 3)
+            return {"type": "timing", "stage": stage, "seconds": seconds, **extra}
+
+        # Чекпоинт — запрос к базе/файлу: не на event loop
+        saved = (
+            await asyncio.to_thread(generation_checkpoints.get, generation_id)
+            if generation_id
+            else None
+        ) or {}
+        outline = saved.get("outline")
+        done = {s["slide_id"]: s for s in saved.get("slides", [])} if outline else {}
         logging.info("=" * 60)
         logging.info("START PIPELINE")
         logging.info("=" * 60)
         logging.info("[STEP 1] Classifier")
-        clf, clf_raw = self.run_classifier(user_request)
-        audience = clf.label
-        logging.info(f"Audience: {audience} (conf={clf.confidence:.2f})")
-        logging.info("[STEP 2] Planner")
-        struct, planner_raw = self.run_planner(audience, project_context)
-        slides = [s.model_dump() for s in struct.slides]
-        slide_structure = [
-            {
-                "id": s.get("slide_id"),
-                "slide_id": s.get("slide_id"),
-                "title": s.get("title", ""),
-                "task": s.get("task", ""),
-            }
-            for s in slides
-        ]
-        logging.info(f"Slides planned: {len(slide_structure)}")
-        logging.info("[STEP 3] Content Generation")
-        gen = SlideContentGenerator(self.api_key, self.searcher, self.llm_model)
-        data = {
-            "presentation_topic": user_request[:200],
-            "slide_structure": slide_structure,
-        }
-        return gen.generate_presentation_content(data)
-        self.last_run_metadata = {
-            "pipeline_metadata": {
-                "classifier_output": clf.model_dump(),
-                "structure_output": slides,
-            },
-            "generation_metadata": gen.generation_metadata,
-        }
+        if saved.get("classification"):
+            clf = ClassifierOut.model_validate(saved["classification"])
+        else:
+            clf, clf_raw = await self.arun_classifier(user_request)
+            if generation_id:
+                await asyncio.to_thread(
+                    generation_checkpoints.save_classification,
+                    generation_id,
+                    clf.model_dump(),
+                )
+            yield timing("classifier", started)
+        logging.info(f"Audience: {clf.label} (conf={clf.confidence:.2f})")
+        yield {"type": "audience", "label": clf.label, "confidence": clf.confidence}
+        logging.info("[STEP 2] Planner (streaming)")
+        slides: list[dict] = []
+        failed: list[int] = []
+        # Слайды планировщика по мере разбора; None — план закончен
+        planned: asyncio.Queue = asyncio.Queue()
 
-    def replace_chart(self, slide: dict, params: dict, slides: list) -> dict:
+        async def plan() -> AsyncIterator[dict]:
+            planning = time.perf_counter()
+            source = (
+                async_utils.aiter_list(outline)
+                if outline
+                else self._astream_plan(clf.label, project_context)
+            )
+            try:
+                async for slide in source:
+                    slides.append(slide)
+                    if slide["slide_id"] not in done:
+                        planned.put_nowait(slide)
+                    yield {"type": "outline_slide", "slide": slide}
+            finally:
+                planned.put_nowait(None)
+            logging.info(f"Slides planned: {len(slides)}")
+            if generation_id and not outline:
+                await asyncio.to_thread(
+                    generation_checkpoints.save_outline, generation_id, slides
+                )
+            yield {"type": "outline", "slides": list(slides)}
+            if not outline:
+                yield timing("planner", planning)
+
+        async def specs() -> AsyncIterator[tuple[int, str, str]]:
+            if index_ready is not None:
+                await index_ready
+            logging.info("[STEP 3] Content Generation (streaming)")
+            while (slide := await planned.get()) is not None:
+                yield slide["slide_id"], slide["title"], slide["task"]
+
+        # Готовые слайды из чекпоинта отдаются сразу, перед первым недостающим
+        replay = sorted(done)
+
+        def replayed(before: float) -> Iterator[dict]:
+            while replay and replay[0] < before:
+                slide = done[replay.pop(0)]
+                yield {
+                    "type": "slide_started",
+                    "slide_id": slide["slide_id"],
+                    "title": slide.get("title", ""),
+                }
+                yield {
+                    "type": "slide_done",
+                    "slide_id": slide["slide_id"],
+                    "slide": slide,
+                }
+
+        async def slide_events() -> AsyncIterator[dict]:
+            missing = [
+                s["slide_id"] for s in outline or [] if s["slide_id"] not in done
+            ]
+            # Без порядка слайдов клиенту всё равно: отдаём весь чекпоинт сразу
+            first_missing = min(missing, default=float("inf"))
+            for event in replayed(first_missing if ordered else float("inf")):
+                yield event
+            slide_started: dict[int, float] = {}
+            async for event in gen.astream_slides(specs(), topic, ordered):
+                if event["type"] == "slide_started":
+                    slide_started[event["slide_id"]] = time.perf_counter()
+                    for replay_event in replayed(event["slide_id"]):
+                        yield replay_event
+                elif event["type"] == "slide_done" and generation_id:
+                    await asyncio.to_thread(
+                        generation_checkpoints.save_slide, generation_id, event["slide"]
+                    )
+                elif event["type"] == "slide_failed":
+                    failed.append(event["slide_id"])
+                yield event
+                if event["type"] == "slide_done":
+                    since = slide_started.get(event["slide_id"], started)
+                    yield timing("slide", since, slide_id=event["slide_id"])
+            for event in replayed(float("inf")):
+                yield event
+
+        gen = SlideContentGenerator(
+            self.api_key, self.searcher, self.llm_model, priority=priority
+        )
+        topic = user_request[:200]
+        async for event in async_utils.merge(plan(), slide_events()):
+            yield event
+        if generation_id:
+            await asyncio.to_thread(
+                generation_checkpoints.finish,
+                generation_id,
+                "failed" if failed else "done",
+            )
+        yield timing("total", started)
+        self._store_run_metadata(clf, slides, gen)
+
+    async def _astream_plan(
+        self, audience: str, project_context: str
+    ) -> AsyncIterator[dict]:
+        """
+        Streams the planner and yields normalized slides as soon as each object
+        of the slides array is complete. Falls back to arun_planner when the
+        stream produced no slides; pads to MIN_SLIDES like _planner_result.
+        """
+        request = self._planner_request(audience, project_context)
+        streamer = json_utils.JsonArrayStreamer()
+        count = 0
+        stream = model_api_utils.astream_model(
+            [{"role": "user", "content": request["prompt"]}],
+            api_key=self.api_key,
+            model=self.llm_model,
+            max_tokens=request["max_tokens"],
+            temperature=request["temperature"],
+            stage=ModelStage.PLANNER,
+            response_format=model_api_utils.json_schema_format(StructureOut),
+        )
+        try:
+            # aclosing: после MAX_SLIDES остаток ответа не дочитываем
+            async with aclosing(stream):
+                async for delta in stream:
+                    for item in streamer.feed(delta):
+                        count += 1
+                        yield self._normalize_planned(item, count)
+                        if count >= model_settings.MAX_SLIDES:
+                            break
+                    if count >= model_settings.MAX_SLIDES:
+                        break
+        except Exception as e:
+            if not count:
+                raise
+            logging.warning(f"Planner stream failed after {count} slides: {e}")
+
+        if count:
+            llm_metrics_service.incr("json.first_try.planner")
+        else:
+            struct, _ = await self.arun_planner(audience, project_context)
+            for slide in struct.slides:
+                yield slide.model_dump()
+            return
+        for j in range(count + 1, model_settings.MIN_SLIDES + 1):
+            yield self._padding_slide(j)
+
+    async def areplace_chart(self, slide: dict, params: dict | None) -> dict:
         title = slide.get("title", "")
         task = (params or {}).get("task", "")
         query = f"{title} {task}".strip() or title
-        retrieved = self.searcher.search(query, top_k=model_settings.TOP_K_RETRIEVAL)
-        blocks = self.searcher.generate_charts_with_llm(
+        retrieved = await asyncio.to_thread(
+            self.searcher.search, query, top_k=model_settings.TOP_K_RETRIEVAL
+        )
+        gen = SlideContentGenerator(self.api_key, self.searcher, self.llm_model)
+        blocks = await gen.agenerate_charts_with_llm(
             slide.get("slide_id"), title, task, title, retrieved, max_tokens=600
         )
         content = (
             f"### {title}\n\n" + "\n\n".join(blocks)
-            if blocks and self.searcher._should_chart_only(title, task)
+            if blocks and gen._should_chart_only(title, task)
             else (
                 slide.get("content", "").rstrip()
                 + ("\n\n**Визуализация:**\n\n" if blocks else "")
@@ -123,216 +401,405 @@ class IntegratedPipeline:
             "explanation": "Charts rebuilt by LLM from retrieved RAG data.",
         }
 
-    def run_classifier(self, user_text: str) -> tuple[ClassifierOut, str]:
+    def _classifier_request(self, user_text: str) -> dict:
         prompt = text_utils.safe_format(
             model_settings.CLASSIFIER_PROMPT, user_text=user_text
         )
-        resp = model_api_utils.call_model(
-            [{"role": "user", "content": prompt}],
+        return dict(
+            prompt=prompt,
             api_key=self.api_key,
             model=self.llm_model,
             max_tokens=400,
             temperature=0.1,
+            stage=ModelStage.CLASSIFIER,
+            schema=ClassifierOut,
         )
-        raw = model_api_utils.get_content(resp)
-        raw_clean = text_utils.pre_sanitize(raw)
-        parsed = json_utils.extract_json_balanced(raw_clean) or None
-        if parsed is None:
-            resp2 = model_api_utils.call_model(
-                [
-                    {
-                        "role": "user",
-                        "content": model_settings.JSON_ONLY_PROMPT + "\n\n" + prompt,
-                    }
-                ],
-                api_key=self.api_key,
-                model=self.llm_model,
-                max_tokens=400,
-                temperature=0.1,
-            )
-            raw2 = model_api_utils.get_content(resp2)
-            raw2_clean = text_utils.pre_sanitize(raw2)
-            parsed = json_utils.extract_json_balanced(raw2_clean)
-            if parsed is not None:
-                raw = raw2
+
+    def _classifier_result(self, parsed, raw: str) -> tuple[ClassifierOut, str]:
         if parsed is None:
-            raise ValueError(
-                "Classifier output not parseable as JSON. Raw:\n" + raw_clean
-            )
+            raise ValueError("Classifier output not parseable as JSON. Raw:\n" + raw)
         return ClassifierOut.model_validate(parsed), raw
 
-    def run_planner(
-        self, audience: str, project_context: str
-    ) -> tuple[StructureOut, str]:
-        snippet = (project_context or "")[:4000]
+    async def arun_classifier(self, user_text: str) -> tuple[ClassifierOut, str]:
+        request = self._classifier_request(user_text)
+        return self._classifier_result(*await model_api_utils.acall_json(**request))
+
+    def _planner_request(self, audience: str, project_context: str) -> dict:
+        # Маркеры источников (имена файлов) в промпт не попадают
+        snippet = token_utils.truncate_tokens(
+            text_utils.strip_sources(project_context or ""),
+            model_settings.PROMPT_CONTEXT_TOKENS["planner"],
+        )
         prompt = text_utils.safe_format(
             model_settings.PLANNER_PROMPT, audience=audience, context_snippet=snippet
         )
-        resp = model_api_utils.call_model(
-            [{"role": "user", "content": prompt}],
+        return dict(
+            prompt=prompt,
             api_key=self.api_key,
             model=self.llm_model,
             max_tokens=1000,
             temperature=0.1,
+            stage=ModelStage.PLANNER,
+            schema=StructureOut,
+            parse=_parse_planner_output,
         )
-        raw = model_api_utils.get_content(resp)
-        raw_clean = text_utils.pre_sanitize(raw)
-        arr = json_utils.extract_json_array(raw_clean)
-        if arr is None:
-            resp2 = model_api_utils.call_model(
-                [
-                    {
-                        "role": "user",
-                        "content": model_settings.JSON_ONLY_PROMPT + "\n\n" + prompt,
-                    }
-                ],
-                api_key=self.api_key,
-                model=self.llm_model,
-                max_tokens=1000,
-                temperature=0.1,
-            )
-            raw2 = model_api_utils.get_content(resp2)
-            raw2_clean = text_utils.pre_sanitize(raw2)
-            if raw2 and raw2 != raw:
-                raw = raw2
-                raw_clean = raw2_clean
-            arr = json_utils.extract_json_array(raw_clean)
+
+    async def arun_planner(
+        self, audience: str, project_context: str
+    ) -> tuple[StructureOut, str]:
+        request = self._planner_request(audience, project_context)
+        return self._planner_result(*await model_api_utils.acall_json(**request))
+
+    def _planner_result(self, arr: list | None, raw: str) -> tuple[StructureOut, str]:
         if arr is None:
             raise ValueError(
                 "Planner output not parseable as JSON array. Raw (sanitized):\n"
-                + raw_clean
+                + raw
             )
-        normalized = []
-        for i, item in enumerate(arr, start=1):
-            if isinstance(item, dict):
-                title = (item.get("title") or item.get("name") or f"Слайд {i}").strip()
-                task = (item.get("task") or item.get("description") or "").strip()
-            else:
-                title, task = str(item), ""
-            if not task:
-                task = "Сформулируй контекст и ключевые тезисы по заголовку."
-            normalized.append(
-                {
-                    "slide_id": i,
-                    "title": " ".join(title.split()[:6]),
-                    "task": task[:200],
-                }
-            )
-        if len(normalized) < model_settings.MIN_SLIDES:
-            for j in range(len(normalized) + 1, model_settings.MIN_SLIDES + 1):
-                normalized.append(
-                    {
-                        "slide_id": j,
-                        "title": f"Доп. слайд {j}",
-                        "task": "Автоматически добавлен.",
-                    }
-                )
+        normalized = [
+            self._normalize_planned(item, i) for i, item in enumerate(arr, start=1)
+        ]
+        for j in range(len(normalized) + 1, model_settings.MIN_SLIDES + 1):
+            normalized.append(self._padding_slide(j))
         if len(normalized) > model_settings.MAX_SLIDES:
             normalized = normalized[: model_settings.MAX_SLIDES]
         for idx, it in enumerate(normalized, start=1):
             it["slide_id"] = idx
         return StructureOut.model_validate({"slides": normalized}), raw
 
-    def regenerate_slide(
+    @staticmethod
+    def _normalize_planned(item, i: int) -> dict:
+        if isinstance(item, dict):
+            title = (item.get("title") or item.get("name") or f"Слайд {i}").strip()
+            task = (item.get("task") or item.get("description") or "").strip()
+        else:
+            title, task = str(item), ""
+        if not task:
+            task = "Сформулируй контекст и ключевые тезисы по заголовку."
+        return {
+            "slide_id": i,
+            "title": " ".join(title.split()[:6]),
+            "task": task[:200],
+        }
+
+    @staticmethod
+    def _padding_slide(i: int) -> dict:
+        return {
+            "slide_id": i,
+            "title": f"Доп. слайд {i}",
+            "task": "Автоматически добавлен.",
+        }
+
+    def _edit_request(
+        self, user_prompt: str, slide: dict, action: ModelAction, params: dict
+    ) -> dict:
+        payload = {
+            "slide_id": slide.get("slide_id"),
+            "title": slide.get("title", ""),
+            "content": slide.get("content", ""),
+            "action": action,
+            "params": params,
+        }
+        if action == "custom":
+            payload["custom_prompt"] = user_prompt
+        return dict(
+            prompt=model_settings.SINGLE_SLIDE_EDIT_PROMPT
+            + "\nUserInput: "
+            + json.dumps(payload, ensure_ascii=False),
+            api_key=self.api_key,
+            model=self.llm_model,
+            max_tokens=600,
+            temperature=0.2,
+            stage=ModelStage.EDIT,
+            schema=SlideEditOut,
+            retry_prompt=(
+                "Previous reply was not valid JSON. "
+                "Please REPLY with valid JSON only."
+            ),
+        )
+
+    async def aregenerate_slide(
         self,
         user_prompt: str,
         slide: dict,
         action: ModelAction,
-        slides={},
-        params={},
-    ) -> dict:
+        params: dict | None = None,
+    ) -> dict | None:
         """
         Regenerates a single slide based on the provided action and parameters.
+        Returns None if the edit failed.
         """
-        if action == ModelAction.REPLACE_CHART:
-            try:
-                edited_slide = self.replace_chart(slide, params, slides)
-                return edited_slide
-            except Exception as e:
-                return None, e
-        else:
-            try:
-                payload = {
-                    "slide_id": slide.get("slide_id"),
-                    "title": slide.get("title", ""),
-                    "content": slide.get("content", ""),
-                    "action": action,
-                    "params": params,
-                }
-                if action == "custom":
-                    payload["custom_prompt"] = user_prompt
-
-                messages = [
-                    {
-                        "role": "user",
-                        "content": model_settings.SINGLE_SLIDE_EDIT_PROMPT
-                        + "\nUserInput: "
-                        + json.dumps(payload, ensure_ascii=False),
-                    }
-                ]
-                resp = model_api_utils.call_model(
-                    messages,
-                    self.api_key,
-                    model=self.llm_model,
-                    max_tokens=600,
-                    temperature=0.2,
-                )
-                raw = text_utils.pre_sanitize(resp["choices"][0]["message"]["content"])
-                parsed = json_utils.extract_json_balanced(raw)
-
-                if not isinstance(parsed, dict):
-                    resp2 = model_api_utils.call_model(
-                        [
-                            {
-                                "role": "user",
-                                "content": "Previous reply was not valid JSON. Please REPLY with valid JSON only.\n\n"
-                                + messages[0]["content"],
-                            }
-                        ],
-                        self.api_key,
-                        model=self.llm_model,
-                        max_tokens=600,
-                        temperature=0.2,
-                    )
-                    raw2 = text_utils.pre_sanitize(
-                        resp2["choices"][0]["message"]["content"]
-                    )
-                    parsed = json_utils.extract_json_balanced(raw2)
-
-                if parsed is None:
-                    raise ValueError()
-
-                return parsed
-            except Exception as e:
-                print(repr(e))
-                return HTTPException(500, "Ошибка сервера")
+        try:
+            if action == ModelAction.REPLACE_CHART:
+                return await self.areplace_chart(slide, params)
+            request = self._edit_request(user_prompt, slide, action, params or {})
+            parsed, _ = await model_api_utils.acall_json(**request)
+        except Exception:
+            logging.exception(f"[Slide {slide.get('slide_id')}] edit failed")
+            return None
+        if not isinstance(parsed, dict):
+            logging.warning(f"[Slide {slide.get('slide_id')}] edit not parseable")
+            return None
+        return parsed
 
 
 setup_logging(logging.INFO)
 api_key = model_api_utils.get_api_key()
 
 
-async def generate_presentation(user_prompt: str, project_context: str, model: str):
-    pipe = IntegratedPipeline(
+def _new_pipeline() -> IntegratedPipeline:
+    return IntegratedPipeline(
         api_key=api_key,
         embedding_model=settings.DEFAULT_EMBEDDING_MODEL,
-        llm_model=model,
+        llm_model=settings.DEFAULT_MODEL,
     )
-    pipe.load_documents([project_context])
 
-    for slide in pipe.run(user_prompt, project_context=project_context):
-        title = slide.get("title", "Untitled")
-        content = slide.get("content", "")
-        chunk = f"# {title}\n\n{content.strip()}\n\n"
-        yield chunk
 
+async def astream_presentation(
+    user_prompt: str,
+    project_context: str,
+    model: str,
+    request_id: str | None = None,
+    user_id: int | None = None,
+    generation_id: str | None = None,
+    ordered: bool = True,
+    priority: list[int] | None = None,
+) -> AsyncIterator[dict]:
+    """
+    Streams the pipeline events of a generation. Progress is checkpointed
+    under generation_id (the request id for a new generation); passing the
+    id of an existing checkpoint resumes it, see resume_presentation.
+    """
+    with llm_usage_service.scope(request_id, user_id) as request_id:
+        if generation_id is None:
+            generation_id = request_id
+            await asyncio.to_thread(
+                generation_checkpoints.start,
+                generation_id,
+                user_id,
+                user_prompt,
+                model,
+                project_context,
+            )
+        # Один прогретый индекс на документ: повторные генерации и правки
+        # не строят пайплайн и не пересчитывают эмбеддинги
+        pipe, ingest = await pipeline_registry.acquire(
+            project_context, model, _new_pipeline, user_id
+        )
+        planned: set[int] = set()
+        slides_done = 0
+        try:
+            async for event in pipe.astream(
+                user_prompt,
+                project_context=project_context,
+                index_ready=ingest,
+                generation_id=generation_id,
+                ordered=ordered,
+                priority=priority,
+            ):
+                if event["type"] == "outline_slide":
+                    planned.add(event["slide"]["slide_id"])
+                elif event["type"] == "outline":
+                    planned.update(s["slide_id"] for s in event["slides"])
+                elif event["type"] == "slide_done":
+                    slides_done += 1
+                yield event
+        except Exception:
+            # Оборванный клиентом стрим остаётся "running"; оба можно возобновить
+            await asyncio.to_thread(
+                generation_checkpoints.finish, generation_id, "failed"
+            )
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            # Клиент ушёл: задачи слайдов и запросы к провайдеру отменены,
+            # оставшиеся слайды не генерируются и не оплачиваются
+            llm_metrics_service.incr("generations.cancelled")
+            llm_metrics_service.incr(
+                "generations.cancelled.slides_saved", len(planned) - slides_done
+            )
+            raise
+        finally:
+            ingest.cancel()
 
-def edit_one_slide(user_prompt, slide: dict, action: str, model: str) -> str:
-    pipe = IntegratedPipeline(
-        api_key=api_key,
-        embedding_model=settings.DEFAULT_EMBEDDING_MODEL,
-        llm_model=settings.DEFAULT_MODEL,
+
+def slide_markdown(slide: dict) -> str:
+    title = slide.get("title") or "Untitled"
+    return f"# {title}\n\n{slide.get('content', '').rstrip()}\n\n"
+
+
+async def to_markdown(events: AsyncIterator[dict]) -> AsyncIterator[str]:
+    """Renders slide events as the markdown stream the editor consumes."""
+    streamed = ""
+    # aclosing: обрыв клиента сразу закрывает и генерацию под нами
+    async with aclosing(events):
+        async for event in events:
+            if event["type"] == "slide_started":
+                streamed = ""
+                yield f"# {event.get('title') or 'Untitled'}\n\n"
+            elif event["type"] == "slide_token":
+                streamed += event["text"]
+                yield event["text"]
+            elif event["type"] == "slide_done":
+                content = event["slide"].get("content", "")
+                rest = (
+                    content[len(streamed) :]
+                    if content.startswith(streamed)
+                    else content
+                )
+                yield f"{rest.rstrip()}\n\n"
+            elif event["type"] == "slide_failed":
+                # Оборванный текст закрываем, чтобы следующий слайд начался с #
+                yield "\n\n"
+
+
+async def generate_presentation(
+    user_prompt: str,
+    project_context: str,
+    model: str,
+    request_id: str | None = None,
+    user_id: int | None = None,
+    generation_id: str | None = None,
+):
+    events = astream_presentation(
+        user_prompt, project_context, model, request_id, user_id, generation_id
     )
-    content = pipe.regenerate_slide(user_prompt, slide, action).get("content", "")
+    async with aclosing(to_markdown(events)) as chunks:
+        async for chunk in chunks:
+            yield chunk
+
+
+async def resume_presentation(
+    generation_id: str,
+    request_id: str | None = None,
+    user_id: int | None = None,
+):
+    """
+    Resumes a checkpointed generation: finished slides are replayed at once,
+    generation continues from the first missing slide.
+    """
+    saved = await asyncio.to_thread(generation_checkpoints.get, generation_id)
+    if saved is None:
+        raise HTTPException(status_code=404, detail="Generation not found")
+    async for chunk in generate_presentation(
+        saved["prompt"],
+        saved["context"],
+        saved["model"],
+        request_id,
+        user_id,
+        generation_id=generation_id,
+    ):
+        yield chunk
+
+
+async def regenerate_slides(
+    generation_id: str,
+    request_id: str | None = None,
+    user_id: int | None = None,
+) -> dict:
+    """
+    Regenerates the slides of a checkpointed generation only: classifier and
+    planner output come from the checkpoint, the document index from the
+    pipeline registry and retrieval from the stage cache. The checkpoint is
+    updated with the new slides; returns their markdown and stage timings.
+    """
+    saved = await asyncio.to_thread(generation_checkpoints.get, generation_id)
+    if saved is None:
+        raise HTTPException(status_code=404, detail="Generation not found")
+    with llm_usage_service.scope(request_id, user_id):
+        pipe, ingest = await pipeline_registry.acquire(
+            saved["context"], saved["model"], _new_pipeline, user_id
+        )
+        run = await pipe.arun_stages(
+            saved["prompt"],
+            saved["context"],
+            index_ready=ingest,
+            force=("content", "charts"),
+            checkpoint=saved,
+        )
+    await asyncio.to_thread(_save_regenerated, generation_id, saved, run)
+    return {
+        "generation_id": generation_id,
+        "markdown": "".join(slide_markdown(slide) for slide in run["slides"]),
+        "timings": run.timings,
+    }
+
+
+def _save_regenerated(generation_id: str, saved: dict, run: StageRun) -> None:
+    if not saved.get("outline"):
+        generation_checkpoints.save_classification(
+            generation_id, run["classification"]
+        )
+        generation_checkpoints.save_outline(generation_id, run["outline"])
+    for slide in run["slides"]:
+        generation_checkpoints.save_slide(generation_id, slide)
+    generation_checkpoints.finish(generation_id)
+
+
+async def _edit_pipeline(
+    document_id: str | None, user_id: int | None
+) -> tuple[IntegratedPipeline, Awaitable[None]]:
+    # Документ пользователя из реестра — для replace_chart есть по чему искать;
+    # чужой или неизвестный документ — пустой индекс, без чужих чанков
+    found = await pipeline_registry.get(document_id, settings.DEFAULT_MODEL, user_id)
+    if found is None:
+        found = await pipeline_registry.acquire(
+            "", settings.DEFAULT_MODEL, _new_pipeline
+        )
+    return found
+
+
+async def edit_one_slide(
+    user_prompt,
+    slide: dict,
+    action: str,
+    model: str,
+    request_id: str | None = None,
+    user_id: int | None = None,
+    document_id: str | None = None,
+) -> str:
+    pipe, index_ready = await _edit_pipeline(document_id, user_id)
+    with llm_usage_service.scope(request_id, user_id):
+        await index_ready
+        edited = await pipe.aregenerate_slide(user_prompt, slide, action)
+    if not isinstance(edited, dict):
+        raise HTTPException(500, "Ошибка сервера")
+    content = edited.get("content", "")
 
     return f"# {content}\n"
+
+
+async def astream_edit_slides(
+    user_prompt,
+    slides: list[dict],
+    action: str,
+    model: str,
+    request_id: str | None = None,
+    user_id: int | None = None,
+    document_id: str | None = None,
+) -> AsyncIterator[dict]:
+    """
+    Applies action to all slides concurrently (the LLM scheduler bounds the
+    calls) and yields {"slide_id", "content"} for each slide as soon as its
+    edit finishes, or {"slide_id", "error"} if it failed.
+    """
+    pipe, index_ready = await _edit_pipeline(document_id, user_id)
+    with llm_usage_service.scope(request_id, user_id):
+        await index_ready
+
+        async def edit(slide: dict) -> tuple[int, dict | None]:
+            edited = await pipe.aregenerate_slide(user_prompt, slide, action)
+            return slide["slide_id"], edited if isinstance(edited, dict) else None
+
+        tasks = [asyncio.create_task(edit(slide)) for slide in slides]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                slide_id, edited = await next_done
+                if edited is None:
+                    yield {"slide_id": slide_id, "error": "Ошибка сервера"}
+                else:
+                    content = edited.get("content", "")
+                    yield {"slide_id": slide_id, "content": f"# {content}\n"}
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
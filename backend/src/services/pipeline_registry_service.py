@@ -0,0 +1,169 @@
+from __future__ import annotations
+import asyncio
+from collections import OrderedDict
+import hashlib
+import logging
+import time
+from typing import TYPE_CHECKING, Awaitable, Callable
+
+from src.config import settings
+from src.services.llm_metrics_service import llm_metrics_service
+from src.utils import text_utils
+
+if TYPE_CHECKING:
+    from src.services.model_service import IntegratedPipeline
+
+
+class _Entry:
+    def __init__(self, document_id: str) -> None:
+        self.document_id = document_id
+        self.pipe: asyncio.Task | None = None
+        self.ready: asyncio.Task | None = None
+        self.views: dict[str, IntegratedPipeline] = {}
+        # Пользователи, загрузившие документ: только им он доступен для правок
+        self.owners: set[int] = set()
+        self.size_bytes = 0
+        self.expires_at = 0.0
+
+
+class _PipelineRegistry:
+    """
+    Warm pipelines keyed by document content hash: the indexed in-memory
+    collection and searcher are built and embedded once per document and
+    reused by generations and edits on it. LRU with TTL, capped by entries
+    and by the estimated memory of the indexes. Edits only reach documents
+    their user generated from.
+    """
+
+    _entries: OrderedDict[str, _Entry]
+
+    def __init__(self, max_entries: int, ttl_seconds: int, max_memory_mb: int) -> None:
+        self._max_entries = max_entries
+        self._ttl = ttl_seconds
+        self._max_bytes = max_memory_mb * 1024 * 1024
+        self._entries = OrderedDict()
+        self.evicted = 0
+
+    @staticmethod
+    def document_id(document: str) -> str:
+        # Только содержимое: те же файлы под другими именами — тот же индекс
+        texts = [text.strip() for _, text in text_utils.split_sources(document)]
+        return hashlib.sha256("\0".join(texts).encode("utf-8")).hexdigest()
+
+    async def acquire(
+        self,
+        document: str,
+        model: str,
+        factory: Callable[[], IntegratedPipeline],
+        user_id: int | None = None,
+    ) -> tuple[IntegratedPipeline, Awaitable[None]]:
+        """
+        Returns a pipeline for the document using model, and an awaitable that
+        completes once the document is indexed (ingestion runs in background
+        and is shared by concurrent callers; cancelling it is safe).
+        """
+        self._purge()
+        document_id = self.document_id(document)
+        entry = self._entries.get(document_id)
+        if entry is None:
+            llm_metrics_service.incr("pipelines.miss")
+            entry = self._entries[document_id] = _Entry(document_id)
+            # Конструктор загружает модели и создаёт Qdrant — не на event loop
+            entry.pipe = asyncio.create_task(asyncio.to_thread(factory))
+            entry.ready = asyncio.create_task(self._ingest(entry, document))
+        else:
+            llm_metrics_service.incr("pipelines.hit")
+        if user_id is not None:
+            entry.owners.add(user_id)
+        self._touch(entry)
+        self._evict()
+
+        pipe = await asyncio.shield(entry.pipe)
+        view = entry.views.get(model)
+        if view is None:
+            view = entry.views[model] = pipe.with_model(model)
+        return view, asyncio.shield(entry.ready)
+
+    async def get(
+        self, document_id: str | None, model: str, user_id: int | None
+    ) -> tuple[IntegratedPipeline, Awaitable[None]] | None:
+        """
+        Pipeline of an already registered document, without creating one;
+        None unless user_id generated from it (anonymous users own nothing).
+        """
+        self._purge()
+        entry = self._entries.get(document_id) if document_id else None
+        if entry is None or user_id is None or user_id not in entry.owners:
+            return None
+        llm_metrics_service.incr("pipelines.hit")
+        self._touch(entry)
+        pipe = await asyncio.shield(entry.pipe)
+        view = entry.views.get(model)
+        if view is None:
+            view = entry.views[model] = pipe.with_model(model)
+        return view, asyncio.shield(entry.ready)
+
+    async def _ingest(self, entry: _Entry, document: str) -> None:
+        try:
+            pipe = await entry.pipe
+            if document:
+                await pipe.aload_context(document)
+        except BaseException:
+            # Сломанный индекс не переиспользуем
+            if self._entries.get(entry.document_id) is entry:
+                del self._entries[entry.document_id]
+            raise
+        entry.size_bytes = self._estimate_size(pipe, document)
+        self._evict()
+
+    @staticmethod
+    def _estimate_size(pipe: IntegratedPipeline, document: str) -> int:
+        # Векторы float32 плюс текст чанков в payload (с перекрытием ~ x2)
+        db = pipe.vector_db
+        points = db.client.get_collection(db.collection_name).points_count or 0
+        return points * db.vector_size * 4 + 2 * len(document.encode("utf-8"))
+
+    def _touch(self, entry: _Entry) -> None:
+        entry.expires_at = time.monotonic() + self._ttl
+        self._entries.move_to_end(entry.document_id)
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        for document_id in [k for k, e in self._entries.items() if e.expires_at < now]:
+            del self._entries[document_id]
+
+    def _evict(self) -> None:
+        # Последняя (только что использованная) запись не вытесняется никогда
+        while len(self._entries) > 1 and (
+            len(self._entries) > self._max_entries
+            or sum(e.size_bytes for e in self._entries.values()) > self._max_bytes
+        ):
+            document_id, _ = self._entries.popitem(last=False)
+            self.evicted += 1
+            llm_metrics_service.incr("pipelines.evicted")
+            logging.info(f"Pipeline registry: evicted {document_id[:12]}")
+
+    def stats(self) -> dict:
+        self._purge()
+        return {
+            "entries": len(self._entries),
+            "memory_mb": round(
+                sum(e.size_bytes for e in self._entries.values()) / 1024 / 1024, 1
+            ),
+            "evicted": self.evicted,
+            "documents": [
+                {
+                    "size_bytes": e.size_bytes,
+                    "ready": e.ready is not None and e.ready.done(),
+                    "models": list(e.views),
+                }
+                for e in self._entries.values()
+            ],
+        }
+
+
+pipeline_registry = _PipelineRegistry(
+    settings.PIPELINE_REGISTRY_MAX_ENTRIES,
+    settings.PIPELINE_REGISTRY_TTL_SECONDS,
+    settings.PIPELINE_REGISTRY_MAX_MEMORY_MB,
+)
@@ -0,0 +1,122 @@
+import asyncio
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Generic,
+    Iterable,
+    TypeVar,
+)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+async def aiter_list(items: Iterable[T]) -> AsyncIterator[T]:
+    for item in items:
+        yield item
+
+
+async def merge(*sources: AsyncIterable[T]) -> AsyncIterator[T]:
+    """Yields items of several async iterables as they arrive; first error wins."""
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump(source: AsyncIterable[T]) -> None:
+        try:
+            async for item in source:
+                queue.put_nowait((False, item))
+        except Exception as e:
+            queue.put_nowait((True, e))
+        else:
+            queue.put_nowait((True, None))
+
+    tasks = [asyncio.create_task(pump(source)) for source in sources]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            finished, item = await queue.get()
+            if not finished:
+                yield item
+            elif item is not None:
+                raise item
+            else:
+                remaining -= 1
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def until(source: AsyncIterable[T], stop: Awaitable) -> AsyncIterator[T]:
+    """
+    Yields items of source until it ends or stop completes, whichever is
+    first. source runs in its own task, so on stop it is cancelled at once,
+    even while waiting for its next item, and the work under it stops too.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    stopped = object()
+
+    async def pump() -> None:
+        try:
+            async for item in source:
+                queue.put_nowait((False, item))
+        except Exception as e:
+            queue.put_nowait((True, e))
+        else:
+            queue.put_nowait((True, None))
+
+    pumping = asyncio.create_task(pump())
+    stopping = asyncio.ensure_future(stop)
+    stopping.add_done_callback(lambda _: queue.put_nowait((True, stopped)))
+    try:
+        while True:
+            finished, item = await queue.get()
+            if not finished:
+                yield item
+            elif item is None or item is stopped:
+                return
+            else:
+                raise item
+    finally:
+        pumping.cancel()
+        stopping.cancel()
+        await asyncio.gather(pumping, stopping, return_exceptions=True)
+
+
+class Coalescer(Generic[T, R]):
+    """
+    Batches concurrent calls: items submitted while a batch is running are
+    collected and passed to fn together as the next batch. fn is a blocking
+    function run in a thread, returning one result per item, in order.
+    """
+
+    _pending: list[tuple[T, asyncio.Future]]
+
+    def __init__(self, fn: Callable[[list[T]], list[R]]) -> None:
+        self._fn = fn
+        self._pending = []
+        self._flusher: asyncio.Task | None = None
+
+    async def __call__(self, item: T) -> R:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush())
+        return await future
+
+    async def _flush(self) -> None:
+        # Шаг цикла на сбор: вызовы из того же тика попадают в первый пакет
+        await asyncio.sleep(0)
+        while self._pending:
+            batch, self._pending = self._pending, []
+            try:
+                results = await asyncio.to_thread(self._fn, [item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
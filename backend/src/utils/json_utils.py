@@ -81,3 +81,167 @@ def extract_json_array(text: str) -> list[Any] | None:
         except Exception:
             pass
     return None
+
+
+_ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+
+class JsonFieldStreamer:
+    """
+    Incrementally decodes one top-level string field of a JSON object
+    that arrives in chunks (e.g. LLM token stream).
+
+    feed() returns only the newly decoded part of the field value.
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+        self.done = False
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._unicode: str | None = None
+        self._high_surrogate: int | None = None
+        self._expect_key = False
+        self._is_key = False
+        self._key_buf: list[str] = []
+        self._last_key: str | None = None
+        self._capturing = False
+
+    def feed(self, chunk: str) -> str:
+        out: list[str] = []
+        for ch in chunk:
+            if self._in_str:
+                self._feed_str_char(ch, out)
+            elif ch == '"':
+                self._start_string()
+            elif ch in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._expect_key = ch == "{"
+            elif ch in "}]":
+                self._depth = max(self._depth - 1, 0)
+            elif self._depth == 1 and ch == ",":
+                self._expect_key = True
+            elif self._depth == 1 and ch == ":":
+                self._expect_key = False
+        return "".join(out)
+
+    def _start_string(self) -> None:
+        if self._depth == 0:
+            return
+        self._in_str = True
+        self._is_key = self._depth == 1 and self._expect_key
+        self._key_buf = []
+        self._capturing = (
+            not self.done
+            and self._depth == 1
+            and not self._is_key
+            and self._last_key == self.field
+        )
+
+    def _feed_str_char(self, ch: str, out: list[str]) -> None:
+        if self._unicode is not None:
+            self._unicode += ch
+            if len(self._unicode) == 4:
+                self._emit(self._decode_unicode(self._unicode), out)
+                self._unicode = None
+            return
+        if self._esc:
+            self._esc = False
+            if ch == "u":
+                self._unicode = ""
+            else:
+                self._emit(_ESCAPES.get(ch, ch), out)
+            return
+        if ch == "\\":
+            self._esc = True
+        elif ch == '"':
+            self._in_str = False
+            if self._is_key:
+                self._last_key = "".join(self._key_buf)
+            elif self._capturing:
+                self._capturing = False
+                self.done = True
+        else:
+            self._emit(ch, out)
+
+    def _decode_unicode(self, hex_digits: str) -> str:
+        try:
+            code = int(hex_digits, 16)
+        except ValueError:
+            return ""
+        if 0xD800 <= code <= 0xDBFF:
+            self._high_surrogate = code
+            return ""
+        if 0xDC00 <= code <= 0xDFFF and self._high_surrogate is not None:
+            code = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+            self._high_surrogate = None
+        return chr(code)
+
+    def _emit(self, text: str, out: list[str]) -> None:
+        if self._is_key:
+            self._key_buf.append(text)
+        elif self._capturing:
+            out.append(text)
+
+
+class JsonArrayStreamer:
+    """
+    Incrementally extracts the objects of the first JSON array in a chunked
+    stream: a bare array or one nested in an object ({"slides": [...]}).
+
+    feed() returns the objects completed by this chunk, already parsed.
+    """
+
+    def __init__(self) -> None:
+        self._depth = 0
+        self._array_depth: int | None = None
+        self._in_str = False
+        self._esc = False
+        self._item: list[str] | None = None
+
+    def feed(self, chunk: str) -> list[dict]:
+        out: list[dict] = []
+        for ch in chunk:
+            if self._item is not None:
+                self._item.append(ch)
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+            elif ch == '"':
+                self._in_str = True
+            elif ch in "{[":
+                if ch == "{" and self._depth == self._array_depth:
+                    self._item = [ch]
+                self._depth += 1
+                if ch == "[" and self._array_depth is None:
+                    self._array_depth = self._depth
+            elif ch in "}]":
+                self._depth = max(self._depth - 1, 0)
+                if self._item is not None and self._depth == self._array_depth:
+                    self._emit("".join(self._item), out)
+                    self._item = None
+        return out
+
+    @staticmethod
+    def _emit(raw: str, out: list[dict]) -> None:
+        try:
+            obj = json.loads(raw)
+        except json.JSONDecodeError:
+            return
+        if isinstance(obj, dict):
+            out.append(obj)
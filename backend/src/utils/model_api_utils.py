@@ -1,22 +1,196 @@
+from __future__ import annotations
+import asyncio
+import concurrent.futures
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+import functools
 import json
+import logging
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Coroutine
 
-import requests
+import httpx
+from pydantic import BaseModel
 
-from src.config import settings, model_settings
+from src.config import settings, model_settings, ModelStage
+from src.services.circuit_breaker_service import circuit_breakers
+from src.services.llm_cache_service import llm_cache_service
+from src.services.llm_metrics_service import llm_metrics_service
+from src.services.llm_scheduler_service import llm_scheduler
+from src.services.llm_usage_service import llm_usage_service
+from src.services.model_router_service import model_router
+from src.utils import json_utils, text_utils, token_utils
 
+try:
+    import h2  # noqa: F401
+except ImportError:
+    h2 = None
 
-def call_model(
+_RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+# Модели, отклонившие response_format: дальше шлём им обычный запрос
+_structured_unsupported: set[str] = set()
+
+_record_lock = threading.Lock()
+
+# Счётчик повторов текущего вызова (_execute / _execute_stream) для учёта usage
+_call_retries: ContextVar[list[int] | None] = ContextVar(
+    "llm_call_retries", default=None
+)
+
+
+class ModelAPIError(RuntimeError):
+    def __init__(
+        self, message: str, status_code: int, retry_after: float | None = None
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code in _RETRYABLE_STATUSES
+
+
+class CircuitOpenError(ModelAPIError):
+    def __init__(self, model: str):
+        super().__init__(f"Circuit breaker open for {model}", 503)
+
+
+class _ModelClient:
+    """
+    Process-wide pooled HTTP client for the LLM provider.
+
+    The httpx.AsyncClient lives on its own event loop in a background thread,
+    so both async callers (any event loop) and legacy sync callers share one
+    keep-alive connection pool.
+    """
+
+    _loop: asyncio.AbstractEventLoop | None
+    _thread: threading.Thread | None
+    _client: httpx.AsyncClient | None
+
+    def __init__(self) -> None:
+        self._loop = None
+        self._thread = None
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=loop.run_forever, name="llm-client", daemon=True
+                )
+                thread.start()
+                self._loop, self._thread = loop, thread
+            return self._loop
+
+    def get_client(self) -> httpx.AsyncClient:
+        # Вызывается только из цикла клиента
+        if self._client is None:
+            http2 = settings.LLM_HTTP2 and h2 is not None
+            self._client = httpx.AsyncClient(
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=settings.LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+                ),
+                headers={"User-Agent": "presenton-stable/1.2"},
+            )
+            logging.info(f"✓ LLM HTTP client ready (http2={http2})")
+        return self._client
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def run(self, coro: Coroutine) -> Any:
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            return await coro
+        return await asyncio.wrap_future(self.submit(coro))
+
+    async def stream(self, agen: AsyncIterator) -> AsyncIterator:
+        """Iterates an async generator on the client loop from any loop."""
+        caller = asyncio.get_running_loop()
+        if caller is self._loop:
+            async for item in agen:
+                yield item
+            return
+
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def put(item: tuple) -> None:
+            try:
+                caller.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                pass
+
+        async def pump() -> None:
+            try:
+                async for item in agen:
+                    put((False, item))
+            except Exception as e:
+                put((True, e))
+            else:
+                put((True, None))
+
+        fut = self.submit(pump())
+        try:
+            while True:
+                finished, item = await queue.get()
+                if finished:
+                    if item is not None:
+                        raise item
+                    return
+                yield item
+        finally:
+            fut.cancel()
+
+    def run_sync(self, coro: Coroutine) -> Any:
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("run_sync() called from the LLM client loop")
+        return self.submit(coro).result()
+
+    async def _aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def close(self) -> None:
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._aclose(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+model_client = _ModelClient()
+
+
+def _build_request(
     messages: list[dict],
     api_key: str,
-    model: str = settings.DEFAULT_MODEL,
-    temperature: float = model_settings.GEN_TEMPERATURE,
-    max_tokens: int = 900,
-    timeout: int = 60,
-) -> dict:
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    response_format: dict | None = None,
+) -> tuple[dict, dict]:
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json",
-        "User-Agent": "presenton-stable/1.2",
     }
     payload = {
         "model": model,
@@ -24,18 +198,620 @@ def call_model(
         "temperature": temperature,
         "max_tokens": max_tokens,
     }
-    resp = requests.post(
-        settings.OPENROUTER_API_URL, headers=headers, json=payload, timeout=timeout
+    if response_format is not None and settings.LLM_STRUCTURED_OUTPUT:
+        payload["response_format"] = response_format
+    return headers, payload
+
+
+def _parse_retry_after(value: str | None) -> float | None:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _raise_for_status(resp: httpx.Response) -> None:
+    if resp.is_success:
+        return
+    try:
+        err = resp.json()
+        detail = json.dumps(err, ensure_ascii=False)
+    except Exception:
+        detail = resp.text
+    raise ModelAPIError(
+        f"API error {resp.status_code}: {detail}",
+        resp.status_code,
+        _parse_retry_after(resp.headers.get("Retry-After")),
+    )
+
+
+def _estimate_tokens(payload: dict) -> int:
+    return token_utils.count_message_tokens(payload["messages"]) + payload["max_tokens"]
+
+
+def _report_tokens(
+    stage: str | None,
+    model: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    latency: float,
+    cost: float | None = None,
+) -> None:
+    name = stage or "other"
+    retries = (_call_retries.get() or [0])[0]
+    llm_metrics_service.incr(f"calls.{name}")
+    llm_metrics_service.incr(f"tokens.prompt.{name}", prompt_tokens)
+    llm_metrics_service.incr(f"tokens.completion.{name}", completion_tokens)
+    llm_usage_service.record(
+        stage, model, prompt_tokens, completion_tokens, latency, retries, cost
+    )
+    logging.info(
+        f"[LLM {name}] {model}: prompt={prompt_tokens} "
+        f"completion={completion_tokens} tokens, {latency:.2f}s, retries={retries}"
+    )
+
+
+def _is_retryable(e: Exception) -> bool:
+    if isinstance(e, ModelAPIError):
+        return e.retryable
+    return isinstance(e, (httpx.TimeoutException, httpx.TransportError))
+
+
+def _record_outcome(model: str, e: Exception) -> None:
+    # Ошибки запроса (4xx) не говорят о здоровье upstream — размыкаем только на сбоях
+    if _is_retryable(e):
+        circuit_breakers.record_failure(model)
+    else:
+        circuit_breakers.record_success(model)
+
+
+async def _retry_or_raise(
+    e: Exception, model: str, attempt: int, started: bool = False
+) -> None:
+    """Sleeps before the next attempt or re-raises if the error is final."""
+    if not _is_retryable(e) or started or attempt >= settings.LLM_MAX_RETRIES:
+        raise e
+    retry_after = getattr(e, "retry_after", None)
+    if retry_after is not None and retry_after > settings.LLM_BACKOFF_MAX:
+        # Долгую паузу не ждём: модель придерживаем, вызов уходит на следующую
+        llm_scheduler.block(model, settings.LLM_BACKOFF_MAX)
+        raise e
+    # Модель «сгорела» или общий бюджет повторов исчерпан — сразу failover
+    if not circuit_breakers.available(model) or not circuit_breakers.try_retry():
+        raise e
+    retries = _call_retries.get()
+    if retries is not None:
+        retries[0] += 1
+    if retry_after is not None:
+        # Пауза для всех вызовов этой модели: slot() дождётся её сам
+        llm_scheduler.block(model, retry_after)
+    else:
+        await asyncio.sleep(llm_scheduler.backoff(attempt))
+    logging.warning(f"LLM call to {model} failed ({e}), retry {attempt + 1}")
+
+
+async def _post(headers: dict, payload: dict, timeout: float) -> dict:
+    client = model_client.get_client()
+    resp = await client.post(
+        settings.OPENROUTER_API_URL,
+        headers=headers,
+        json=payload,
+        timeout=httpx.Timeout(timeout, connect=settings.LLM_CONNECT_TIMEOUT),
+    )
+    _raise_for_status(resp)
+    return resp.json()
+
+
+def _record(stage: str | None, payload: dict, resp: dict, latency: float) -> None:
+    """Appends a request/response pair to LLM_RECORD_PATH for replay by src.llm_stub."""
+    path = settings.LLM_RECORD_PATH
+    if path is None:
+        return
+    line = json.dumps(
+        {
+            "stage": stage,
+            "request": payload,
+            "response": resp,
+            "latency": round(latency, 3),
+        },
+        ensure_ascii=False,
     )
-    if not resp.ok:
+    try:
+        with _record_lock:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with path.open("a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    except OSError as e:
+        logging.warning(f"LLM recording to {path} failed: {e}")
+
+
+def _cache_key(payload: dict, stage: str | None, cache: bool | None) -> str | None:
+    if not llm_cache_service.enabled_for(stage, cache):
+        return None
+    return llm_cache_service.make_key(
+        payload["model"],
+        payload["messages"],
+        payload["temperature"],
+        payload["max_tokens"],
+        payload.get("response_format"),
+    )
+
+
+def _strip_unsupported(payload: dict) -> dict:
+    if payload["model"] in _structured_unsupported:
+        return {k: v for k, v in payload.items() if k != "response_format"}
+    return payload
+
+
+def _rejects_response_format(e: Exception, payload: dict) -> bool:
+    if not isinstance(e, ModelAPIError) or "response_format" not in payload:
+        return False
+    msg = str(e).lower()
+    return e.status_code in (400, 404, 422) and any(
+        m in msg for m in ("response_format", "json_schema", "structured")
+    )
+
+
+async def _call_with_retries(headers: dict, payload: dict, timeout: float) -> dict:
+    payload = _strip_unsupported(payload)
+    model, est_tokens = payload["model"], _estimate_tokens(payload)
+    circuit_breakers.record_request()
+    attempt = 0
+    while True:
+        if not circuit_breakers.allow(model):
+            raise CircuitOpenError(model)
         try:
-            err = resp.json()
-            raise RuntimeError(
-                f"API error {resp.status_code}: {json.dumps(err, ensure_ascii=False)}"
+            async with llm_scheduler.slot(model, est_tokens):
+                started = time.monotonic()
+                resp = await _post(headers, payload, timeout)
+            model_router.record_success(model, time.monotonic() - started)
+            circuit_breakers.record_success(model)
+            break
+        except asyncio.CancelledError:
+            # Отмена (ушёл клиент, проигравший хедж): запрос к провайдеру прерван
+            llm_metrics_service.incr("calls.cancelled")
+            circuit_breakers.release(model)
+            raise
+        except Exception as e:
+            _record_outcome(model, e)
+            if _rejects_response_format(e, payload):
+                logging.warning(f"{model}: structured output unsupported, disabling")
+                _structured_unsupported.add(model)
+                llm_metrics_service.incr("json.structured_unsupported")
+                payload = _strip_unsupported(payload)
+                continue
+            model_router.record_failure(model)
+            await _retry_or_raise(e, model, attempt)
+            attempt += 1
+    total = (resp.get("usage") or {}).get("total_tokens")
+    if isinstance(total, int):
+        llm_scheduler.report_usage(model, est_tokens, total)
+    return resp
+
+
+def _content_or_empty(resp: dict) -> str:
+    try:
+        return get_content(resp) or ""
+    except RuntimeError:
+        return ""
+
+
+def _is_valid(resp: dict) -> bool:
+    return bool(_content_or_empty(resp))
+
+
+async def _call_hedged(
+    headers: dict,
+    payload: dict,
+    timeout: float,
+    stage: str | None,
+    candidates: list[str],
+) -> dict:
+    """
+    Runs the call; if it is slower than the model's latency percentile and the
+    hedge budget allows, fires a duplicate and returns the first valid answer.
+    """
+    delay = model_router.hedge_delay(payload["model"], stage)
+    primary = asyncio.ensure_future(_call_with_retries(headers, payload, timeout))
+    if delay is None:
+        return await primary
+    pending = {primary}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done or not model_router.try_hedge():
+            return await primary
+        hedge_model = model_router.hedge_target(candidates)
+        logging.info(
+            f"LLM hedge: {payload['model']} > {delay:.1f}s, firing {hedge_model}"
+        )
+        hedge = asyncio.ensure_future(
+            _call_with_retries(headers, {**payload, "model": hedge_model}, timeout)
+        )
+        pending.add(hedge)
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
             )
-        except Exception:
-            raise RuntimeError(f"API error {resp.status_code}: {resp.text}")
-    return resp.json()
+            for task in done:
+                if task.cancelled() or task.exception() is not None:
+                    continue
+                if _is_valid(task.result()):
+                    if task is hedge:
+                        model_router.hedges_won += 1
+                    return task.result()
+        return primary.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def _execute(
+    headers: dict,
+    payload: dict,
+    timeout: float,
+    stage: str | None,
+    cache: bool | None = None,
+) -> dict:
+    key = _cache_key(payload, stage, cache)
+    if key is not None:
+        cached = llm_cache_service.get(key, stage)
+        if cached is not None:
+            llm_usage_service.record(stage, payload["model"], 0, 0, 0.0, cached=True)
+            return cached
+    candidates = model_router.route(stage, payload["model"])
+    model_router.record_call()
+    started = time.monotonic()
+    token = _call_retries.set([0])
+    try:
+        for i, model in enumerate(candidates):
+            try:
+                resp = await _call_hedged(
+                    headers,
+                    {**payload, "model": model},
+                    timeout,
+                    stage,
+                    candidates[i:],
+                )
+                break
+            except Exception as e:
+                if i == len(candidates) - 1:
+                    raise
+                logging.warning(f"LLM {model} failed ({e}), failing over")
+        usage = resp.get("usage") or {}
+        _report_tokens(
+            stage,
+            resp.get("model") or model,
+            usage.get("prompt_tokens")
+            or token_utils.count_message_tokens(payload["messages"]),
+            usage.get("completion_tokens")
+            or token_utils.count_tokens(_content_or_empty(resp)),
+            time.monotonic() - started,
+            usage.get("cost"),
+        )
+    finally:
+        _call_retries.reset(token)
+    _record(stage, payload, resp, time.monotonic() - started)
+    if key is not None:
+        llm_cache_service.set(key, resp)
+    return resp
+
+
+async def acall_model(
+    messages: list[dict],
+    api_key: str,
+    model: str = settings.DEFAULT_MODEL,
+    temperature: float = model_settings.GEN_TEMPERATURE,
+    max_tokens: int = 900,
+    timeout: float = settings.LLM_READ_TIMEOUT,
+    stage: ModelStage | None = None,
+    response_format: dict | None = None,
+    cache: bool | None = None,
+) -> dict:
+    headers, payload = _build_request(
+        messages, api_key, model, temperature, max_tokens, response_format
+    )
+    stage = ModelStage(stage).value if stage else None
+    return await model_client.run(
+        _execute(headers, payload, timeout, stage, cache)
+    )
+
+
+async def _stream(headers: dict, payload: dict, timeout: float) -> AsyncIterator[str]:
+    client = model_client.get_client()
+    async with client.stream(
+        "POST",
+        settings.OPENROUTER_API_URL,
+        headers=headers,
+        json=payload,
+        timeout=httpx.Timeout(timeout, connect=settings.LLM_CONNECT_TIMEOUT),
+    ) as resp:
+        if not resp.is_success:
+            await resp.aread()
+            _raise_for_status(resp)
+        async for line in resp.aiter_lines():
+            # SSE: "data: {...}"; строки-комментарии (": keep-alive") пропускаем
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            try:
+                chunk = json.loads(data)
+            except json.JSONDecodeError:
+                continue
+            if "error" in chunk:
+                error = json.dumps(chunk["error"], ensure_ascii=False)
+                raise RuntimeError(f"API stream error: {error}")
+            delta = get_delta(chunk)
+            if delta:
+                yield delta
+
+
+async def _stream_with_retries(
+    headers: dict, payload: dict, timeout: float
+) -> AsyncIterator[str]:
+    payload = _strip_unsupported(payload)
+    model, est_tokens = payload["model"], _estimate_tokens(payload)
+    parts: list[str] = []
+    circuit_breakers.record_request()
+    for attempt in range(settings.LLM_MAX_RETRIES + 1):
+        if not circuit_breakers.allow(model):
+            raise CircuitOpenError(model)
+        try:
+            async with llm_scheduler.slot(model, est_tokens):
+                started = time.monotonic()
+                async for delta in _stream(
+                    headers, {**payload, "stream": True}, timeout
+                ):
+                    if not parts:
+                        model_router.record_ttft(model, time.monotonic() - started)
+                    parts.append(delta)
+                    yield delta
+            model_router.record_success(model, time.monotonic() - started)
+            circuit_breakers.record_success(model)
+            break
+        except (asyncio.CancelledError, GeneratorExit):
+            llm_metrics_service.incr("calls.cancelled")
+            circuit_breakers.release(model)
+            raise
+        except Exception as e:
+            _record_outcome(model, e)
+            model_router.record_failure(model)
+            # После первого токена повтор невозможен: клиент уже получил текст
+            await _retry_or_raise(e, model, attempt, started=bool(parts))
+
+
+async def _stream_hedged(
+    headers: dict,
+    payload: dict,
+    timeout: float,
+    stage: str | None,
+    candidates: list[str],
+) -> AsyncIterator[str]:
+    """Stream variant of _call_hedged: races on time to first token."""
+    primary = _stream_with_retries(headers, payload, timeout)
+    delay = model_router.hedge_delay(payload["model"], stage, streaming=True)
+    if delay is None:
+        async for delta in primary:
+            yield delta
+        return
+
+    streams = {asyncio.ensure_future(anext(primary)): primary}
+    winner, first = None, None
+    try:
+        done, _ = await asyncio.wait(streams, timeout=delay)
+        if not done and model_router.try_hedge():
+            hedge_model = model_router.hedge_target(candidates)
+            logging.info(f"LLM hedge (stream): firing {hedge_model}")
+            hedge = _stream_with_retries(
+                headers, {**payload, "model": hedge_model}, timeout
+            )
+            streams[asyncio.ensure_future(anext(hedge))] = hedge
+        pending = set(streams)
+        while pending and winner is None:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.cancelled():
+                    continue
+                exc = task.exception()
+                if exc is None or isinstance(exc, StopAsyncIteration):
+                    winner = streams[task]
+                    first = task.result() if exc is None else None
+                    if winner is not primary:
+                        model_router.hedges_won += 1
+                    break
+        if winner is None:
+            # Все попытки упали: пробрасываем ошибку основного запроса
+            for task, stream in streams.items():
+                if stream is primary:
+                    task.result()
+    finally:
+        for task, stream in streams.items():
+            if stream is not winner:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await stream.aclose()
+
+    if first is not None:
+        yield first
+    async for delta in winner:
+        yield delta
+
+
+async def _execute_stream(
+    headers: dict,
+    payload: dict,
+    timeout: float,
+    stage: str | None,
+    cache: bool | None = None,
+) -> AsyncIterator[str]:
+    key = _cache_key(payload, stage, cache)
+    if key is not None:
+        cached = llm_cache_service.get(key, stage)
+        if cached is not None:
+            llm_usage_service.record(stage, payload["model"], 0, 0, 0.0, cached=True)
+            yield get_content(cached)
+            return
+    parts: list[str] = []
+    candidates = model_router.route(stage, payload["model"])
+    model_router.record_call()
+    started = time.monotonic()
+    # Без reset(): генератор может закрываться в чужом контексте
+    _call_retries.set([0])
+    for i, model in enumerate(candidates):
+        try:
+            async for delta in _stream_hedged(
+                headers, {**payload, "model": model}, timeout, stage, candidates[i:]
+            ):
+                parts.append(delta)
+                yield delta
+            break
+        except Exception as e:
+            if parts or i == len(candidates) - 1:
+                raise
+            logging.warning(f"LLM {model} stream failed ({e}), failing over")
+    _report_tokens(
+        stage,
+        model,
+        token_utils.count_message_tokens(payload["messages"]),
+        token_utils.count_tokens("".join(parts)),
+        time.monotonic() - started,
+    )
+    resp = {"choices": [{"message": {"content": "".join(parts)}}]}
+    _record(stage, payload, resp, time.monotonic() - started)
+    if key is not None:
+        llm_cache_service.set(key, resp)
+
+
+async def astream_model(
+    messages: list[dict],
+    api_key: str,
+    model: str = settings.DEFAULT_MODEL,
+    temperature: float = model_settings.GEN_TEMPERATURE,
+    max_tokens: int = 900,
+    timeout: float = settings.LLM_READ_TIMEOUT,
+    stage: ModelStage | None = None,
+    response_format: dict | None = None,
+    cache: bool | None = None,
+) -> AsyncIterator[str]:
+    """
+    Streams content deltas of a chat completion (stream: true).
+    cache=True/False overrides LLM_CACHE_STAGES for this call.
+    """
+    headers, payload = _build_request(
+        messages, api_key, model, temperature, max_tokens, response_format
+    )
+    stage = ModelStage(stage).value if stage else None
+    async for delta in model_client.stream(
+        _execute_stream(headers, payload, timeout, stage, cache)
+    ):
+        yield delta
+
+
+def call_model(
+    messages: list[dict],
+    api_key: str,
+    model: str = settings.DEFAULT_MODEL,
+    temperature: float = model_settings.GEN_TEMPERATURE,
+    max_tokens: int = 900,
+    timeout: float = settings.LLM_READ_TIMEOUT,
+    stage: ModelStage | None = None,
+    response_format: dict | None = None,
+    cache: bool | None = None,
+) -> dict:
+    """Synchronous shim over acall_model for legacy callers."""
+    return model_client.run_sync(
+        acall_model(
+            messages,
+            api_key,
+            model,
+            temperature,
+            max_tokens,
+            timeout,
+            stage,
+            response_format,
+            cache,
+        )
+    )
+
+
+@functools.lru_cache
+def json_schema_format(schema: type[BaseModel]) -> dict:
+    """response_format asking the provider for JSON matching a pydantic model."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": schema.__name__,
+            "strict": False,
+            "schema": schema.model_json_schema(),
+        },
+    }
+
+
+async def acall_json(
+    prompt: str,
+    api_key: str,
+    model: str = settings.DEFAULT_MODEL,
+    temperature: float = model_settings.GEN_TEMPERATURE,
+    max_tokens: int = 900,
+    stage: ModelStage | None = None,
+    schema: type[BaseModel] | None = None,
+    parse: Callable[[str], Any] = json_utils.extract_json_balanced,
+    retry_prompt: str = model_settings.JSON_ONLY_PROMPT,
+    cache: bool | None = None,
+) -> tuple[Any, str]:
+    """
+    Requests JSON (provider JSON mode when a schema is given) and parses it.
+    Falls back to one retry with retry_prompt only when parsing fails.
+    Returns (parsed or None, raw sanitized text).
+    """
+    response_format = json_schema_format(schema) if schema is not None else None
+    resp = await acall_model(
+        [{"role": "user", "content": prompt}],
+        api_key=api_key,
+        model=model,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stage=stage,
+        response_format=response_format,
+        cache=cache,
+    )
+    raw = text_utils.pre_sanitize(get_content(resp))
+    parsed = parse(raw)
+    stage_name = ModelStage(stage).value if stage else "other"
+    if parsed is not None:
+        llm_metrics_service.incr(f"json.first_try.{stage_name}")
+        return parsed, raw
+
+    llm_metrics_service.incr(f"json.retry.{stage_name}")
+    resp2 = await acall_model(
+        [{"role": "user", "content": retry_prompt + "\n\n" + prompt}],
+        api_key=api_key,
+        model=model,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stage=stage,
+        cache=cache,
+    )
+    raw2 = text_utils.pre_sanitize(get_content(resp2))
+    parsed = parse(raw2)
+    if parsed is None:
+        llm_metrics_service.incr(f"json.failed.{stage_name}")
+        return None, raw2 or raw
+    return parsed, raw2
+
+
+def call_json(prompt: str, api_key: str, **kwargs) -> tuple[Any, str]:
+    """Synchronous shim over acall_json."""
+    return model_client.run_sync(acall_json(prompt, api_key, **kwargs))
 
 
 def get_content(resp: dict) -> str:
@@ -47,6 +823,13 @@ def get_content(resp: dict) -> str:
         ) from e
 
 
+def get_delta(chunk: dict) -> str:
+    try:
+        return chunk["choices"][0].get("delta", {}).get("content") or ""
+    except (KeyError, IndexError, AttributeError):
+        return ""
+
+
 def get_api_key(explicit: str | None = None) -> str:
     key = (
         explicit or settings.OPENROUTER_API_KEY or settings.OPENAI_API_KEY or ""
@@ -20,3 +20,32 @@ def pre_sanitize(text: str) -> str:
     t = "".join(ch for ch in t if ch.isprintable() and ch not in bad)
     t = t.replace("\u200b", "").replace("\u200c", "").replace("\u200d", "")
     return t
+
+
+_SOURCE_MARKER = "<!-- source: {} -->"
+_SOURCE_RE = re.compile(r"^<!-- source: (.+?) -->\n", flags=re.MULTILINE)
+# Строки документа, похожие на маркер, экранируются обратным слешем (обратимо)
+_MARKER_LIKE_RE = re.compile(r"^(\\*)(?=<!-- source: )", flags=re.MULTILINE)
+_ESCAPED_MARKER_RE = re.compile(r"^\\(\\*)(?=<!-- source: )", flags=re.MULTILINE)
+
+
+def join_sources(documents: list[tuple[str, str]]) -> str:
+    """One context from several (source name, markdown) documents."""
+    return "\n\n".join(
+        f"{_SOURCE_MARKER.format(' '.join(name.split()))}\n"
+        + _MARKER_LIKE_RE.sub(r"\\\1", text.strip())
+        for name, text in documents
+    )
+
+
+def split_sources(context: str) -> list[tuple[str | None, str]]:
+    """Inverse of join_sources; text without a marker has source None."""
+    parts = _SOURCE_RE.split(context)
+    documents = [(None, parts[0])] if parts[0].strip() else []
+    documents += [(parts[i], parts[i + 1]) for i in range(1, len(parts), 2)]
+    return [(name, _ESCAPED_MARKER_RE.sub(r"\1", text)) for name, text in documents]
+
+
+def strip_sources(context: str) -> str:
+    """The documents of a context without source markers, as LLM prompt text."""
+    return "\n\n".join(text.strip() for _, text in split_sources(context))
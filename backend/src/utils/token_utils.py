@@ -0,0 +1,101 @@
+import logging
+import threading
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+from src.config import model_settings
+
+# Грубая оценка без токенизатора: для смеси кириллицы и латиницы ~3 символа на токен
+_CHARS_PER_TOKEN = 3
+
+_encoding = None
+_encoding_failed = False
+_encoding_lock = threading.Lock()
+# Отдельная блокировка: не ждать идущую загрузку, только запустить её
+_loader_lock = threading.Lock()
+_encoding_loader: threading.Thread | None = None
+
+
+def load_encoding():
+    """
+    Loads the tokenizer, downloading its BPE file unless TIKTOKEN_CACHE_DIR
+    already has it. Blocking: called by preload at startup, never on a loop.
+    """
+    global _encoding, _encoding_failed
+    with _encoding_lock:
+        if _encoding is None and not _encoding_failed and tiktoken is not None:
+            try:
+                _encoding = tiktoken.get_encoding(model_settings.TOKENIZER_ENCODING)
+            except Exception as e:
+                _encoding_failed = True
+                logging.warning(f"Tokenizer unavailable ({e}), using char estimate")
+    return _encoding
+
+
+def _get_encoding():
+    global _encoding_loader
+    if _encoding is None and not _encoding_failed and tiktoken is not None:
+        # Без preload не блокируем вызывающего: грузим в фоне, пока — оценка
+        with _loader_lock:
+            if _encoding_loader is None:
+                _encoding_loader = threading.Thread(
+                    target=load_encoding, name="tokenizer-load", daemon=True
+                )
+                _encoding_loader.start()
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    enc = _get_encoding()
+    if enc is None:
+        return max(1, len(text) // _CHARS_PER_TOKEN)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: list[dict]) -> int:
+    # +4 на служебные токены роли/разделителей каждого сообщения
+    return sum(count_tokens(str(m.get("content", ""))) + 4 for m in messages)
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    if not text or max_tokens <= 0:
+        return ""
+    enc = _get_encoding()
+    if enc is None:
+        return text[: max_tokens * _CHARS_PER_TOKEN]
+    tokens = enc.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return enc.decode(tokens[:max_tokens])
+
+
+def fit_chunks(
+    retrieved: list[dict],
+    budget: int,
+    per_chunk: int = model_settings.CHUNK_MAX_TOKENS,
+) -> list[tuple[dict, str]]:
+    """
+    Picks retrieved chunks by relevance (rerank_score, then score) until the
+    token budget is spent. Returns (chunk, trimmed text) in relevance order.
+    """
+    ranked = sorted(
+        retrieved,
+        key=lambda r: r.get("rerank_score", r.get("score", 0.0)) or 0.0,
+        reverse=True,
+    )
+    out = []
+    left = budget
+    for r in ranked:
+        if left <= 0:
+            break
+        text = truncate_tokens(str(r.get("text") or ""), min(per_chunk, left))
+        if not text:
+            continue
+        out.append((r, text))
+        left -= count_tokens(text)
+    return out
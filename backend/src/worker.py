@@ -0,0 +1,40 @@
+"""
+Generation job worker, scaled independently of the API:
+
+    JOB_BACKEND=postgres python -m src.worker --concurrency 4
+
+Run as many processes (on as many nodes) as needed: jobs are claimed from the
+shared queue with SKIP LOCKED, so each job runs exactly once.
+"""
+import argparse
+import asyncio
+import logging
+
+from src.config import settings
+from src.preload import preload_models
+from src.services.job_queue_service import job_queue
+from src.utils import model_api_utils
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Presentation generation worker")
+    parser.add_argument(
+        "--concurrency", type=int, default=settings.JOB_WORKER_CONCURRENCY
+    )
+    args = parser.parse_args()
+
+    if settings.JOB_BACKEND == "local":
+        logging.warning(
+            "JOB_BACKEND=local: this worker only sees jobs of its own process"
+        )
+    preload_models()
+    try:
+        asyncio.run(job_queue.run_worker(concurrency=args.concurrency))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        model_api_utils.model_client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import os
+import sys
+from pathlib import Path
+
+# Настройки читаются из окружения при импорте src.config: для тестов хватит
+# заглушек, к внешним сервисам тесты не обращаются
+_ENV = {
+    "OPENROUTER_API_KEY": "test",
+    "POSTGRES_USER": "test",
+    "POSTGRES_PASSWORD": "test",
+    "POSTGRES_DB": "test",
+    "POSTGRES_HOST": "localhost",
+    "SECRET_KEY": "test",
+    "GITHUB_CLIENT_ID": "test",
+    "GITHUB_CLIENT_SECRET": "test",
+    "GITHUB_REDIRECT_URI": "http://localhost",
+    "GOOGLE_CLIENT_ID": "test",
+    "GOOGLE_CLIENT_SECRET": "test",
+    "GOOGLE_REDIRECT_URI": "http://localhost",
+    "SMTP_HOST": "localhost",
+    "SMTP_PORT": "25",
+    "SMTP_USER": "test",
+    "SMTP_PASSWORD": "test",
+    "SMTP_FROM_EMAIL": "test@example.com",
+    "HF_HUB_OFFLINE": "1",
+    "TRANSFORMERS_OFFLINE": "1",
+}
+for key, value in _ENV.items():
+    os.environ.setdefault(key, value)
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,83 @@
+import pytest
+
+from src.config import settings
+from src.services.circuit_breaker_service import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    _CircuitBreakerService,
+)
+
+
+@pytest.fixture
+def breakers(monkeypatch) -> _CircuitBreakerService:
+    monkeypatch.setattr(settings, "LLM_BREAKER_FAILURE_THRESHOLD", 2)
+    monkeypatch.setattr(settings, "LLM_BREAKER_OPEN_SECONDS", 0.0)
+    return _CircuitBreakerService()
+
+
+def _state(breakers: _CircuitBreakerService, model: str) -> str:
+    return breakers.stats()["models"][model]["state"]
+
+
+def test_opens_after_threshold(breakers, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_BREAKER_OPEN_SECONDS", 60.0)
+    breakers.record_failure("m")
+    assert _state(breakers, "m") == CLOSED
+
+    breakers.record_failure("m")
+
+    assert _state(breakers, "m") == OPEN
+    assert not breakers.available("m")
+    assert not breakers.allow("m")
+
+
+def test_half_open_allows_single_probe(breakers):
+    breakers.record_failure("m")
+    breakers.record_failure("m")
+
+    assert breakers.allow("m")
+    assert _state(breakers, "m") == HALF_OPEN
+    assert not breakers.allow("m")
+
+
+def test_successful_probe_closes(breakers):
+    breakers.record_failure("m")
+    breakers.record_failure("m")
+    breakers.allow("m")
+
+    breakers.record_success("m")
+
+    assert _state(breakers, "m") == CLOSED
+    assert breakers.allow("m")
+
+
+def test_failed_probe_reopens(breakers):
+    breakers.record_failure("m")
+    breakers.record_failure("m")
+    breakers.allow("m")
+
+    breakers.record_failure("m")
+
+    assert _state(breakers, "m") == OPEN
+
+
+def test_cancelled_probe_frees_slot(breakers):
+    breakers.record_failure("m")
+    breakers.record_failure("m")
+    breakers.allow("m")
+
+    breakers.release("m")
+
+    assert breakers.allow("m")
+
+
+def test_retry_budget(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_RETRY_BUDGET_MIN", 2)
+    monkeypatch.setattr(settings, "LLM_RETRY_BUDGET_RATIO", 0.5)
+    breakers = _CircuitBreakerService()
+    for _ in range(6):
+        breakers.record_request()
+
+    assert [breakers.try_retry() for _ in range(4)] == [True, True, True, False]
+    assert breakers.stats()["retry_budget"]["denied"] == 1
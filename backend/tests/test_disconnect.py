@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+from src.routes.presentation_routes import _until_disconnected
+from src.utils import async_utils
+
+
+async def _endless(closed: list[str]):
+    try:
+        i = 0
+        while True:
+            yield i
+            i += 1
+            # Висит на «запросе к провайдеру», как медленный слайд
+            await asyncio.sleep(10 if i > 2 else 0)
+    except asyncio.CancelledError:
+        closed.append("cancelled")
+        raise
+
+
+def test_until_ends_with_source():
+    async def scenario():
+        stop = asyncio.Event()
+        source = async_utils.aiter_list([1, 2, 3])
+        return [item async for item in async_utils.until(source, stop.wait())]
+
+    assert asyncio.run(scenario()) == [1, 2, 3]
+
+
+def test_until_cancels_source_waiting_on_next_item():
+    closed: list[str] = []
+
+    async def scenario():
+        items = []
+        stop = asyncio.sleep(0.05)
+        async for item in async_utils.until(_endless(closed), stop):
+            items.append(item)
+        return items
+
+    assert asyncio.run(asyncio.wait_for(scenario(), 1)) == [0, 1, 2]
+    assert closed == ["cancelled"]
+
+
+def test_until_propagates_source_errors():
+    async def failing():
+        yield 1
+        raise ValueError("boom")
+
+    async def scenario():
+        stop = asyncio.Event()
+        return [item async for item in async_utils.until(failing(), stop.wait())]
+
+    with pytest.raises(ValueError):
+        asyncio.run(scenario())
+
+
+def test_client_disconnect_stops_stream():
+    closed: list[str] = []
+
+    async def receive():
+        await asyncio.sleep(0.05)
+        return {"type": "http.disconnect"}
+
+    async def scenario():
+        request = Request({"type": "http", "method": "POST", "headers": []}, receive)
+        return [item async for item in _until_disconnected(request, _endless(closed))]
+
+    assert asyncio.run(asyncio.wait_for(scenario(), 1)) == [0, 1, 2]
+    assert closed == ["cancelled"]
@@ -0,0 +1,19 @@
+from src.modules.models.rag.document_processor import DocumentProcessor
+
+
+def test_source_is_never_read_from_disk(tmp_path):
+    secret = tmp_path / "secret.pdf"
+    secret.write_text("server-side file")
+
+    chunks = DocumentProcessor().process_document("", {"source": str(secret)})
+
+    assert chunks == []
+
+
+def test_chunks_keep_source_for_attribution():
+    chunks = DocumentProcessor(chunk_size=2, chunk_overlap=0).process_document(
+        "one two three", {"doc_id": 0, "source": "a.pdf"}
+    )
+
+    assert [c["text"] for c in chunks] == ["one two", "three"]
+    assert chunks[0]["metadata"]["source"] == "a.pdf"
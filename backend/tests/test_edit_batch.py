@@ -0,0 +1,67 @@
+import asyncio
+import json
+
+from fastapi import FastAPI
+import httpx
+
+from src.auth.dependencies import get_current_user_id_optional
+from src.routes import presentation_routes
+from src.services import model_service
+
+
+class _FakePipeline:
+    async def aregenerate_slide(self, user_prompt, slide, action):
+        # Первый слайд правится дольше всех, второй падает
+        await asyncio.sleep(0.05 if slide["slide_id"] == 1 else 0.0)
+        if slide["slide_id"] == 2:
+            return None
+        return {**slide, "content": f"edited {slide['slide_id']}"}
+
+
+def _app(monkeypatch, pipe: _FakePipeline) -> FastAPI:
+    async def edit_pipeline(document_id, user_id):
+        return pipe, asyncio.sleep(0)
+
+    monkeypatch.setattr(model_service, "_edit_pipeline", edit_pipeline)
+    app = FastAPI()
+    app.include_router(presentation_routes.router)
+    app.dependency_overrides[get_current_user_id_optional] = lambda: None
+    return app
+
+
+async def _post(app: FastAPI, body: dict) -> httpx.Response:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.post("/presentation/edit/batch", json=body)
+
+
+def test_batch_edit_streams_ndjson_in_completion_order(monkeypatch):
+    app = _app(monkeypatch, _FakePipeline())
+    body = {
+        "action": "custom",
+        "text": "shorter",
+        "slides": [
+            {"slide_id": i, "title": f"Slide {i}", "content": "text"}
+            for i in (1, 2, 3)
+        ],
+    }
+
+    resp = asyncio.run(_post(app, body))
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    assert resp.headers["X-Request-ID"]
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert [line["slide_id"] for line in lines][-1] == 1
+    assert {"slide_id": 2, "error": "Ошибка сервера"} in lines
+    assert {"slide_id": 3, "content": "# edited 3\n"} in lines
+
+
+def test_batch_edit_rejects_empty_custom_prompt(monkeypatch):
+    app = _app(monkeypatch, _FakePipeline())
+    body = {
+        "action": "custom",
+        "slides": [{"slide_id": 1, "title": "Slide", "content": "text"}],
+    }
+
+    assert asyncio.run(_post(app, body)).status_code == 422
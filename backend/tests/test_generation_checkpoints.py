@@ -0,0 +1,169 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from src.schemas.job_schemas import GenerationCheckpoint, GenerationCheckpointSlide
+from src.services import generation_checkpoint_service, model_service
+from src.services.generation_checkpoint_service import (
+    _DatabaseCheckpointStore,
+    _GenerationCheckpointService,
+    _SqliteCheckpointStore,
+)
+from src.services.model_service import IntegratedPipeline
+
+
+def _start(checkpoints: _GenerationCheckpointService, generation_id: str = "g") -> None:
+    checkpoints.start(generation_id, 7, "prompt", "model", "context")
+
+
+def _slide(slide_id: int) -> dict:
+    return {"slide_id": slide_id, "title": f"Slide {slide_id}", "content": "text"}
+
+
+def test_slides_are_kept_sorted_and_deduplicated():
+    checkpoints = _GenerationCheckpointService(8, 60)
+    _start(checkpoints)
+
+    for slide_id in (3, 1, 3):
+        checkpoints.save_slide("g", _slide(slide_id))
+
+    assert [s["slide_id"] for s in checkpoints.get("g")["slides"]] == [1, 3]
+    summary = checkpoints.summary("g")
+    assert summary["slides_done"] == 2
+    assert "context" not in summary
+
+
+def test_expired_checkpoint_is_gone():
+    checkpoints = _GenerationCheckpointService(8, -1)
+    _start(checkpoints)
+
+    assert checkpoints.get("g") is None
+
+
+def test_oldest_checkpoint_is_evicted():
+    checkpoints = _GenerationCheckpointService(1, 60)
+    _start(checkpoints, "a")
+    _start(checkpoints, "b")
+
+    assert checkpoints.get("a") is None
+    assert checkpoints.get("b") is not None
+
+
+def test_sqlite_store_survives_restart(tmp_path):
+    path = tmp_path / "checkpoints.sqlite"
+    checkpoints = _GenerationCheckpointService(8, 60, _SqliteCheckpointStore(path))
+    _start(checkpoints)
+    checkpoints.save_slide("g", _slide(1))
+
+    restarted = _GenerationCheckpointService(8, 60, _SqliteCheckpointStore(path))
+
+    assert restarted.get("g")["slides"] == [_slide(1)]
+
+
+class _FakeGenerator:
+    generated: list[int] = []
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.generation_metadata = {}
+
+    async def astream_slides(self, specs, topic, ordered=True):
+        async for slide_id, title, _ in specs:
+            self.generated.append(slide_id)
+            yield {"type": "slide_started", "slide_id": slide_id, "title": title}
+            slide = _slide(slide_id)
+            yield {"type": "slide_done", "slide_id": slide_id, "slide": slide}
+
+
+@pytest.fixture
+def checkpoints(monkeypatch) -> _GenerationCheckpointService:
+    checkpoints = _GenerationCheckpointService(8, 60)
+    monkeypatch.setattr(model_service, "generation_checkpoints", checkpoints)
+    monkeypatch.setattr(model_service, "SlideContentGenerator", _FakeGenerator)
+    _FakeGenerator.generated = []
+    return checkpoints
+
+
+def test_resume_generates_only_missing_slides(checkpoints):
+    _start(checkpoints)
+    checkpoints.save_classification(
+        "g",
+        {
+            "label": "Experts",
+            "confidence": 0.9,
+            "rationale": "",
+            "suggested_actions": [],
+        },
+    )
+    checkpoints.save_outline(
+        "g",
+        [{"slide_id": i, "title": f"Slide {i}", "task": "t"} for i in (1, 2, 3)],
+    )
+    checkpoints.save_slide("g", _slide(1))
+    checkpoints.save_slide("g", _slide(3))
+    pipe = IntegratedPipeline.__new__(IntegratedPipeline)
+    pipe.api_key, pipe.llm_model, pipe.searcher = "key", "model", None
+
+    async def scenario():
+        return [e async for e in pipe.astream("prompt", generation_id="g")]
+
+    events = asyncio.run(scenario())
+
+    assert _FakeGenerator.generated == [2]
+    done = [e["slide_id"] for e in events if e["type"] == "slide_done"]
+    assert done == [1, 2, 3]
+    assert checkpoints.get("g")["status"] == "done"
+    assert len(checkpoints.get("g")["slides"]) == 3
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    # Общая база воркеров — здесь SQLite через тот же SQLAlchemy
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.sqlite'}")
+    monkeypatch.setattr(generation_checkpoint_service, "engine", engine)
+    monkeypatch.setattr(
+        generation_checkpoint_service, "SessionLocal", sessionmaker(bind=engine)
+    )
+    return engine
+
+
+def test_database_store_is_shared_between_processes(database):
+    api = _GenerationCheckpointService(8, 60, _DatabaseCheckpointStore())
+    worker = _GenerationCheckpointService(8, 60, _DatabaseCheckpointStore())
+    _start(api)
+    worker.save_outline("g", [{"slide_id": 1, "title": "Slide 1", "task": "t"}])
+    worker.save_slide("g", _slide(1))
+    worker.save_slide("g", _slide(1))
+
+    checkpoint = api.get("g")
+
+    assert checkpoint["context"] == "context"
+    assert checkpoint["outline"][0]["slide_id"] == 1
+    assert checkpoint["slides"] == [_slide(1)]
+
+
+def test_slides_are_appended_without_rewriting_context(database):
+    checkpoints = _GenerationCheckpointService(8, 60, _DatabaseCheckpointStore())
+    _start(checkpoints)
+    checkpoints.save_slide("g", _slide(2))
+    checkpoints.save_slide("g", _slide(1))
+
+    with Session(database) as db:
+        header = db.query(GenerationCheckpoint).one()
+        slides = db.query(GenerationCheckpointSlide).count()
+
+    assert "context" not in header.value and "slides" not in header.value
+    assert slides == 2
+    assert [s["slide_id"] for s in checkpoints.get("g")["slides"]] == [1, 2]
+
+
+def test_expired_checkpoints_are_purged_with_their_slides(database):
+    checkpoints = _GenerationCheckpointService(8, -1, _DatabaseCheckpointStore())
+    _start(checkpoints)
+    checkpoints.save_slide("g", _slide(1))
+
+    _GenerationCheckpointService(8, 60, _DatabaseCheckpointStore())
+
+    with Session(database) as db:
+        assert db.query(GenerationCheckpointSlide).count() == 0
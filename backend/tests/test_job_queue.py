@@ -0,0 +1,162 @@
+import asyncio
+
+import pytest
+
+from src.config import settings
+from src.services import job_queue_service
+from src.services.job_queue_service import (
+    CANCELLED,
+    DONE,
+    FAILED,
+    QUEUED,
+    RUNNING,
+    _JobQueueService,
+    _LocalJobBackend,
+)
+
+
+@pytest.fixture
+def backend() -> _LocalJobBackend:
+    backend = _LocalJobBackend()
+    backend.submit("job", None, {"prompt": "p", "context": "c", "model": "m"})
+    return backend
+
+
+def test_claim_takes_queued_job_once(backend):
+    job = backend.claim("w1")
+
+    assert job["status"] == RUNNING
+    assert job["worker"] == "w1"
+    assert job["attempts"] == 1
+    assert backend.claim("w2") is None
+
+
+def test_expired_lease_is_requeued(backend, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_LEASE_SECONDS", -1)
+    backend.claim("w1")
+
+    job = backend.claim("w2")
+
+    assert job["worker"] == "w2"
+    assert job["attempts"] == 2
+    # Первый воркер «завис»: его результат больше не принимается
+    assert not backend.heartbeat("job", "w1")
+    assert not backend.finish("job", "w1", DONE)
+
+
+def test_expired_lease_fails_after_max_attempts(backend, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_LEASE_SECONDS", -1)
+    monkeypatch.setattr(settings, "JOB_MAX_ATTEMPTS", 2)
+    backend.claim("w1")
+    backend.claim("w2")
+
+    assert backend.claim("w3") is None
+    assert backend.get("job")["status"] == FAILED
+
+
+def test_heartbeat_extends_lease(backend):
+    before = backend.claim("w1")["locked_until"]
+
+    assert backend.heartbeat("job", "w1")
+    assert backend.get("job")["locked_until"] >= before
+    assert not backend.heartbeat("job", "w2")
+
+
+def test_release_requeues_without_spending_attempt(backend):
+    backend.claim("w1")
+    backend.release("job", "w1")
+
+    job = backend.get("job")
+    assert job["status"] == QUEUED
+    assert job["attempts"] == 0
+    assert backend.claim("w2")["attempts"] == 1
+
+
+def test_cancel_queued_job_is_not_claimed(backend):
+    assert backend.cancel("job")
+    assert backend.claim("w1") is None
+    assert not backend.cancel("job")
+
+
+def test_finish_requires_ownership(backend):
+    backend.claim("w1")
+    backend.cancel("job")
+
+    assert not backend.finish("job", "w1", DONE)
+    assert backend.get("job")["status"] == CANCELLED
+
+
+def _fake_generation(slides: int, delay: float = 0.0):
+    async def astream_presentation(*args, **kwargs):
+        yield {
+            "type": "outline",
+            "slides": [{"slide_id": i} for i in range(1, slides + 1)],
+        }
+        for i in range(1, slides + 1):
+            await asyncio.sleep(delay)
+            slide = {"slide_id": i, "title": f"Slide {i}", "content": "text"}
+            yield {"type": "slide_done", "slide_id": i, "slide": slide}
+
+    return astream_presentation
+
+
+def test_worker_runs_job_to_completion(monkeypatch):
+    monkeypatch.setattr(
+        job_queue_service.model_service, "astream_presentation", _fake_generation(2)
+    )
+    service = _JobQueueService(_LocalJobBackend())
+
+    async def scenario():
+        job_id = service.submit_generation("p", "c", "m", None)
+        await service._run(service.backend.claim("w1"), "w1")
+        return job_id
+
+    job_id = asyncio.run(scenario())
+
+    job = service.get(job_id)
+    assert job["status"] == DONE
+    assert (job["slides_total"], job["slides_done"]) == (2, 2)
+
+
+def test_rerun_does_not_duplicate_recorded_events(monkeypatch):
+    monkeypatch.setattr(
+        job_queue_service.model_service, "astream_presentation", _fake_generation(2)
+    )
+    service = _JobQueueService(_LocalJobBackend())
+
+    async def scenario():
+        job_id = service.submit_generation("p", "c", "m", None)
+        service.backend.claim("w1")
+        service.backend.append_event(job_id, {"type": "outline", "slides": []})
+        service.backend.append_event(job_id, {"type": "slide", "slide_id": 1})
+        service.backend.release(job_id, "w1")
+        await service._run(service.backend.claim("w2"), "w2")
+        return job_id
+
+    job_id = asyncio.run(scenario())
+
+    types = [(e["type"], e.get("slide_id")) for e in service.events(job_id)]
+    assert types == [("outline", None), ("slide", 1), ("slide", 2)]
+
+
+def test_cancel_stops_running_job(monkeypatch):
+    monkeypatch.setattr(
+        job_queue_service.model_service,
+        "astream_presentation",
+        _fake_generation(5, delay=0.05),
+    )
+    service = _JobQueueService(_LocalJobBackend())
+
+    async def scenario():
+        job_id = service.submit_generation("p", "c", "m", None)
+        run = asyncio.create_task(service._run(service.backend.claim("w1"), "w1"))
+        await asyncio.sleep(0.07)
+        assert await service.cancel(job_id)
+        await run
+        return job_id
+
+    job_id = asyncio.run(scenario())
+
+    job = service.get(job_id)
+    assert job["status"] == CANCELLED
+    assert job["slides_done"] < 5
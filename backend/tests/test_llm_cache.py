@@ -0,0 +1,71 @@
+import time
+
+from src.config import settings
+from src.services.llm_cache_service import _LLMCacheService
+
+
+def _key(content: str) -> str:
+    messages = [{"role": "user", "content": content}]
+    return _LLMCacheService.make_key("model", messages, 0.0, 100)
+
+
+def test_default_stages_are_deterministic_only():
+    cache = _LLMCacheService(8, 60)
+
+    assert cache.enabled_for("classifier")
+    assert cache.enabled_for("planner")
+    assert not cache.enabled_for("slide")
+    assert not cache.enabled_for(None)
+
+
+def test_per_call_override(monkeypatch):
+    cache = _LLMCacheService(8, 60)
+
+    assert cache.enabled_for("slide", cache=True)
+    assert not cache.enabled_for("planner", cache=False)
+
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", False)
+    assert not cache.enabled_for("slide", cache=True)
+
+
+def test_key_depends_on_request_contents():
+    assert _key("a") == _key("a")
+    assert _key("a") != _key("b")
+
+
+def test_lru_evicts_oldest_entry():
+    cache = _LLMCacheService(2, 60)
+    cache.set("a", {"v": 1})
+    cache.set("b", {"v": 2})
+    cache.get("a", "planner")
+    cache.set("c", {"v": 3})
+
+    assert cache.get("a", "planner") == {"v": 1}
+    assert cache.get("b", "planner") is None
+    assert cache.stats()["stages"]["planner"] == {"hits": 2, "misses": 1}
+
+
+def test_expired_entries_are_misses():
+    cache = _LLMCacheService(8, -1)
+    cache.set("a", {"v": 1})
+
+    assert cache.get("a", "planner") is None
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = tmp_path / "llm.sqlite"
+    _LLMCacheService(8, 60, path).set("a", {"v": 1})
+
+    restarted = _LLMCacheService(8, 60, path)
+
+    assert restarted.get("a", "planner") == {"v": 1}
+    restarted.clear()
+    assert _LLMCacheService(8, 60, path).get("a", "planner") is None
+
+
+def test_expired_disk_entries_are_purged(tmp_path):
+    path = tmp_path / "llm.sqlite"
+    _LLMCacheService(8, -1, path).set("a", {"v": 1})
+    time.sleep(0.01)
+
+    assert _LLMCacheService(8, 60, path).get("a", "planner") is None
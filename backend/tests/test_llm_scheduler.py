@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+import pytest
+
+from src.config import settings
+from src.services.llm_scheduler_service import _LLMScheduler, _TokenBucket
+from src.utils import model_api_utils
+from src.utils.model_api_utils import ModelAPIError
+
+
+def test_token_bucket_delays_when_empty():
+    bucket = _TokenBucket(60)
+    bucket.take(60)
+
+    assert bucket.delay_for(1) == pytest.approx(1.0, abs=0.05)
+    assert _TokenBucket(0).delay_for(10**6) == 0.0
+
+
+def test_slot_limits_concurrency(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MODEL_LIMITS", {"m": {"concurrency": 2}})
+    scheduler = _LLMScheduler()
+    peak = 0
+
+    async def call():
+        nonlocal peak
+        async with scheduler.slot("m", 10):
+            peak = max(peak, scheduler.stats()["m"]["in_flight"])
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        await asyncio.gather(*(call() for _ in range(6)))
+
+    asyncio.run(scenario())
+
+    assert peak == 2
+    assert scheduler.stats()["m"]["in_flight"] == 0
+
+
+def test_slot_admits_in_arrival_order():
+    scheduler = _LLMScheduler()
+    order = []
+
+    async def call(i):
+        async with scheduler.slot("m", 10):
+            order.append(i)
+
+    async def scenario():
+        scheduler.block("m", 0.05)
+        await asyncio.gather(*(call(i) for i in range(5)))
+
+    asyncio.run(scenario())
+
+    assert order == list(range(5))
+
+
+def test_block_pauses_model():
+    scheduler = _LLMScheduler()
+
+    async def scenario():
+        scheduler.block("m", 0.1)
+        started = time.monotonic()
+        async with scheduler.slot("m", 10):
+            return time.monotonic() - started
+
+    assert asyncio.run(scenario()) >= 0.09
+
+
+def test_backoff_is_capped(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_BACKOFF_MAX", 2.0)
+    scheduler = _LLMScheduler()
+
+    assert all(0 <= scheduler.backoff(10) <= 2.0 for _ in range(100))
+
+
+def test_long_retry_after_fails_over(monkeypatch):
+    scheduler = _LLMScheduler()
+    monkeypatch.setattr(model_api_utils, "llm_scheduler", scheduler)
+    monkeypatch.setattr(settings, "LLM_BACKOFF_MAX", 5.0)
+    error = ModelAPIError("rate limited", 429, retry_after=3600)
+
+    with pytest.raises(ModelAPIError):
+        asyncio.run(model_api_utils._retry_or_raise(error, "m", 0))
+
+    # Модель придержана не дольше LLM_BACKOFF_MAX, а не на час
+    assert 0 < scheduler.stats()["m"]["paused_for"] <= 5.0
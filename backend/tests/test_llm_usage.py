@@ -0,0 +1,25 @@
+import asyncio
+
+from src.services.llm_usage_service import llm_usage_service
+
+
+def test_run_metadata_is_kept_per_request():
+    async def run(request_id: str, user_id: int) -> None:
+        with llm_usage_service.scope(request_id, user_id):
+            await asyncio.sleep(0.01 if request_id == "meta-a" else 0)
+            llm_usage_service.record_metadata({"slides": request_id})
+
+    async def scenario():
+        await asyncio.gather(run("meta-a", 1), run("meta-b", 2))
+
+    asyncio.run(scenario())
+
+    assert llm_usage_service.get_request("meta-a")["metadata"] == {"slides": "meta-a"}
+    assert llm_usage_service.get_request("meta-b")["metadata"] == {"slides": "meta-b"}
+    assert "metadata" not in llm_usage_service.get_user(1)["requests"][0]
+
+
+def test_metadata_outside_a_request_is_dropped():
+    llm_usage_service.record_metadata({"slides": "nobody"})
+
+    assert llm_usage_service.get_request("nobody") is None
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from src.config import model_settings, settings
+from src.services.circuit_breaker_service import _CircuitBreakerService
+from src.services.llm_scheduler_service import _LLMScheduler
+from src.services.model_router_service import _ModelRouter
+from src.utils import model_api_utils
+from src.utils.model_api_utils import ModelAPIError
+
+
+@pytest.fixture
+def router(monkeypatch) -> _ModelRouter:
+    monkeypatch.setattr(type(settings), "DEFAULT_MODEL_VALUES", ["a", "b", "c"])
+    monkeypatch.setattr(model_settings, "STAGE_MODEL_POLICIES", {"fast": ["a", "b"]})
+    monkeypatch.setattr(
+        "src.services.model_router_service.circuit_breakers", _CircuitBreakerService()
+    )
+    return _ModelRouter()
+
+
+def test_preferred_model_first_then_fastest_fallbacks(router):
+    router.record_success("b", 5.0)
+    router.record_success("c", 1.0)
+
+    assert router.route(None, "a") == ["a", "c", "b"]
+
+
+def test_stage_policy_routes_by_latency(router):
+    router.record_success("a", 3.0)
+    router.record_success("b", 1.0)
+
+    assert router.route("fast", "c") == ["b", "a"]
+
+
+def test_failing_model_is_routed_last(router):
+    for _ in range(3):
+        router.record_failure("a")
+
+    assert not router.healthy("a")
+    assert router.route(None, "a")[-1] == "a"
+
+
+def test_routing_disabled_keeps_requested_model(router, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_ROUTING_ENABLED", False)
+
+    assert router.route(None, "a") == ["a"]
+
+
+def test_execute_fails_over_to_next_model(router, monkeypatch):
+    monkeypatch.setattr(model_api_utils, "model_router", router)
+    monkeypatch.setattr(model_api_utils, "circuit_breakers", _CircuitBreakerService())
+    monkeypatch.setattr(model_api_utils, "llm_scheduler", _LLMScheduler())
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 0)
+    called = []
+
+    async def post(headers, payload, timeout):
+        called.append(payload["model"])
+        if payload["model"] == "a":
+            raise ModelAPIError("upstream down", 503)
+        return {"model": payload["model"], "choices": [{"message": {"content": "ok"}}]}
+
+    monkeypatch.setattr(model_api_utils, "_post", post)
+    payload = {
+        "model": "a",
+        "messages": [{"role": "user", "content": "hi"}],
+        "temperature": 0.0,
+        "max_tokens": 10,
+    }
+
+    resp = asyncio.run(model_api_utils._execute({}, payload, 10, None))
+
+    assert called[0] == "a"
+    assert resp["model"] == called[-1] != "a"
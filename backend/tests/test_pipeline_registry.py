@@ -0,0 +1,53 @@
+import asyncio
+from types import SimpleNamespace
+
+from src.services.pipeline_registry_service import _PipelineRegistry
+
+
+class _FakePipeline:
+    def __init__(self) -> None:
+        client = SimpleNamespace(
+            get_collection=lambda name: SimpleNamespace(points_count=1)
+        )
+        self.vector_db = SimpleNamespace(
+            client=client, collection_name="c", vector_size=4
+        )
+
+    def with_model(self, model: str) -> "_FakePipeline":
+        return self
+
+    async def aload_context(self, document: str) -> None:
+        pass
+
+
+def test_edit_lookup_requires_ownership():
+    registry = _PipelineRegistry(8, 60, 64)
+
+    async def scenario():
+        pipe, ready = await registry.acquire("doc", "m", _FakePipeline, user_id=1)
+        await ready
+        document_id = registry.document_id("doc")
+        own = await registry.get(document_id, "m", 1)
+        foreign = await registry.get(document_id, "m", 2)
+        anonymous = await registry.get(document_id, "m", None)
+        return pipe, own, foreign, anonymous
+
+    pipe, own, foreign, anonymous = asyncio.run(scenario())
+
+    assert own[0] is pipe
+    assert foreign is None
+    assert anonymous is None
+
+
+def test_stats_do_not_expose_document_ids():
+    registry = _PipelineRegistry(8, 60, 64)
+
+    async def scenario():
+        _, ready = await registry.acquire("doc", "m", _FakePipeline, user_id=1)
+        await ready
+
+    asyncio.run(scenario())
+
+    stats = registry.stats()
+    assert stats["entries"] == 1
+    assert registry.document_id("doc") not in str(stats)
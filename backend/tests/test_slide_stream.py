@@ -0,0 +1,97 @@
+import asyncio
+
+from src.modules.models import SlideContentGenerator
+from src.modules.models import slide_content_generator
+from src.services.generation_checkpoint_service import generation_checkpoints
+from src.services.model_service import IntegratedPipeline, to_markdown
+
+
+def _stream(chunks: list[str], error: Exception | None = None):
+    async def astream_model(*args, **kwargs):
+        for chunk in chunks:
+            yield chunk
+        if error is not None:
+            raise error
+
+    return astream_model
+
+
+def _slide_events(monkeypatch, chunks, error=None) -> list[dict]:
+    monkeypatch.setattr(
+        slide_content_generator.model_api_utils,
+        "astream_model",
+        _stream(chunks, error),
+    )
+    gen = SlideContentGenerator("key", searcher=None)
+
+    async def no_charts(*args, **kwargs):
+        return []
+
+    gen.agenerate_charts_with_llm = no_charts
+
+    async def scenario():
+        return [
+            event
+            async for event in gen.astream_slide_content(
+                1, "Итоги", "task", "topic", retrieved=[]
+            )
+        ]
+
+    return asyncio.run(scenario())
+
+
+def test_interrupted_stream_fails_the_slide(monkeypatch):
+    events = _slide_events(
+        monkeypatch, ['{"slide_id": 1, "content": "Нача', "ло"], ConnectionError()
+    )
+
+    types = [e["type"] for e in events]
+    assert "slide_token" in types
+    assert types[-1] == "slide_failed"
+    assert "slide_done" not in types
+
+
+def test_complete_content_with_broken_tail_is_kept(monkeypatch):
+    events = _slide_events(
+        monkeypatch, ['{"slide_id": 1, "content": "Текст", "used_fa'], ConnectionError()
+    )
+
+    assert events[-1]["type"] == "slide_done"
+    assert events[-1]["slide"]["content"] == "Текст"
+
+
+def test_failed_slide_is_not_checkpointed(monkeypatch):
+    outline = [{"slide_id": 1, "title": "Итоги", "task": "task"}]
+    generation_checkpoints.start("g-failed", 7, "prompt", "model", "context")
+    generation_checkpoints.save_classification(
+        "g-failed",
+        {
+            "label": "Experts",
+            "confidence": 1.0,
+            "rationale": "",
+            "suggested_actions": [],
+        },
+    )
+    generation_checkpoints.save_outline("g-failed", outline)
+
+    async def astream_slides(self, specs, topic, ordered=True):
+        async for sid, title, _ in specs:
+            yield {"type": "slide_started", "slide_id": sid, "title": title}
+            yield {"type": "slide_token", "slide_id": sid, "text": "Нача"}
+            yield {"type": "slide_failed", "slide_id": sid, "error": "cut"}
+
+    monkeypatch.setattr(SlideContentGenerator, "astream_slides", astream_slides)
+    pipe = IntegratedPipeline.__new__(IntegratedPipeline)
+    pipe.api_key, pipe.searcher, pipe.llm_model = "key", None, "model"
+    monkeypatch.setattr(pipe, "_store_run_metadata", lambda *args: None)
+
+    async def scenario():
+        events = pipe.astream("prompt", generation_id="g-failed")
+        return "".join([chunk async for chunk in to_markdown(events)])
+
+    markdown = asyncio.run(scenario())
+    saved = generation_checkpoints.get("g-failed")
+
+    assert markdown == "# Итоги\n\nНача\n\n"
+    assert saved["slides"] == []
+    assert saved["status"] == "failed"
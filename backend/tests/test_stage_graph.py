@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+from src.modules.models import SlideContentGenerator
+from src.modules.pipeline import Stage, StageCache, StageGraph
+from src.services.model_service import IntegratedPipeline
+
+
+def _graph(calls: list[str]) -> StageGraph:
+    def stage(name: str):
+        async def fn(**inputs):
+            calls.append(name)
+            await asyncio.sleep(0.01)
+            return f"{name}({','.join(str(v) for v in inputs.values())})"
+
+        return fn
+
+    return StageGraph(
+        [
+            Stage("a", stage("a"), ("x",)),
+            Stage("b", stage("b"), ("x",)),
+            Stage("c", stage("c"), ("a", "b")),
+        ],
+        StageCache(16),
+    )
+
+
+def test_stages_are_memoized_by_inputs():
+    calls: list[str] = []
+    graph = _graph(calls)
+
+    first = asyncio.run(graph.run({"x": 1}))
+    second = asyncio.run(graph.run({"x": 1}))
+    asyncio.run(graph.run({"x": 2}))
+
+    assert first["c"] == second["c"] == "c(a(1),b(1))"
+    assert all(t["cached"] for t in second.timings.values())
+    assert sorted(calls) == sorted(["a", "b", "c"] * 2)
+
+
+def test_forced_stage_recomputes_and_downstream_reuses_equal_result():
+    calls: list[str] = []
+    graph = _graph(calls)
+    asyncio.run(graph.run({"x": 1}))
+    calls.clear()
+
+    run = asyncio.run(graph.run({"x": 1}, force=("a",)))
+
+    assert calls == ["a"]
+    assert run.timings["c"]["cached"]
+
+
+def test_targets_run_only_needed_stages():
+    calls: list[str] = []
+
+    asyncio.run(_graph(calls).run({"x": 1}, targets=("a",)))
+
+    assert calls == ["a"]
+
+
+def test_prime_seeds_known_outputs():
+    calls: list[str] = []
+    graph = _graph(calls)
+    graph.prime("a", {"x": 1}, {"a": "known"})
+
+    run = asyncio.run(graph.run({"x": 1}))
+
+    assert run["c"] == "c(known,b(1))"
+    assert "a" not in calls
+
+
+def test_cycles_are_rejected():
+    with pytest.raises(ValueError):
+        StageGraph(
+            [Stage("a", lambda b: b, ("b",)), Stage("b", lambda a: a, ("a",))],
+            StageCache(4),
+        )
+
+
+class _FakeSearcher:
+    def __init__(self) -> None:
+        self.searches = 0
+
+    def search_raw_many(self, queries, top_k=30):
+        self.searches += 1
+        return [[{"text": q}] for q in queries]
+
+    def rerank_many(self, queries, candidates, limit=10):
+        return candidates
+
+
+def test_regenerating_slides_reuses_checkpointed_plan(monkeypatch):
+    async def not_called(*args, **kwargs):
+        raise AssertionError("classifier and planner come from the checkpoint")
+
+    generated: list[int] = []
+
+    async def slide_json(self, slide_id, title, task, topic, retrieved):
+        generated.append(slide_id)
+        return {"slide_id": slide_id, "title": title, "content": "new"}
+
+    async def no_charts(self, *args, **kwargs):
+        return []
+
+    monkeypatch.setattr(SlideContentGenerator, "agenerate_slide_json", slide_json)
+    monkeypatch.setattr(SlideContentGenerator, "agenerate_charts_with_llm", no_charts)
+    pipe = IntegratedPipeline.__new__(IntegratedPipeline)
+    pipe.api_key, pipe.llm_model, pipe.searcher = "key", "model", _FakeSearcher()
+    monkeypatch.setattr(pipe, "arun_classifier", not_called, raising=False)
+    monkeypatch.setattr(pipe, "arun_planner", not_called, raising=False)
+    checkpoint = {
+        "classification": {"label": "Experts"},
+        "outline": [{"slide_id": i, "title": f"S{i}", "task": "t"} for i in (1, 2)],
+    }
+
+    async def scenario():
+        for _ in range(2):
+            run = await pipe.arun_stages(
+                "prompt",
+                "context",
+                force=("content", "charts"),
+                checkpoint=checkpoint,
+            )
+        return run
+
+    run = asyncio.run(scenario())
+
+    assert [s["content"] for s in run["slides"]] == ["new", "new"]
+    assert generated == [1, 2, 1, 2]
+    # Поиск по документу выполнен один раз: повторный прогон берёт его из кеша
+    assert pipe.searcher.searches == 1
+    assert run.timings["retrieve"]["cached"]
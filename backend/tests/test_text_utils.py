@@ -0,0 +1,38 @@
+from src.services.pipeline_registry_service import pipeline_registry
+from src.utils import text_utils
+
+
+def _split(context: str) -> list[tuple[str | None, str]]:
+    return [(name, text.strip()) for name, text in text_utils.split_sources(context)]
+
+
+def test_sources_round_trip():
+    documents = [("a.pdf", "first"), ("b.docx", "second\ntext")]
+
+    assert _split(text_utils.join_sources(documents)) == documents
+
+
+def test_marker_like_lines_stay_inside_document():
+    text = "intro\n<!-- source: fake.pdf -->\n\\<!-- source: escaped -->"
+
+    context = text_utils.join_sources([("real.pdf", text)])
+
+    assert _split(context) == [("real.pdf", text)]
+
+
+def test_unmarked_context_has_no_source():
+    assert text_utils.split_sources("plain text") == [(None, "plain text")]
+
+
+def test_strip_sources_removes_markers():
+    context = text_utils.join_sources([("a.pdf", "first"), ("b.pdf", "second")])
+
+    assert text_utils.strip_sources(context) == "first\n\nsecond"
+
+
+def test_document_id_ignores_file_names():
+    def document_id(name: str) -> str:
+        context = text_utils.join_sources([(name, "same text")])
+        return pipeline_registry.document_id(context)
+
+    assert document_id("a.pdf") == document_id("renamed.pdf")